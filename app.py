@@ -17,7 +17,6 @@ if not MISTRAL_API_KEY:
 # Add backend directory to path so imports work
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 import time
-import requests
 import os
 import plotly.graph_objects as go
 import plotly.express as px
@@ -25,9 +24,11 @@ from datetime import datetime
 import pandas as pd
 
 # DB & Services
-from backend.database import init_db, login_user, register_user, update_profile
+from backend.database import init_db, login_user, register_user, update_profile, AuthBusyError
 from backend.services.wearable_service import get_wearable_data
-from backend.services.weather_service import get_weather_and_aqi, get_coordinates, get_weather_forecast
+from backend.services.vitals_store import hourly_series, hourly_increments
+from backend.services.feature_engine import get_feature_engine, observe_reading
+from backend.services.weather_service import get_weather_and_aqi, get_coordinates, get_weather_forecast, suggest_locations
 from backend.services.weather_health_rules import weather_health_rules
 from backend.services.ml_diabetes import predict_diabetes
 from backend.services.ml_heart import predict_heart
@@ -37,6 +38,8 @@ from backend.services.ml_sleep import predict_sleep_quality
 from backend.services.analysis_service import run_holistic_checkup
 from backend.config.defaults import DIABETES_DEFAULTS, HEART_DEFAULTS, STROKE_DEFAULTS
 from backend.rag.rag_service import rag_search
+from backend.rag.response_cache import chat_fingerprint, get_response_cache
+from backend.services.llm_client import LLMError, chat_completion, stream_completion
 
 
 # Init DB
@@ -421,21 +424,16 @@ def generate_workout_plan(weather, vitals, profile, risks=None, wellness=None):
     
     # 4. Call LLM
     try:
-        resp = requests.post(
-            "https://api.mistral.ai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {MISTRAL_API_KEY}"},
-            json={
-                "model": "mistral-tiny", 
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json_object"}
-            }
+        content = chat_completion(
+            [{"role": "user", "content": prompt}],
+            api_key=MISTRAL_API_KEY,
+            response_format={"type": "json_object"}
         )
-        if resp.status_code == 200:
-            import json
-            return json.loads(resp.json()['choices'][0]['message']['content'])
-        else:
-            print(f"LLM Error: {resp.text}")
-            return _get_fallback_plan(w_cond, steps) # Fallback
+        import json
+        return json.loads(content)
+    except LLMError as e:
+        print(f"LLM Error: {e}")
+        return _get_fallback_plan(w_cond, steps) # Fallback
     except Exception as e:
         print(f"Generation Error: {e}")
         return _get_fallback_plan(w_cond, steps)
@@ -457,6 +455,23 @@ def _get_fallback_plan(w_cond, steps):
     }
     return plan
 
+def render_stream(deltas, min_interval_s=0.05):
+    """
+    Renders streamed LLM tokens into one placeholder as they arrive
+    (redraws at most every min_interval_s) and returns the full text.
+    """
+    placeholder = st.empty()
+    text = ""
+    last_draw = 0.0
+    for delta in deltas:
+        text += delta
+        now = time.perf_counter()
+        if now - last_draw >= min_interval_s:
+            placeholder.markdown(text + "▌")
+            last_draw = now
+    placeholder.markdown(text)
+    return text
+
 
 def get_unified_wellness_inputs(profile, form_inputs, device_connected):
     """
@@ -470,6 +485,10 @@ def get_unified_wellness_inputs(profile, form_inputs, device_connected):
     w_data = {}
     if device_connected:
         w_data = get_wearable_data()
+        observe_reading(st.session_state.username, w_data)
+
+        # Rolling features (7-day averages, baselines, deviations) beat remembered values
+        inputs.update(get_feature_engine().observed(st.session_state.username))
         
         # --- SMART OVERRIDES ---
         # Sleep: Watch is more accurate than user memory
@@ -561,13 +580,17 @@ def login_page():
                 
                 st.markdown("<br>", unsafe_allow_html=True)
                 if st.form_submit_button("Login", type="primary"):
-                    success, profile = login_user(u, p)
+                    try:
+                        success, profile = login_user(u, p)
+                    except AuthBusyError as e:
+                        success, profile = None, None
+                        st.warning(str(e))
                     if success:
                         st.session_state.auth_status = 'logged_in'
                         st.session_state.username = u
                         st.session_state.user_profile = profile
                         st.rerun()
-                    else: st.error("Access Denied")
+                    elif success is False: st.error("Access Denied")
             
             st.markdown("<div class='form-footer'>Don't have an account? Sign Up</div>", unsafe_allow_html=True)
 
@@ -581,7 +604,10 @@ def login_page():
                 st.markdown("<br>", unsafe_allow_html=True)
                 if st.form_submit_button("Sign Up", type="primary"):
                     if new_u and new_p:
-                        success, msg = register_user(new_u, new_p)
+                        try:
+                            success, msg = register_user(new_u, new_p)
+                        except AuthBusyError as e:
+                            success, msg = False, str(e)
                         if success: st.success("Account created! Go to Login.")
                         else: st.error(msg)
                     else: st.warning("Fields required")
@@ -638,6 +664,7 @@ def main_app():
         else:
              if st.button("🔄 Sync Now", key="refresh_dash"): st.rerun()
              w = get_wearable_data()
+             observe_reading(st.session_state.username, w)
              
              # --- STYLE: CARD UI ---
              def render_card(title, value, unit, icon, color="#00f2fe"):
@@ -706,12 +733,14 @@ def main_app():
              t1_col, t2_col = st.columns(2)
              
              with t1_col:
-                 # HR Line Chart
+                 # HR Line Chart (today's stored hourly averages; simulated history until there is data)
                  hist_time = w['history']['time']
-                 hist_hr = w['history']['heart_rate']
+                 hist_hr = hourly_series(st.session_state.username, "heart_rate")
+                 if not any(v is not None for v in hist_hr):
+                     hist_hr = w['history']['heart_rate']
                  
                  fig = go.Figure()
-                 fig.add_trace(go.Scatter(x=hist_time, y=hist_hr, mode='lines+markers', line=dict(color='#ef4444', width=3), name='HR'))
+                 fig.add_trace(go.Scatter(x=hist_time, y=hist_hr, mode='lines+markers', line=dict(color='#ef4444', width=3), name='HR', connectgaps=True))
                  fig.update_layout(
                      title={'text': "Heart Rate Trend", 'font': {'color': '#fff', 'size': 14}},
                      height=250,
@@ -725,7 +754,9 @@ def main_app():
 
              with t2_col:
                  # Steps Bar Chart
-                 hist_steps = w['history']['steps']
+                 hist_steps = hourly_increments(st.session_state.username, "steps")
+                 if not any(v is not None for v in hist_steps):
+                     hist_steps = w['history']['steps']
                  fig = go.Figure()
                  fig.add_trace(go.Bar(x=hist_time, y=hist_steps, marker_color='#fb923c', name='Steps'))
                  fig.update_layout(
@@ -745,6 +776,9 @@ def main_app():
         col_search, col_loc_info = st.columns([3, 1])
         with col_search:
             new_loc_input = st.text_input("Search Location", st.session_state.weather_loc, label_visibility="collapsed", placeholder="Enter City Name...")
+            known = suggest_locations(new_loc_input, limit=5) if new_loc_input != st.session_state.weather_loc else []
+            if known:
+                st.caption("Known places: " + " · ".join(f"{p['name']}, {p['country']}" if p['country'] else p['name'] for p in known))
         with col_loc_info:
             if st.button("Update Weather", use_container_width=True):
                 st.session_state.weather_loc = new_loc_input
@@ -946,18 +980,14 @@ def main_app():
                         pressure_map = {"No": 30, "Sometimes": 50, "Yes": 80}
                         pressure_val = pressure_map[wake_tired]
                         
-                        # Form-Based Wellness Inputs
+                        # Form-Based Wellness Inputs (HRV / SpO2 / baselines come from the
+                        # user's rolling features, or the defaults without any readings)
                         manual_inputs = {
-                            "hrv_7d_avg": 45,  # Default fallback
                             "sleep_7d_avg": sleep_hrs, 
                             "sleep_pressure": pressure_val, 
                             "stress_score": stress_val, 
                             "activity_load": act_val, 
-                            "baseline_hrv": 50, 
-                            "hrv_deviation": 0,
-                            "sleep_duration_hours": sleep_hrs, 
-                            "hrv_rmssd_ms": 45, 
-                            "spo2_avg_pct": 98
+                            "sleep_duration_hours": sleep_hrs
                         }
                         
                         # Smart Fusion: Overlay wearable data if device connected
@@ -979,14 +1009,16 @@ def main_app():
                         
                         # --- RUN HOLISTIC CHECKUP ---
                         # This replaces the duplicate ML prediction code (lines 863-911)
-                        risks, wellness = run_holistic_checkup(new_prof, unified_inputs)
+                        risks, wellness = run_holistic_checkup(new_prof, unified_inputs, parallel=True, username=st.session_state.username)
                         
                         # Update profile with analysis results
                         new_prof['risks'] = risks
                         new_prof['wellness'] = wellness
                         
-                        # Save to DB and Session
-                        update_profile(st.session_state.username, new_prof)
+                        # Save to DB (only the fields this form sets) and Session
+                        update_profile(st.session_state.username, {
+                            k: new_prof[k] for k in ("age", "weight", "height", "gender", "bmi", "risks", "wellness")
+                        })
 
                         st.session_state.user_profile = new_prof
 
@@ -1167,6 +1199,7 @@ def main_app():
     # --- TAB 4: AI DOCTOR (WEATHER AWARE) ---
     with t4:
         st.header("Chat with Dr. AI")
+        st.checkbox("Fresh answer (skip response cache)", key="chat_no_cache")
         for m in st.session_state.chat_history:
             with st.chat_message(m["role"]): st.markdown(m["content"])
         
@@ -1178,10 +1211,12 @@ def main_app():
                 try:
                     # 1. Weather Context
                     w_ctx = ""
+                    w_now = None
                     try:
                         coords = get_coordinates(st.session_state.weather_loc)
                         if coords:
                             w_data = get_weather_forecast(coords['lat'], coords['lon'])['current']
+                            w_now = w_data
                             w_ctx = f"CURRENT WEATHER in {coords['name']}: {w_data['temp']}°C, {w_data['condition']}. UV Index: {w_data['uv']}."
                     except: w_ctx = "Weather context: Currently unavailable."
 
@@ -1217,8 +1252,15 @@ def main_app():
                         f"Wellness Status: {wellness}"
                     )
                     
-                    # 3. RAG Search
-                    docs = rag_search(q)
+                    # 3. Semantic response cache: a near-duplicate question from the same user
+                    # with the same risk levels / weather bucket skips RAG and the LLM call
+                    response_cache = get_response_cache()
+                    no_cache = st.session_state.get("chat_no_cache", False)
+                    fingerprint = chat_fingerprint(st.session_state.username, p, w_now)
+                    cached = response_cache.get(q, fingerprint, bypass=no_cache)
+
+                    # RAG Search
+                    docs = rag_search(q) if cached is None else []
                     rag_text = "\n".join(docs)
                     
                     # 4. Prompt Engineering (STRICT GUARDRAILS)
@@ -1310,30 +1352,26 @@ def main_app():
                     # 5. API Call (AGENTIC LOOP)
                     import json
                     
-                    # First Pass: Ask LLM
-                    resp = requests.post(
-                        "https://api.mistral.ai/v1/chat/completions",
-                        headers={"Authorization": f"Bearer {MISTRAL_API_KEY}"},
-                        json={
-                            "model": "mistral-tiny", 
-                            "messages": [{"role": "user", "content": prompt}]
-                            # Removed JSON mode to allow normal conversations
-                        }
-                    )
-                    
+                    # First Pass: Ask LLM (pooled client with timeouts + retries),
+                    # tokens are rendered as they stream in
                     final_ans = ""
                     
-                    if resp.status_code == 200:
-                        content = resp.json()['choices'][0]['message']['content']
+                    try:
+                        if cached is not None:
+                            final_ans = cached
+                            st.markdown(final_ans)
+                        else:
+                            final_ans = render_stream(stream_completion(
+                                [{"role": "user", "content": prompt}],
+                                api_key=MISTRAL_API_KEY
+                                # Removed JSON mode to allow normal conversations
+                            ))
+                            response_cache.put(q, final_ans, fingerprint, bypass=no_cache)
                         
                         # Simple conversation - no tool calling
-                        final_ans = content
-                        
-                        # Clean up response
-                        st.markdown(final_ans)
                         st.session_state.chat_history.append({"role": "assistant", "content": final_ans})
-                    else:
-                        st.error(f"AI Service Error: {resp.text}")
+                    except LLMError as e:
+                        st.error(f"AI Service Error: {e}")
                 except Exception as e:
                     st.error(f"System Error: {e}")
 
@@ -0,0 +1,59 @@
+"""
+End-to-end check of the cohort checkup on stored profiles.
+
+    cd backend
+    python cohort_check.py
+
+Registers a few users in a throwaway users.db, runs
+run_cohort_checkup(database.iter_profiles()) and checks that every user comes
+back once, under its username, scored from its own profile (not defaults).
+"""
+import os
+import sys
+import tempfile
+
+import database
+from services.cohort_service import _iter_chunks, build_cohort_inputs, run_cohort_checkup
+
+USERS = {
+    "young": {"age": 25, "weight": 60, "height": 175, "gender": "Female"},
+    "older": {"age": 72, "weight": 110, "height": 165, "gender": "Male"},
+    "no_profile": None
+}
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "users.db")
+        database.init_db()
+        for username, profile in USERS.items():
+            # Skip bcrypt: the check is about the profile / cohort path
+            database._insert_user(username, b"x", profile)
+
+        results = list(run_cohort_checkup(database.iter_profiles()))
+        ids = [r["id"] for r in results]
+        if sorted(ids) != sorted(USERS):
+            failures.append(f"ids {ids} != usernames {sorted(USERS)}")
+        for r in results:
+            if "error" in r:
+                failures.append(f"{r['id']}: {r['error']}")
+
+        # The model inputs must carry each stored age, not PROFILE_DEFAULTS
+        chunk = next(_iter_chunks(database.iter_profiles(), len(USERS)))
+        ages = dict(zip(chunk["username"], build_cohort_inputs(chunk)["diabetes"]["Age"]))
+        for username, profile in USERS.items():
+            if profile and ages.get(username) != profile["age"]:
+                failures.append(f"{username}: scored with age {ages.get(username)}, stored {profile['age']}")
+        database.close_connection()
+
+    for r in results:
+        print(r["id"], r["risks"])
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"OK: {len(results)} profiles scored under their usernames")
+
+
+if __name__ == "__main__":
+    main()
@@ -45,3 +45,17 @@ STROKE_DEFAULTS = {
     "bmi": 25,
     "smoking_status": 1
 }
+
+
+WELLNESS_DEFAULTS = {
+    "hrv_7d_avg": 45,
+    "sleep_7d_avg": 7.0,
+    "sleep_pressure": 50,
+    "stress_score": 50,
+    "activity_load": 50,
+    "baseline_hrv": 50,
+    "hrv_deviation": 0,
+    "sleep_duration_hours": 7.0,
+    "hrv_rmssd_ms": 45,
+    "spo2_avg_pct": 98
+}
@@ -1,69 +1,430 @@
+import asyncio
 import sqlite3
 import bcrypt
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 DB_NAME = "users.db"
 
+# One long-lived connection per thread instead of connect/close per call.
+# WAL lets readers run while a profile write is in progress, NORMAL sync is
+# safe with WAL (a crash can only lose the last commits, never corrupt), and
+# the busy timeout makes a second writer wait instead of failing with
+# "database is locked". sqlite3 keeps up to DB_STATEMENT_CACHE prepared
+# statements per connection, keyed on the SQL text, so the statements below
+# are module constants.
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "64"))
+
+# bcrypt runs on its own small pool: a login storm can use at most
+# AUTH_HASH_WORKERS cores (bcrypt releases the GIL, so threads are enough),
+# and once AUTH_MAX_PENDING hash jobs are queued or running, new ones are
+# refused with AuthBusyError instead of queueing without bound.
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "64"))
+
+# Profile schema (PRAGMA user_version 1). Known profile fields are typed
+# columns of users; assessment results live in their own tables, one row per
+# risk condition / wellness model; the `profile` column only keeps extra keys
+# (JSON) nobody queries on. Profiles are still read and written as one dict.
+SCHEMA_VERSION = 1
+PROFILE_COLUMNS = {
+    "age": "INTEGER",
+    "weight": "REAL",
+    "height": "REAL",
+    "gender": "TEXT",
+    "bmi": "REAL",
+    "step_goal": "INTEGER"
+}
+# Result key holding the score, per wellness model (default "score")
+WELLNESS_SCORE_KEYS = {"sleep": "efficiency_score"}
+
+_SQL_CREATE_USERS = '''
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        profile TEXT
+    )
+'''
+_SQL_CREATE_RISKS = '''
+    CREATE TABLE IF NOT EXISTS risk_assessments (
+        username TEXT NOT NULL REFERENCES users(username),
+        condition TEXT NOT NULL,
+        result TEXT,
+        assessed_at REAL,
+        PRIMARY KEY (username, condition)
+    )
+'''
+_SQL_CREATE_WELLNESS = '''
+    CREATE TABLE IF NOT EXISTS wellness_assessments (
+        username TEXT NOT NULL REFERENCES users(username),
+        kind TEXT NOT NULL,
+        score REAL,
+        level TEXT,
+        color TEXT,
+        explanation TEXT,
+        factors TEXT,
+        assessed_at REAL,
+        PRIMARY KEY (username, kind)
+    )
+'''
+_PROFILE_SELECT = f"SELECT username, profile, {', '.join(PROFILE_COLUMNS)} FROM users"
+
+_SQL_USER_EXISTS = 'SELECT username FROM users WHERE username = ?'
+_SQL_INSERT_USER = 'INSERT INTO users (username, password, profile) VALUES (?, ?, ?)'
+_SQL_LOGIN = 'SELECT password FROM users WHERE username = ?'
+_SQL_GET_PROFILE = _PROFILE_SELECT + ' WHERE username = ?'
+_SQL_ALL_PROFILES = _PROFILE_SELECT
+_SQL_GET_EXTRAS = 'SELECT profile FROM users WHERE username = ?'
+_SQL_SET_EXTRAS = 'UPDATE users SET profile = ? WHERE username = ?'
+_SQL_DELETE_RISKS = 'DELETE FROM risk_assessments WHERE username = ?'
+_SQL_INSERT_RISK = 'INSERT INTO risk_assessments (username, condition, result, assessed_at) VALUES (?, ?, ?, ?)'
+_SQL_DELETE_WELLNESS = 'DELETE FROM wellness_assessments WHERE username = ?'
+_SQL_INSERT_WELLNESS = (
+    'INSERT INTO wellness_assessments (username, kind, score, level, color, explanation, factors, assessed_at) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+_local = threading.local()
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def get_connection():
+    """
+    This thread's connection to DB_NAME (opened on first use, reopened if DB_NAME changed).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_NAME:
+        if conn is not None:
+            conn.close()
+        conn = _open_connection(DB_NAME)
+        _local.conn, _local.path = conn, DB_NAME
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """
+    Yields this thread's connection; commits on success, rolls back on error.
+    """
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
+class AuthBusyError(Exception):
+    """
+    Raised when the password hashing pool is at AUTH_MAX_PENDING; retry later.
+    """
+
+
+_HASH_POOL = None
+_HASH_LOCK = threading.Lock()
+_HASH_STATS = {"submitted": 0, "completed": 0, "rejected": 0, "pending": 0, "max_pending_seen": 0,
+               "wait_s": 0.0, "hash_s": 0.0}
+
+
+def _hash_pool():
+    global _HASH_POOL
+    if _HASH_POOL is None:
+        with _HASH_LOCK:
+            if _HASH_POOL is None:
+                _HASH_POOL = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _HASH_POOL
+
+
+def _timed_job(fn, args, queued_at):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        finished = time.perf_counter()
+        with _HASH_LOCK:
+            _HASH_STATS["wait_s"] += started - queued_at
+            _HASH_STATS["hash_s"] += finished - started
+
+
+def _job_done(_future):
+    with _HASH_LOCK:
+        _HASH_STATS["pending"] -= 1
+        _HASH_STATS["completed"] += 1
+
+
+def submit_password_job(fn, *args):
+    """
+    Runs a bcrypt call on the hashing pool and returns its Future.
+    Raises AuthBusyError when AUTH_MAX_PENDING jobs are already queued or running.
+    """
+    pool = _hash_pool()
+    with _HASH_LOCK:
+        if _HASH_STATS["pending"] >= AUTH_MAX_PENDING:
+            _HASH_STATS["rejected"] += 1
+            raise AuthBusyError("Too many sign-ins in progress, please retry shortly")
+        _HASH_STATS["pending"] += 1
+        _HASH_STATS["submitted"] += 1
+        _HASH_STATS["max_pending_seen"] = max(_HASH_STATS["max_pending_seen"], _HASH_STATS["pending"])
+    future = pool.submit(_timed_job, fn, args, time.perf_counter())
+    future.add_done_callback(_job_done)
+    return future
+
+
+def password_pool_stats():
+    with _HASH_LOCK:
+        stats = dict(_HASH_STATS)
+    done = stats.pop("completed")
+    wait_s, hash_s = stats.pop("wait_s"), stats.pop("hash_s")
+    stats.update({
+        "workers": AUTH_HASH_WORKERS,
+        "max_pending": AUTH_MAX_PENDING,
+        # Jobs waiting for a worker (pending includes the ones being hashed)
+        "queue_depth": max(0, stats["pending"] - AUTH_HASH_WORKERS),
+        "completed": done,
+        "avg_wait_ms": round(wait_s / done * 1000, 1) if done else 0.0,
+        "avg_hash_ms": round(hash_s / done * 1000, 1) if done else 0.0
+    })
+    return stats
+
+
+def _hash_password_job(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
+
+def _check_password_job(password, stored_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
+
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            profile TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """
+    Creates the tables and migrates an older users.db (one JSON blob per user).
+    """
+    with transaction() as conn:
+        # Write lock up front: several workers may start (and migrate) at once
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(_SQL_CREATE_USERS)
+        conn.execute(_SQL_CREATE_RISKS)
+        conn.execute(_SQL_CREATE_WELLNESS)
+
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+        for column, sql_type in PROFILE_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE users ADD COLUMN {column} {sql_type}')
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            _migrate_profiles(conn)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+def _migrate_profiles(conn):
+    # 1. Split every JSON profile into columns / assessment rows
+    rows = conn.execute('SELECT username, profile FROM users').fetchall()
+    for username, p_json in rows:
+        try:
+            profile = json.loads(p_json) if p_json else {}
+        except ValueError:
+            profile = {}
+        if not isinstance(profile, dict):
+            profile = {}
+        conn.execute(_SQL_SET_EXTRAS, ("{}", username))
+        _write_profile(conn, username, profile)
+    print(f"Migrated {len(rows)} user profiles to schema v{SCHEMA_VERSION}")
+
+def _wellness_row(username, kind, result, now):
+    score = result.get(WELLNESS_SCORE_KEYS.get(kind, "score"))
+    factors = result.get("factors")
+    return (
+        username, kind, score, result.get("level"), result.get("color"), result.get("explanation"),
+        "\n".join(str(f) for f in factors) if isinstance(factors, list) else None, now
+    )
+
+def _write_profile(conn, username, fields):
+    """
+    Writes only the given profile fields: typed columns with one UPDATE,
+    risks / wellness replace that user's assessment rows, anything else is
+    merged into the extras JSON.
+    """
+    fields = dict(fields)
+    now = time.time()
+    risks = fields.pop("risks", None)
+    wellness = fields.pop("wellness", None)
+
+    # 1. Typed columns
+    columns = [c for c in PROFILE_COLUMNS if c in fields]
+    if columns:
+        assignments = ", ".join(f"{c} = ?" for c in columns)
+        conn.execute(f'UPDATE users SET {assignments} WHERE username = ?',
+                     [fields.pop(c) for c in columns] + [username])
+
+    # 2. Assessment results
+    if isinstance(risks, dict):
+        conn.execute(_SQL_DELETE_RISKS, (username,))
+        conn.executemany(_SQL_INSERT_RISK, [
+            (username, condition, None if result is None else str(result), now)
+            for condition, result in risks.items()
+        ])
+    if isinstance(wellness, dict):
+        conn.execute(_SQL_DELETE_WELLNESS, (username,))
+        conn.executemany(_SQL_INSERT_WELLNESS, [
+            _wellness_row(username, kind, result, now)
+            for kind, result in wellness.items() if isinstance(result, dict)
+        ])
+
+    # 3. Remaining keys: read-modify-write of the (small) extras blob
+    if fields:
+        row = conn.execute(_SQL_GET_EXTRAS, (username,)).fetchone()
+        extras = json.loads(row[0]) if row and row[0] else {}
+        extras.update(fields)
+        conn.execute(_SQL_SET_EXTRAS, (json.dumps(extras), username))
+
+def _assessments(conn, usernames):
+    """
+    {username: (risks, wellness)} for the given users.
+    """
+    out = {u: ({}, {}) for u in usernames}
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(usernames), 500):
+        chunk = usernames[start:start + 500]
+        marks = ", ".join("?" * len(chunk))
+        for username, condition, result in conn.execute(
+                f'SELECT username, condition, result FROM risk_assessments WHERE username IN ({marks})', chunk):
+            out[username][0][condition] = result
+        for username, kind, score, level, color, explanation, factors in conn.execute(
+                'SELECT username, kind, score, level, color, explanation, factors '
+                f'FROM wellness_assessments WHERE username IN ({marks})', chunk):
+            result = {}
+            if score is not None:
+                result[WELLNESS_SCORE_KEYS.get(kind, "score")] = score
+            for key, value in (("level", level), ("color", color), ("explanation", explanation)):
+                if value is not None:
+                    result[key] = value
+            if factors is not None:
+                result["factors"] = factors.split("\n") if factors else []
+            out[username][1][kind] = result
+    return out
+
+def _assemble_profiles(conn, rows):
+    """
+    Rows of _PROFILE_SELECT -> [(username, profile_dict)] in the old single-dict shape.
+    """
+    assessments = _assessments(conn, [row[0] for row in rows])
+    profiles = []
+    for row in rows:
+        username, p_json = row[0], row[1]
+        profile = json.loads(p_json) if p_json else {}
+        for column, value in zip(PROFILE_COLUMNS, row[2:]):
+            if value is not None:
+                profile[column] = value
+        risks, wellness = assessments[username]
+        if risks:
+            profile["risks"] = risks
+        if wellness:
+            profile["wellness"] = wellness
+        profiles.append((username, profile))
+    return profiles
+
+def _user_exists(username):
+    return get_connection().execute(_SQL_USER_EXISTS, (username,)).fetchone() is not None
+
+def _stored_hash(username):
+    row = get_connection().execute(_SQL_LOGIN, (username,)).fetchone()
+    return row[0] if row else None
 
 def register_user(username, password, profile_data=None):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
     # Check if user exists
-    c.execute('SELECT username FROM users WHERE username = ?', (username,))
-    if c.fetchone():
-        conn.close()
+    if _user_exists(username):
         return False, "Username already exists"
-    
-    # Hash password
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    
-    # Profile to JSON
-    p_json = json.dumps(profile_data) if profile_data else "{}"
-    
+
+    # Hash password (on the hashing pool)
+    hashed = submit_password_job(_hash_password_job, password).result()
+    return _insert_user(username, hashed, profile_data)
+
+def _insert_user(username, hashed, profile_data):
     try:
-        c.execute('INSERT INTO users (username, password, profile) VALUES (?, ?, ?)', 
-                  (username, hashed, p_json))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            conn.execute(_SQL_INSERT_USER, (username, hashed, "{}"))
+            if profile_data:
+                _write_profile(conn, username, profile_data)
         return True, "User registered successfully"
     except Exception as e:
-        conn.close()
         return False, str(e)
 
 def login_user(username, password):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    c.execute('SELECT password, profile FROM users WHERE username = ?', (username,))
-    result = c.fetchone()
-    conn.close()
-    
-    if result:
-        stored_hash = result[0]
-        profile_json = result[1]
-        
-        if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
-            return True, json.loads(profile_json)
-    
+    stored_hash = _stored_hash(username)
+
+    if stored_hash:
+        if submit_password_job(_check_password_job, password, stored_hash).result():
+            return True, get_profile(username)
+
+    return False, None
+
+async def async_register_user(username, password, profile_data=None):
+    """
+    register_user for the event loop: awaits the hash without holding a
+    thread, and runs the SQLite calls (which can wait up to
+    DB_BUSY_TIMEOUT_MS on a busy writer) in worker threads.
+    """
+    if await asyncio.to_thread(_user_exists, username):
+        return False, "Username already exists"
+    hashed = await asyncio.wrap_future(submit_password_job(_hash_password_job, password))
+    return await asyncio.to_thread(_insert_user, username, hashed, profile_data)
+
+async def async_login_user(username, password):
+    stored_hash = await asyncio.to_thread(_stored_hash, username)
+    if stored_hash:
+        if await asyncio.wrap_future(submit_password_job(_check_password_job, password, stored_hash)):
+            return True, await asyncio.to_thread(get_profile, username)
     return False, None
 
+def get_profile(username):
+    """
+    Stored profile dict, or None for an unknown user (no password check).
+    """
+    conn = get_connection()
+    row = conn.execute(_SQL_GET_PROFILE, (username,)).fetchone()
+    if row is None:
+        return None
+    return _assemble_profiles(conn, [row])[0][1]
+
 def update_profile(username, profile_data):
-    conn = sqlite3.connect(DB_NAME)
+    """
+    Partial update: only the fields present in profile_data are written
+    (passing the whole profile still works). "risks" / "wellness" replace the
+    user's stored assessments.
+    """
+    with transaction() as conn:
+        _write_profile(conn, username, profile_data)
+
+def iter_profiles(batch_size=500):
+    """
+    Streams (username, profile_dict) for every stored user, batch_size rows at a time.
+    Used by the nightly cohort checkup so the whole table is never loaded at once.
+    """
+    # Own cursor on the thread's connection; with WAL, writers are not blocked meanwhile
+    conn = get_connection()
     c = conn.cursor()
-    p_json = json.dumps(profile_data)
-    c.execute('UPDATE users SET profile = ? WHERE username = ?', (p_json, username))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute(_SQL_ALL_PROFILES)
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            # One assessment query per batch, not per user
+            yield from _assemble_profiles(conn, rows)
+    finally:
+        c.close()
@@ -0,0 +1,146 @@
+"""
+Concurrency benchmark for the users.db access layer.
+
+    cd backend
+    python db_benchmark.py --threads 1,4,16 --seconds 3 --write-ratio 0.2
+
+Runs the same mixed workload (profile reads + profile updates) twice on
+throwaway databases: "before" opens a fresh connection per call in the
+default rollback-journal mode and rewrites the JSON profile blob (the old
+database.py), "after" goes through database.py (per-thread connections, WAL,
+synchronous=NORMAL, busy timeout, typed columns with partial updates).
+Password hashing is left out on purpose: it is bcrypt-bound, not SQLite-bound.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import database
+
+PROFILE = {
+    "age": 42, "weight": 78, "height": 175, "gender": "Male", "bmi": 25.5,
+    "risks": {"diabetes": "Low Risk", "heart": "Low Risk", "stroke": "Low Risk"},
+    "wellness": {"burnout": {"score": 42.0, "level": "Medium", "color": "orange", "explanation": "Signs of fatigue."},
+                 "sleep": {"efficiency_score": 84.0, "factors": ["Short sleep duration."]}}
+}
+# What one form / agent edit changes
+UPDATE = {"weight": 77, "bmi": 25.1}
+
+
+def seed(path, n_users):
+    # Old single-blob layout; database.init_db() migrates it for the "after" run
+    conn = sqlite3.connect(path)
+    conn.execute(database._SQL_CREATE_USERS)
+    conn.executemany(
+        database._SQL_INSERT_USER,
+        [(f"user{i}", b"x", json.dumps(PROFILE)) for i in range(n_users)]
+    )
+    conn.commit()
+    conn.close()
+
+
+# --- "before": connect / execute / close per call, like the old database.py ---
+def legacy_read(path, username):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('SELECT profile FROM users WHERE username = ?', (username,))
+    json.loads(c.fetchone()[0])
+    conn.close()
+
+
+def legacy_write(path, username, changes):
+    # Old callers rewrote the whole blob: read, merge, write back
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('SELECT profile FROM users WHERE username = ?', (username,))
+    profile = json.loads(c.fetchone()[0])
+    profile.update(changes)
+    c.execute('UPDATE users SET profile = ? WHERE username = ?', (json.dumps(profile), username))
+    conn.commit()
+    conn.close()
+
+
+def run_level(mode, path, threads, seconds, write_ratio, n_users):
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        reads = writes = errors = 0
+        while time.perf_counter() < stop:
+            username = f"user{rng.randrange(n_users)}"
+            is_write = rng.random() < write_ratio
+            try:
+                if mode == "before":
+                    if is_write:
+                        legacy_write(path, username, UPDATE)
+                    else:
+                        legacy_read(path, username)
+                else:
+                    if is_write:
+                        database.update_profile(username, UPDATE)
+                    else:
+                        database.get_profile(username)
+                if is_write:
+                    writes += 1
+                else:
+                    reads += 1
+            except sqlite3.OperationalError:
+                # "database is locked" once the busy timeout runs out
+                errors += 1
+        if mode == "after":
+            database.close_connection()
+        with lock:
+            counts["reads"] += reads
+            counts["writes"] += writes
+            counts["errors"] += errors
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    return {
+        "mode": mode,
+        "threads": threads,
+        "reads_per_s": round(counts["reads"] / seconds),
+        "writes_per_s": round(counts["writes"] / seconds),
+        "errors": counts["errors"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for the users.db access layer.")
+    parser.add_argument("--threads", default="1,4,16", help="comma-separated thread counts")
+    parser.add_argument("--seconds", type=float, default=3, help="duration per level")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of operations that are profile updates")
+    parser.add_argument("--users", type=int, default=1000, help="seeded users")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("before", "after"):
+            path = os.path.join(tmp, f"{mode}.db")
+            seed(path, args.users)
+            database.DB_NAME = path
+            if mode == "after":
+                database.init_db()
+            for level in [int(t) for t in args.threads.split(",")]:
+                rows.append(run_level(mode, path, level, args.seconds, args.write_ratio, args.users))
+        database.close_connection()
+
+    keys = list(rows[0].keys())
+    print(" | ".join(f"{k:>14}" for k in keys))
+    for row in rows:
+        print(" | ".join(f"{str(row[k]):>14}" for k in keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Concurrency load test for the FastAPI backend.
+
+    cd backend
+    python load_test.py --route weather --concurrency 1,16,64,256 --workers 1
+    python load_test.py --route chat --url http://127.0.0.1:8000    # existing server, real upstreams
+
+Without --url it starts a mock Open-Meteo / Mistral upstream with a fixed
+latency (--mock-latency-ms) and a uvicorn server pointed at it, so the numbers
+show how many requests one worker keeps in flight while waiting on I/O
+(in-flight per worker ~= req/s * upstream latency / workers, Little's law).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MOCK_FORECAST = {
+    "current": {"temperature_2m": 31.2, "relative_humidity_2m": 70, "apparent_temperature": 35.0,
+                "is_day": 1, "weather_code": 1, "surface_pressure": 1008, "wind_speed_10m": 12.0},
+    "daily": {"time": ["2024-06-01", "2024-06-02"], "weather_code": [1, 61],
+              "temperature_2m_max": [33, 30], "temperature_2m_min": [27, 26],
+              "sunrise": ["2024-06-01T06:00"], "sunset": ["2024-06-01T19:10"], "uv_index_max": [9.5, 7.0]},
+    "hourly": {"time": [f"2024-06-01T{h:02d}:00" for h in range(24)], "weather_code": [1] * 24,
+               "temperature_2m": [30] * 24, "wind_speed_10m": [10] * 24}
+}
+MOCK_COMPLETION = {"choices": [{"message": {"content": "Drink water regularly and rest in the shade."}}]}
+
+ROUTES = {
+    "weather": ("GET", "/data/weather?lat=19.07&lon=72.87", None),
+    "chat": ("POST", "/chat", {"message": "How much water should I drink in hot weather?", "no_cache": True}),
+    "predict": ("POST", "/predict/diabetes", {"data": {"Glucose": 140, "BMI": 31.0, "Age": 45}})
+}
+
+
+async def mock_upstream(scope, receive, send):
+    """
+    ASGI app standing in for Open-Meteo (GET) and Mistral (POST); answers
+    after MOCK_LATENCY_MS. Runs in its own uvicorn process.
+    """
+    if scope["type"] != "http":
+        return
+    if scope["method"] == "POST":
+        more_body = True
+        while more_body:
+            more_body = (await receive()).get("more_body", False)
+    await asyncio.sleep(float(os.getenv("MOCK_LATENCY_MS", "200")) / 1000)
+    payload = MOCK_COMPLETION if scope["method"] == "POST" else MOCK_FORECAST
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _uvicorn(app, port, workers=1, env=None):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            httpx.get(f"{url}/data/wearable", timeout=1)
+            return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"uvicorn {app} did not start")
+
+
+def start_server(upstream, workers):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        OPEN_METEO_FORECAST_URL=f"{upstream}/v1/forecast",
+        MISTRAL_API_URL=f"{upstream}/v1/chat/completions",
+        RAG_WARMUP="0",
+        RESPONSE_CACHE_ENABLED="0",
+        WEATHER_CACHE_TTL_S="0",
+        LLM_MAX_CONCURRENCY=os.getenv("LLM_MAX_CONCURRENCY", "256"),
+        LLM_POOL_SIZE=os.getenv("LLM_POOL_SIZE", "256")
+    )
+    return _uvicorn("main:app", port, workers, env)
+
+
+async def run_level(url, route, concurrency, n_requests):
+    method, path, body = ROUTES[route]
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(n_requests):
+        queue.put_nowait(None)
+
+    # One client (one keep-alive connection) per virtual user: a single shared
+    # pool spends most of its time scheduling once hundreds of requests queue up.
+    # The SSL context is shared, building one per client costs ~50 ms of CPU.
+    ssl_context = ssl.create_default_context()
+
+    async def worker():
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=url, timeout=120, verify=ssl_context) as client:
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    resp = await client.request(method, path, json=body)
+                    if resp.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "req_per_s": round(n_requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency load test for the FastAPI backend.")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--route", default="weather", choices=sorted(ROUTES))
+    parser.add_argument("--concurrency", default="1,16,64,256", help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level (default 4x concurrency, min 100)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting a server")
+    parser.add_argument("--mock-latency-ms", type=float, default=200, help="mock upstream latency")
+    args = parser.parse_args()
+
+    procs = []
+    url = args.url
+    latency_s = None
+    if not url:
+        latency_s = args.mock_latency_ms / 1000
+        mock_env = dict(os.environ, MOCK_LATENCY_MS=str(args.mock_latency_ms))
+        mock_proc, upstream = _uvicorn("load_test:mock_upstream", _free_port(), env=mock_env)
+        server_proc, url = start_server(upstream, args.workers)
+        procs = [mock_proc, server_proc]
+
+    try:
+        rows = []
+        for level in [int(c) for c in args.concurrency.split(",")]:
+            n = args.requests or max(100, 4 * level)
+            row = asyncio.run(run_level(url, args.route, level, n))
+            if latency_s and args.route != "predict":
+                # Little's law: requests kept in flight per worker
+                row["in_flight_per_worker"] = round(row["req_per_s"] * latency_s / args.workers, 1)
+            rows.append(row)
+
+        keys = list(rows[0].keys())
+        print(f"route={args.route} url={url} workers={args.workers}")
+        print(" | ".join(f"{k:>20}" for k in keys))
+        for row in rows:
+            print(" | ".join(f"{str(row.get(k, '')):>20}" for k in keys))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,42 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
 import os
-import requests
 
 # Import internal services
 # Note: Since we are in backend/, these imports should work relative to logic
-from database import init_db, register_user, login_user, update_profile
+from database import init_db, async_register_user, async_login_user, update_profile, AuthBusyError, password_pool_stats
 from services.wearable_service import get_wearable_data
-from services.weather_service import get_weather_and_aqi
+from services.vitals_store import hourly_series, daily_series
+from services.feature_engine import get_feature_engine, observe_vitals
+from services.weather_service import async_get_weather_and_aqi, close_async_http, weather_cache_stats, suggest_locations, get_weather_bulk
 from services.weather_health_rules import weather_health_rules
-from services.ml_diabetes import predict_diabetes
-from services.ml_heart import predict_heart
-from services.ml_stroke import predict_stroke
-from rag.rag_service import rag_search
+from services.ml_diabetes import predict_diabetes, predict_diabetes_batch
+from services.ml_heart import predict_heart, predict_heart_batch
+from services.ml_stroke import predict_stroke, predict_stroke_batch
+from services.model_registry import preload_models
+from services.llm_client import LLMError, get_async_client, close_async_client
+from rag.rag_service import rag_search, get_retriever
+from rag.response_cache import chat_fingerprint, get_response_cache
 
 app = FastAPI(title="AI Health Coach API")
 
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "tBxQqLn72I8jVJEBWQ0HjKJwuzJV8E2O")
+
+# I/O-bound routes are async (httpx for weather + LLM). CPU-bound work (model
+# inference, embeddings / RAG) is handed to this pool so it never blocks the
+# event loop; blocking DB / bcrypt routes stay plain `def` (FastAPI threadpool).
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+_INFERENCE_POOL = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_INFERENCE_POOL, fn, *args)
+
 # CORS for React Frontend
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +50,20 @@ app.add_middleware(
 @app.on_event("startup")
 def startup_event():
     init_db()
+    # Unpickle all models once so /predict/* never hits the disk
+    preload_models()
+    # Load FAISS index + embedding model up front (set RAG_WARMUP=0 to skip)
+    if os.getenv("RAG_WARMUP", "1") == "1":
+        try:
+            get_retriever().warmup()
+        except Exception as e:
+            print(f"RAG Warmup Error: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_async_client()
+    await close_async_http()
+    _INFERENCE_POOL.shutdown(wait=False)
 
 # --- MODELS ---
 class UserAuth(BaseModel):
@@ -45,25 +77,68 @@ class UserProfile(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     context: Optional[Dict] = {}
+    no_cache: bool = False  # skip the semantic response cache
 
 class PredictionRequest(BaseModel):
     data: Dict[str, Any]
 
+class BatchPredictionRequest(BaseModel):
+    # Either row-wise records or a columnar payload {feature: [values]}
+    records: Optional[List[Dict[str, Any]]] = None
+    columns: Optional[Dict[str, List[Any]]] = None
+
+class Location(BaseModel):
+    lat: float
+    lon: float
+
+class BulkWeatherRequest(BaseModel):
+    locations: List[Location]
+
+class VitalsSample(BaseModel):
+    ts: float  # epoch seconds
+    values: Dict[str, Optional[float]]
+
+class VitalsBatch(BaseModel):
+    samples: List[VitalsSample]
+
+def _batch_payload(req: BatchPredictionRequest):
+    if req.records is not None:
+        return req.records
+    if req.columns is not None:
+        return req.columns
+    raise HTTPException(status_code=400, detail="Provide either 'records' or 'columns'")
+
 # --- ROUTES: AUTH ---
+# bcrypt runs on the bounded pool in database.py, so these routes hold
+# neither an inference worker nor a threadpool thread while hashing; their
+# SQLite calls run in worker threads, never on the event loop
+def _auth_busy(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
 @app.post("/auth/register")
-def register(user: UserAuth):
-    success, msg = register_user(user.username, user.password)
+async def register(user: UserAuth):
+    try:
+        success, msg = await async_register_user(user.username, user.password)
+    except AuthBusyError as e:
+        raise _auth_busy(e)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"message": "Registration successful"}
 
 @app.post("/auth/login")
-def login(user: UserAuth):
-    success, profile = login_user(user.username, user.password)
+async def login(user: UserAuth):
+    try:
+        success, profile = await async_login_user(user.username, user.password)
+    except AuthBusyError as e:
+        raise _auth_busy(e)
     if not success:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     return {"username": user.username, "profile": profile, "token": "fake-jwt-token-for-demo"}
 
+@app.get("/auth/pool_stats")
+async def get_password_pool_stats():
+    return password_pool_stats()
+
 @app.post("/auth/update_profile")
 def update_user_profile(up: UserProfile):
     update_profile(up.username, up.profile_data)
@@ -71,103 +146,239 @@ def update_user_profile(up: UserProfile):
 
 # --- ROUTES: DATA ---
 @app.get("/data/wearable")
-def get_wearable():
+async def get_wearable():
     return get_wearable_data()
 
 @app.get("/data/weather")
-def get_weather(lat: float = 19.07, lon: float = 72.87):
+async def get_weather(lat: float = 19.07, lon: float = 72.87):
     # Default to Mumbai if not provided
     try:
-        data = get_weather_and_aqi(lat, lon)
+        data = await async_get_weather_and_aqi(lat, lon)
         rules = weather_health_rules(data)
         return {"weather": data, "advisories": rules}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/data/weather/bulk")
+def get_weather_for_locations(req: BulkWeatherRequest):
+    # Blocking fetch: FastAPI runs sync routes in its thread pool
+    return {"results": get_weather_bulk([(loc.lat, loc.lon) for loc in req.locations])}
+
+@app.get("/data/geocode/suggest")
+def get_location_suggestions(q: str, limit: int = 10):
+    # Plain def: the first call loads the geocode table from SQLite
+    return {"suggestions": suggest_locations(q, limit)}
+
+@app.get("/data/weather/cache_stats")
+async def get_weather_cache_stats():
+    return weather_cache_stats()
+
+# --- ROUTES: VITALS (sqlite, so plain def routes on the threadpool) ---
+@app.post("/data/vitals/{username}")
+def ingest_vitals(username: str, batch: VitalsBatch):
+    stored = observe_vitals(username, [(s.ts, s.values) for s in batch.samples])
+    return {"stored": stored}
+
+@app.get("/data/vitals/{username}/hourly")
+def get_hourly_vitals(username: str, metric: str = "heart_rate", day: Optional[str] = None, agg: str = "avg"):
+    try:
+        return {"metric": metric, "agg": agg, "values": hourly_series(username, metric, day, agg)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data/vitals/{username}/daily")
+def get_daily_vitals(username: str, start: str, end: str, metric: str = "heart_rate", agg: str = "avg"):
+    try:
+        return {"metric": metric, "agg": agg, "days": daily_series(username, metric, start, end, agg)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data/vitals/{username}/features")
+def get_vitals_features(username: str):
+    engine = get_feature_engine()
+    return {
+        "features": engine.observed(username),
+        "burnout_vector": engine.burnout_vector(username),
+        "sleep_vector": engine.sleep_vector(username)
+    }
+
 # --- ROUTES: PREDICTION ---
 @app.post("/predict/diabetes")
-def api_predict_diabetes(req: PredictionRequest):
+async def api_predict_diabetes(req: PredictionRequest):
     try:
         # Defaults handled in frontend or basic logic, service expects dict
-        result = predict_diabetes(req.data)
+        result = await run_cpu(predict_diabetes, req.data)
         return {"risk": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/predict/heart")
-def api_predict_heart(req: PredictionRequest):
+async def api_predict_heart(req: PredictionRequest):
     try:
-        result = predict_heart(req.data)
+        result = await run_cpu(predict_heart, req.data)
         return {"risk": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/predict/stroke")
-def api_predict_stroke(req: PredictionRequest):
+async def api_predict_stroke(req: PredictionRequest):
     try:
-        result = predict_stroke(req.data)
+        result = await run_cpu(predict_stroke, req.data)
         return {"risk": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Batch variants: one scaler.transform + model.predict for the whole payload,
+# results are returned in input order
+@app.post("/predict/diabetes/batch")
+async def api_predict_diabetes_batch(req: BatchPredictionRequest):
+    payload = _batch_payload(req)
+    try:
+        risks = await run_cpu(predict_diabetes_batch, payload)
+        return {"risks": risks, "count": len(risks)}
+    except ValueError as e:
+        # Malformed payload, e.g. ragged 'columns'
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/heart/batch")
+async def api_predict_heart_batch(req: BatchPredictionRequest):
+    payload = _batch_payload(req)
+    try:
+        risks = await run_cpu(predict_heart_batch, payload)
+        return {"risks": risks, "count": len(risks)}
+    except ValueError as e:
+        # Malformed payload, e.g. ragged 'columns'
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/stroke/batch")
+async def api_predict_stroke_batch(req: BatchPredictionRequest):
+    payload = _batch_payload(req)
+    try:
+        risks = await run_cpu(predict_stroke_batch, payload)
+        return {"risks": risks, "count": len(risks)}
+    except ValueError as e:
+        # Malformed payload, e.g. ragged 'columns'
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- ROUTES: RAG ---
+@app.get("/rag/cache_stats")
+async def rag_cache_stats():
+    return get_retriever().cache_stats()
+
 # --- ROUTES: CHAT ---
+@app.get("/chat/cache_stats")
+async def chat_cache_stats():
+    return get_response_cache().stats()
+
+def _chat_fingerprint(ctx):
+    """
+    Response cache fingerprint (same as the Streamlit chat): coarse context
+    plus context["username"], so patients never share answers.
+    """
+    # "context": null is valid for Optional[Dict]
+    ctx = ctx or {}
+    return chat_fingerprint(ctx.get("username"), ctx.get("profile"), ctx.get("weather"), ctx.get("vitals"))
+
+def _chat_messages(req: ChatRequest):
+    """
+    RAG search + system prompt for a chat request.
+    """
+    # 1. RAG Search
+    try:
+        rag_docs = rag_search(req.message)
+        rag_context = "\n".join(rag_docs)
+    except:
+        rag_context = "No specific guidelines found."
+
+    # 2. Construct System Prompt
+    # Context from frontend (vitals, profile) is passed in req.context
+    ctx = req.context or {}
+    vitals = ctx.get("vitals", "Unknown")
+    profile = ctx.get("profile", "Unknown")
+    weather = ctx.get("weather", "Unknown")
+
+    system_prompt = (
+        f"Act as a compassionate, expert AI Doctor.\n"
+        f"--- PATIENT CONTEXT ---\n"
+        f"Vitals: {vitals}\n"
+        f"Profile: {profile}\n"
+        f"Environment: {weather}\n"
+        f"--- MEDICAL GUIDELINES (RAG) ---\n{rag_context}\n"
+        f"----------------------\n"
+        f"Answer the user's question safely and professionally."
+    )
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": req.message}
+    ]
+
 @app.post("/chat")
-def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest):
     """
     Combines RAG + Mistral for a comprehensive reply.
     """
     try:
-        # 1. RAG Search
+        # Near-duplicate question in the same context: skip RAG + LLM
+        cache = get_response_cache()
+        fingerprint = _chat_fingerprint(req.context)
+        cached = await run_cpu(cache.get, req.message, fingerprint, req.no_cache)
+        if cached is not None:
+            return {"reply": cached, "cached": True}
+
+        messages = await run_cpu(_chat_messages, req)
+
+        # Pooled async client: keep-alive, timeouts, retries on 429/5xx
         try:
-            rag_docs = rag_search(req.message)
-            rag_context = "\n".join(rag_docs)
-        except:
-            rag_context = "No specific guidelines found."
-
-        # 2. Construct System Prompt
-        # Context from frontend (vitals, profile) is passed in req.context
-        ctx = req.context
-        vitals = ctx.get("vitals", "Unknown")
-        profile = ctx.get("profile", "Unknown")
-        weather = ctx.get("weather", "Unknown")
-
-        system_prompt = (
-            f"Act as a compassionate, expert AI Doctor.\n"
-            f"--- PATIENT CONTEXT ---\n"
-            f"Vitals: {vitals}\n"
-            f"Profile: {profile}\n"
-            f"Environment: {weather}\n"
-            f"--- MEDICAL GUIDELINES (RAG) ---\n{rag_context}\n"
-            f"----------------------\n"
-            f"Answer the user's question safely and professionally."
-        )
-
-        MISTRAL_API_KEY = "tBxQqLn72I8jVJEBWQ0HjKJwuzJV8E2O"
-        url = "https://api.mistral.ai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {MISTRAL_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "mistral-tiny",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": req.message}
-            ]
-        }
-        
-        # Direct Request
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            return {"reply": response.json()["choices"][0]["message"]["content"]}
-        else:
-            return {"reply": f"I'm sorry, I'm having trouble thinking right now. (API Error: {response.text})"}
+            reply = await get_async_client().chat_completion(messages, api_key=MISTRAL_API_KEY)
+            await run_cpu(cache.put, req.message, reply, fingerprint, req.no_cache)
+            return {"reply": reply}
+        except LLMError as e:
+            return {"reply": f"I'm sorry, I'm having trouble thinking right now. ({e})"}
 
     except Exception as e:
         print(f"Chat Error: {e}")
         return {"reply": "I'm sorry, an internal error occurred."}
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Streaming /chat (Server-Sent Events): RAG runs before the response starts,
+    then every upstream token is relayed as `data: {"delta": ...}`.
+    Failures arrive as `event: error`; the stream always ends with `data: [DONE]`.
+    A cached answer is sent as a single delta.
+    """
+    cache = get_response_cache()
+    fingerprint = _chat_fingerprint(req.context)
+    cached = await run_cpu(cache.get, req.message, fingerprint, req.no_cache)
+    messages = await run_cpu(_chat_messages, req) if cached is None else None
+
+    async def events():
+        if cached is not None:
+            yield f"data: {json.dumps({'delta': cached, 'cached': True})}\n\n"
+            yield "data: [DONE]\n\n"
+            return
+        try:
+            parts = []
+            async for delta in get_async_client().stream_completion(messages, api_key=MISTRAL_API_KEY):
+                parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            await run_cpu(cache.put, req.message, "".join(parts), fingerprint, req.no_cache)
+        except Exception as e:
+            print(f"Chat Stream Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    # no-cache / no proxy buffering, so tokens reach the client as they arrive
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 if __name__ == "__main__":
     import uvicorn
     # Allow running directly for testing
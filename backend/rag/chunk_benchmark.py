@@ -0,0 +1,131 @@
+"""
+Compares the legacy 500-char splitter with the sentence/token-aware chunker
+on the PDFs in backend/rag: retrieval hit rate and prompt size at several top_k.
+
+    python -m backend.rag.chunk_benchmark [--queries eval.jsonl] [--chunk-tokens 128 --chunk-overlap 24]
+
+A query counts as a hit at k if any of its top-k chunks contains its expected
+phrase (compared lower-case with non-alphanumerics removed, since PDF
+extraction often drops spaces). --queries takes JSONL lines {"query", "expected"}.
+"""
+import argparse
+import json
+import os
+import re
+
+import faiss
+import numpy as np
+import pdfplumber
+from sentence_transformers import SentenceTransformer
+
+from .chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_page, count_tokens, format_chunk, legacy_chunk_page
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+DEFAULT_EVAL_SET = [
+    ("How should insulin be stored in hot weather?", "insulin"),
+    ("What are the warning signs of a stroke?", "suddennumbness"),
+    ("When should someone with diabetes seek emergency care?", "bloodsugarabove400"),
+    ("What should I avoid before bedtime to sleep better?", "caffeine"),
+    ("How can I keep a healthy work-life balance?", "worklifebalance"),
+    ("Which strength training exercises should I include?", "squats"),
+    ("How does cold weather affect the heart?", "snowshoveling"),
+    ("What are good sources of protein?", "leanmeats"),
+    ("What are heart attack symptoms in women?", "moresubtlesymptoms"),
+    ("How can I remember to take my medications?", "setphonealarms"),
+    ("Which whole grains are healthy?", "quinoa"),
+    ("What are the symptoms of low blood sugar?", "shakiness"),
+]
+
+TOP_KS = (1, 3, 5)
+
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def load_pages(rag_dir, x_tolerance):
+    pages = []
+    for pdf_file in sorted(f for f in os.listdir(rag_dir) if f.lower().endswith(".pdf")):
+        with pdfplumber.open(os.path.join(rag_dir, pdf_file)) as pdf:
+            for i, page in enumerate(pdf.pages):
+                text = page.extract_text(x_tolerance=x_tolerance)
+                if text:
+                    pages.append((pdf_file, i + 1, text))
+    return pages
+
+
+def evaluate(name, prompt_chunks, embed_texts, model, eval_set):
+    """
+    prompt_chunks: what would be pasted into the prompt for each chunk.
+    embed_texts: what gets embedded for each chunk.
+    """
+    vectors = np.asarray(model.encode(embed_texts), dtype=np.float32)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    queries = [q for q, _ in eval_set]
+    expected = [_normalize(e) for _, e in eval_set]
+    query_vectors = np.asarray(model.encode(queries), dtype=np.float32)
+    _, I = index.search(query_vectors, max(TOP_KS))
+
+    rows = []
+    for k in TOP_KS:
+        hits, chars, tokens = 0, 0, 0
+        for ids, exp in zip(I, expected):
+            context = [prompt_chunks[i] for i in ids[:k] if i >= 0]
+            hits += any(exp in _normalize(c) for c in context)
+            joined = "\n".join(context)
+            chars += len(joined)
+            tokens += count_tokens(joined)
+        rows.append({
+            "splitter": name,
+            "chunks": len(prompt_chunks),
+            "top_k": k,
+            "hit_rate": round(hits / len(eval_set), 3),
+            "avg_prompt_chars": round(chars / len(eval_set)),
+            "avg_prompt_tokens": round(tokens / len(eval_set))
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--queries", help="JSONL file of {\"query\": ..., \"expected\": ...}")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS)
+    parser.add_argument("--x-tolerance", type=float, default=1.5, help="pdfplumber word spacing tolerance (3 = pdfplumber default)")
+    args = parser.parse_args()
+
+    eval_set = DEFAULT_EVAL_SET
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            eval_set = [(r["query"], r["expected"]) for r in map(json.loads, f) if r]
+
+    pages = load_pages(RAG_DIR, args.x_tolerance)
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    legacy = [c for source, page, text in pages for c in legacy_chunk_page(source, page, text)]
+    records = [
+        r for source, page, text in pages
+        for r in chunk_page(source, page, text, args.chunk_tokens, args.chunk_overlap)
+    ]
+
+    rows = evaluate("char500 (legacy)", legacy, legacy, model, eval_set)
+    rows += evaluate(
+        f"sentence {args.chunk_tokens}/{args.chunk_overlap}",
+        [format_chunk(r) for r in records],
+        [r["text"] for r in records],
+        model,
+        eval_set
+    )
+
+    keys = list(rows[0].keys())
+    print(" | ".join(f"{k:>18}" for k in keys))
+    for row in rows:
+        print(" | ".join(f"{str(row[k]):>18}" for k in keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import math
+import re
+
+# Sentence / token aware chunking for build_rag.py.
+# Token counts are an estimate of the embedding model's word pieces: the larger
+# of the word count and chars/4 (PDF extraction often drops spaces, so plain
+# word counts under-estimate badly). all-MiniLM-L6-v2 truncates at 256 pieces,
+# so the default chunk size leaves plenty of headroom.
+DEFAULT_CHUNK_TOKENS = 128
+DEFAULT_OVERLAP_TOKENS = 24
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[•\-])")
+
+
+def count_tokens(text):
+    return max(len(_WORD_RE.findall(text)), math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def split_sentences(text):
+    """
+    Lines first (PDF bullets / headings are one line each), then sentences.
+    """
+    units = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        units.extend(s.strip() for s in _SENTENCE_END_RE.split(line) if s.strip())
+    return units
+
+
+def _split_long_unit(unit, max_tokens):
+    """
+    Splits one sentence that alone exceeds max_tokens on word boundaries,
+    or on characters if it has no spaces.
+    """
+    words = unit.split()
+    if len(words) <= 1:
+        step = max_tokens * CHARS_PER_TOKEN
+        return [unit[i:i + step] for i in range(0, len(unit), step)]
+
+    pieces, current = [], []
+    for word in words:
+        if current and count_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+
+    # A single huge "word" can still be too long
+    out = []
+    for piece in pieces:
+        out.extend(_split_long_unit(piece, max_tokens) if count_tokens(piece) > max_tokens and " " not in piece else [piece])
+    return out
+
+
+def chunk_text(text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Greedily packs whole sentences into chunks of at most max_tokens.
+    Each new chunk starts with the trailing sentences of the previous one
+    (up to overlap_tokens) so context is not lost at chunk borders.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    units = []
+    for sentence in split_sentences(text):
+        if count_tokens(sentence) > max_tokens:
+            units.extend(_split_long_unit(sentence, max_tokens))
+        else:
+            units.append(sentence)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n".join(current))
+
+            # Carry the tail of the previous chunk over as overlap
+            carry, carry_tokens = [], 0
+            for prev in reversed(current):
+                prev_tokens = count_tokens(prev)
+                if carry_tokens + prev_tokens > overlap_tokens or carry_tokens + prev_tokens + unit_tokens > max_tokens:
+                    break
+                carry.insert(0, prev)
+                carry_tokens += prev_tokens
+            current, current_tokens = carry, carry_tokens
+
+        current.append(unit)
+        current_tokens += unit_tokens
+
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks
+
+
+def chunk_page(source, page, text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Chunks of one PDF page with their metadata as separate fields.
+    """
+    return [
+        {"text": chunk, "source": source, "page": page}
+        for chunk in chunk_text(text, max_tokens, overlap_tokens)
+    ]
+
+
+def format_chunk(record):
+    """
+    Text handed to the LLM: the citation header is added at retrieval time
+    instead of being embedded with (and only in the first slice of) the chunk.
+    """
+    if isinstance(record, str) or record.get("source") is None:
+        return record if isinstance(record, str) else record["text"]
+    return f"[Source: {record['source']} | Page {record['page']}] {record['text']}"
+
+
+def legacy_chunk_page(source, page, text):
+    """
+    The original splitter (fixed 500-char slices), kept for benchmarking.
+    """
+    chunk = f"[Source: {source} | Page {page}] {text}"
+    return [chunk[j:j+500] for j in range(0, len(chunk), 500)]
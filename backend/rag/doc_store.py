@@ -0,0 +1,226 @@
+import json
+import mmap
+import os
+import pickle
+import shutil
+import sys
+from array import array
+
+import numpy as np
+
+# Single-file, pickle-free chunk store read through mmap.
+# v1 (text only):
+#   8 bytes  magic "RAGDOCS1"
+#   8 bytes  n (uint64, little-endian)
+#   (n+1)*8  offsets into the blob (uint64, little-endian)
+#   ...      UTF-8 blob of all chunks back to back
+# v2 (text + source/page metadata):
+#   8 bytes  magic "RAGDOCS2"
+#   8 bytes  n (uint64)
+#   8 bytes  byte length of the JSON source-name table
+#   (n+1)*8  offsets into the blob (uint64)
+#   n*4      source index per chunk (int32, -1 = none)
+#   n*4      page number per chunk (int32, -1 = none)
+#   ...      JSON array of source names, then the UTF-8 blob
+# An empty chunk (offsets[i] == offsets[i+1]) is a deleted slot and reads as None.
+# Everything lives in one file so a rebuild can swap it in with one os.replace.
+STORE_FILENAME = "chunks.store"
+MAGIC_V1 = b"RAGDOCS1"
+MAGIC_V2 = b"RAGDOCS2"
+
+
+class MmapDocStore:
+    """
+    Read-only list-like view (len / [i]) over a chunks.store file; [i] is the
+    chunk text, record(i) adds its source/page metadata.
+    Pages are shared between worker processes through the OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self._mm[:8]
+        self._n = int(np.frombuffer(self._mm, dtype="<u8", count=1, offset=8)[0])
+
+        if magic == MAGIC_V1:
+            pos = 16
+            self._offsets = np.frombuffer(self._mm, dtype="<u8", count=self._n + 1, offset=pos)
+            self._source_idx = None
+            self._pages = None
+            self.sources = []
+            self._blob_start = pos + (self._n + 1) * 8
+        elif magic == MAGIC_V2:
+            sources_len = int(np.frombuffer(self._mm, dtype="<u8", count=1, offset=16)[0])
+            pos = 24
+            self._offsets = np.frombuffer(self._mm, dtype="<u8", count=self._n + 1, offset=pos)
+            pos += (self._n + 1) * 8
+            self._source_idx = np.frombuffer(self._mm, dtype="<i4", count=self._n, offset=pos)
+            pos += self._n * 4
+            self._pages = np.frombuffer(self._mm, dtype="<i4", count=self._n, offset=pos)
+            pos += self._n * 4
+            self.sources = json.loads(self._mm[pos:pos + sources_len].decode("utf-8"))
+            self._blob_start = pos + sources_len
+        else:
+            raise ValueError(f"{path} is not a RAG doc store")
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        start = self._blob_start + int(self._offsets[i])
+        end = self._blob_start + int(self._offsets[i + 1])
+        if start == end:
+            return None
+        return self._mm[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def record(self, i):
+        """
+        {"text", "source", "page"} for chunk i (metadata None for v1 stores), or None if deleted.
+        """
+        text = self[i]
+        if text is None:
+            return None
+        source, page = None, None
+        if self._source_idx is not None:
+            s = int(self._source_idx[i])
+            p = int(self._pages[i])
+            source = self.sources[s] if s >= 0 else None
+            page = p if p >= 0 else None
+        return {"text": text, "source": source, "page": page}
+
+    def records(self):
+        for i in range(self._n):
+            yield self.record(i)
+
+    def close(self):
+        self._offsets = self._source_idx = self._pages = None
+        self._mm.close()
+        self._file.close()
+
+
+class DocStoreWriter:
+    """
+    Streams chunks into a chunks.store file: texts go straight to a temp
+    blob on disk, only the per-chunk offset / source / page numbers stay in
+    memory. close() assembles the file and swaps it in atomically, abort()
+    discards it. As a context manager it closes, or aborts on an exception.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._blob_path = path + ".blob"
+        self._blob = open(self._blob_path, "wb")
+        self._offsets = array("Q", [0])
+        self._source_idx = array("i")
+        self._pages = array("i")
+        self._sources = {}
+        self._with_meta = False
+
+    def __len__(self):
+        return len(self._source_idx)
+
+    def append(self, doc):
+        """
+        Appends a str, None (deleted slot) or {"text", "source", "page"}
+        record and returns its chunk id; any record switches to the v2 format.
+        """
+        source, page = -1, -1
+        if isinstance(doc, dict):
+            self._with_meta = True
+            text = doc["text"]
+            if doc.get("source") is not None:
+                source = self._sources.setdefault(doc["source"], len(self._sources))
+            if doc.get("page") is not None:
+                page = int(doc["page"])
+        else:
+            text = doc
+
+        data = (text or "").encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._source_idx.append(source)
+        self._pages.append(page)
+        return len(self) - 1
+
+    def extend(self, documents):
+        for doc in documents:
+            self.append(doc)
+
+    def close(self):
+        self._blob.close()
+        n = len(self)
+        offsets = np.asarray(self._offsets, dtype="<u8")
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if self._with_meta:
+                sources_json = json.dumps(list(self._sources)).encode("utf-8")
+                f.write(MAGIC_V2)
+                f.write(np.array([n, len(sources_json)], dtype="<u8").tobytes())
+                f.write(offsets.tobytes())
+                f.write(np.asarray(self._source_idx, dtype="<i4").tobytes())
+                f.write(np.asarray(self._pages, dtype="<i4").tobytes())
+                f.write(sources_json)
+            else:
+                f.write(MAGIC_V1)
+                f.write(np.array([n], dtype="<u8").tobytes())
+                f.write(offsets.tobytes())
+            with open(self._blob_path, "rb") as blob:
+                shutil.copyfileobj(blob, f, 1 << 20)
+        os.replace(tmp_path, self.path)
+        os.remove(self._blob_path)
+        return n
+
+    def abort(self):
+        self._blob.close()
+        if os.path.exists(self._blob_path):
+            os.remove(self._blob_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_doc_store(documents, path):
+    """
+    Writes documents atomically. Items may be str, None (deleted slot) or
+    {"text", "source", "page"} records; any record switches to the v2 format.
+    """
+    with DocStoreWriter(path) as writer:
+        writer.extend(documents)
+
+
+def convert_pickle(db_dir):
+    """
+    Converts an existing index.pkl (list of chunk strings) into chunks.store.
+    """
+    docs_path = os.path.join(db_dir, "index.pkl")
+    store_path = os.path.join(db_dir, STORE_FILENAME)
+
+    with open(docs_path, "rb") as f:
+        documents = pickle.load(f)
+
+    write_doc_store(documents, store_path)
+    print(f"Converted {len(documents)} chunks: {docs_path} -> {store_path}")
+    return store_path
+
+
+if __name__ == "__main__":
+    # python backend/rag/doc_store.py [db_dir]
+    default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "health_rag_db")
+    convert_pickle(sys.argv[1] if len(sys.argv) > 1 else default_dir)
@@ -0,0 +1,208 @@
+import math
+import time
+
+import faiss
+import numpy as np
+
+# Supported index types -> FAISS index_factory template
+#   flat   : exact brute-force L2 (baseline, current behaviour)
+#   ivf    : inverted lists over k-means centroids, tuned with nprobe
+#   hnsw   : graph index, tuned with efSearch (no training needed)
+#   ivfpq  : IVF + product-quantized vectors (smallest memory footprint)
+#   hnswpq : HNSW graph over product-quantized vectors
+INDEX_TYPES = {
+    "flat": "Flat",
+    "ivf": "IVF{nlist},Flat",
+    "hnsw": "HNSW{hnsw_m}",
+    "ivfpq": "IVF{nlist},PQ{pq_m}",
+    "hnswpq": "HNSW{hnsw_m}_PQ{pq_m}"
+}
+
+DEFAULT_HNSW_M = 32
+DEFAULT_TRAIN_SAMPLE = 100000
+
+# PQ codebooks have 256 centroids per sub-quantizer, FAISS wants ~39 points per centroid
+MIN_PQ_TRAIN = 256 * 39
+MIN_IVF_POINTS_PER_LIST = 39
+
+NPROBE_SWEEP = [1, 2, 4, 8, 16, 32, 64, 128]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+
+def default_nlist(n_vectors):
+    # Usual rule of thumb: ~4*sqrt(N) inverted lists
+    return max(1, int(4 * math.sqrt(n_vectors)))
+
+
+def default_pq_m(dim):
+    # Largest sub-quantizer count <= dim/4 that divides dim (384 -> 96 -> 48 bytes/vector at 8 bits is common)
+    for m in (96, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if m <= dim and dim % m == 0 and m <= max(1, dim // 4):
+            return m
+    return 1
+
+
+def resolve_index_type(index_type, n_vectors):
+    """
+    Falls back to "flat" when there is too little data to train the requested
+    index (e.g. the two bundled PDFs); returns the type that will be built.
+    """
+    index_type = index_type.lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {sorted(INDEX_TYPES)}")
+
+    if "pq" in index_type and n_vectors < MIN_PQ_TRAIN:
+        print(f"Only {n_vectors} vectors, PQ needs >= {MIN_PQ_TRAIN} to train; using flat index.")
+        return "flat"
+    if index_type.startswith("ivf") and n_vectors < MIN_IVF_POINTS_PER_LIST * 4:
+        print(f"Only {n_vectors} vectors, too few for IVF; using flat index.")
+        return "flat"
+    return index_type
+
+
+def factory_string(index_type, n_vectors, dim, nlist=None, hnsw_m=DEFAULT_HNSW_M, pq_m=None):
+    if nlist is None:
+        nlist = default_nlist(n_vectors)
+    # Each inverted list needs enough training points
+    nlist = max(1, min(nlist, n_vectors // MIN_IVF_POINTS_PER_LIST))
+    if pq_m is None:
+        pq_m = default_pq_m(dim)
+
+    return INDEX_TYPES[index_type].format(nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m)
+
+
+def build_index(embeddings, index_type="flat", nlist=None, hnsw_m=DEFAULT_HNSW_M,
+                pq_m=None, train_sample=DEFAULT_TRAIN_SAMPLE, seed=42, ids=None):
+    """
+    Builds (and trains if needed) a FAISS index of the requested type.
+    Training uses a random sample of at most train_sample vectors.
+    With ids, vectors are stored under those int64 ids (IVF natively, other
+    types wrapped in an IndexIDMap) so they can be removed later.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+
+    index_type = resolve_index_type(index_type, n)
+    spec = factory_string(index_type, n, dim, nlist, hnsw_m, pq_m)
+    print(f"Building FAISS index '{spec}' over {n} vectors (dim={dim})...")
+    index = faiss.index_factory(dim, spec)
+
+    if not index.is_trained:
+        if n > train_sample:
+            rng = np.random.default_rng(seed)
+            sample = embeddings[rng.choice(n, train_sample, replace=False)]
+        else:
+            sample = embeddings
+        print(f"Training on {len(sample)} vectors...")
+        index.train(sample)
+
+    if ids is None:
+        index.add(embeddings)
+        return index
+
+    if not isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        index = faiss.IndexIDMap(index)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    return index
+
+
+def remove_ids(index, ids):
+    """
+    Removes vectors by id. Returns False if this index type cannot delete
+    (e.g. HNSW), in which case the caller has to rebuild.
+    """
+    if len(ids) == 0:
+        return True
+    try:
+        index.remove_ids(np.asarray(ids, dtype=np.int64))
+        return True
+    except RuntimeError:
+        return False
+
+
+def _base_index(index):
+    base = faiss.downcast_index(index)
+    # IndexIDMap wrappers keep the real index in .index
+    if isinstance(base, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        base = faiss.downcast_index(base.index)
+    return base
+
+
+def search_params(index, nprobe=None, ef_search=None):
+    """
+    Per-call FAISS SearchParameters for the tunables that apply to this index
+    (nprobe for IVF, efSearch for HNSW). Returns None if none apply.
+    Passing params per call keeps a shared index safe to query from many threads.
+    """
+    base = _base_index(index)
+    if nprobe is not None and isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search is not None and isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+def _timed_search(index, queries, k, params=None):
+    start = time.perf_counter()
+    if params is None:
+        _, I = index.search(queries, k)
+    else:
+        _, I = index.search(queries, k, params=params)
+    elapsed = time.perf_counter() - start
+    return I, elapsed * 1000 / len(queries)
+
+
+def recall_at_k(truth, found):
+    k = truth.shape[1]
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def recall_latency_report(embeddings, index, k=10, n_queries=500, seed=42):
+    """
+    Compares `index` against exact flat search on a sample of corpus vectors
+    used as queries. Sweeps nprobe / efSearch where applicable.
+    Returns rows of {"setting", "recall@k", "ms_per_query"}.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, len(embeddings))
+    queries = embeddings[rng.choice(len(embeddings), n_queries, replace=False)]
+
+    flat = faiss.IndexFlatL2(embeddings.shape[1])
+    flat.add(embeddings)
+    truth, flat_ms = _timed_search(flat, queries, k)
+
+    rows = [{"setting": "flat (exact)", f"recall@{k}": 1.0, "ms_per_query": round(flat_ms, 4)}]
+
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        sweep = [("nprobe", v) for v in NPROBE_SWEEP if v <= base.nlist]
+    elif isinstance(base, faiss.IndexHNSW):
+        sweep = [("efSearch", v) for v in EF_SEARCH_SWEEP]
+    else:
+        sweep = [(None, None)]
+
+    for name, value in sweep:
+        if name == "nprobe":
+            params = search_params(index, nprobe=value)
+        elif name == "efSearch":
+            params = search_params(index, ef_search=value)
+        else:
+            params = None
+
+        found, ms = _timed_search(index, queries, k, params)
+        rows.append({
+            "setting": f"{name}={value}" if name else "default",
+            f"recall@{k}": round(recall_at_k(truth, found), 4),
+            "ms_per_query": round(ms, 4)
+        })
+
+    return rows
+
+
+def print_report(rows):
+    keys = list(rows[0].keys())
+    print(" | ".join(f"{k:>16}" for k in keys))
+    for row in rows:
+        print(" | ".join(f"{str(row[k]):>16}" for k in keys))
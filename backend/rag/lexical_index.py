@@ -0,0 +1,176 @@
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+# BM25 inverted index stored next to index.faiss. Per-posting BM25 weights are
+# computed at build time, so a lookup is just gather + sum over the postings of
+# the query terms (no per-query idf / length normalisation work).
+LEXICAL_FILENAME = "lexical.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+MAX_TOKEN_CHARS = 40
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Only very common words: clinical abbreviations like "bp" or "ms" must survive
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how i if in into is it its
+me my of on or our should so than that the their them then there these they this to
+was we were what when where which who why will with you your source page
+""".split())
+
+
+def tokenize(text):
+    """
+    Lower-cased alphanumeric tokens ("HbA1c" -> "hba1c"), minus stopwords and
+    run-together garbage longer than MAX_TOKEN_CHARS.
+    """
+    return [
+        t for t in _TOKEN_RE.findall(text.lower())
+        if t not in STOPWORDS and len(t) <= MAX_TOKEN_CHARS
+    ]
+
+
+class LexicalIndex:
+    """
+    Immutable in-memory BM25 index. Postings of term j are
+    doc_ids[offsets[j]:offsets[j+1]] with their precomputed weights.
+    """
+
+    def __init__(self, terms, offsets, doc_ids, weights):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self._vocab = {term: j for j, term in enumerate(terms)}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def search(self, query, top_k=10):
+        """
+        Returns [(doc_id, score)] of the best top_k chunks, best first.
+        """
+        spans = []
+        for term in set(tokenize(query)):
+            j = self._vocab.get(term)
+            if j is not None:
+                spans.append((int(self.offsets[j]), int(self.offsets[j + 1])))
+        if not spans:
+            return []
+
+        if len(spans) == 1:
+            start, end = spans[0]
+            ids, scores = self.doc_ids[start:end], self.weights[start:end]
+        else:
+            all_ids = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+            all_weights = np.concatenate([self.weights[s:e] for s, e in spans])
+            ids, inverse = np.unique(all_ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=all_weights)
+
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path):
+        """
+        Writes the index atomically (temp file + os.replace).
+        """
+        vocab = np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vocab=vocab, offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            terms = vocab.split("\n") if vocab else []
+            return cls(terms, data["offsets"], data["doc_ids"], data["weights"])
+
+
+def build_lexical_index(documents, k1=BM25_K1, b=BM25_B):
+    """
+    Builds the BM25 index over documents (str, {"text", ...} records, or None
+    for deleted slots); doc ids are positions, the same ids FAISS uses.
+    """
+    postings = {}
+    doc_lens = np.zeros(len(documents), dtype=np.float32)
+    for i, doc in enumerate(documents):
+        text = doc["text"] if isinstance(doc, dict) else doc
+        if not text:
+            continue
+        tokens = tokenize(text)
+        doc_lens[i] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            ids, tfs = postings.setdefault(term, ([], []))
+            ids.append(i)
+            tfs.append(tf)
+
+    live = doc_lens > 0
+    n_docs = int(live.sum())
+    avg_len = float(doc_lens[live].mean()) if n_docs else 1.0
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    all_ids, all_weights = [], []
+    for j, term in enumerate(terms):
+        ids = np.asarray(postings[term][0], dtype=np.int64)
+        tfs = np.asarray(postings[term][1], dtype=np.float32)
+        idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+        norm = k1 * (1 - b + b * doc_lens[ids] / avg_len)
+        all_ids.append(ids)
+        all_weights.append((idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+        offsets[j + 1] = offsets[j] + len(ids)
+
+    doc_ids = np.concatenate(all_ids) if all_ids else np.zeros(0, dtype=np.int64)
+    weights = np.concatenate(all_weights) if all_weights else np.zeros(0, dtype=np.float32)
+    return LexicalIndex(terms, offsets, doc_ids, weights)
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuses several ranked id lists: score(id) = sum 1 / (k + rank).
+    Only ranks are used, so BM25 and L2 scores never have to be calibrated.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])[:top_k]
+
+
+if __name__ == "__main__":
+    # python -m backend.rag.lexical_index [db_dir]: (re)builds lexical.npz from chunks.store
+    from .doc_store import STORE_FILENAME, MmapDocStore
+
+    default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "health_rag_db")
+    db_dir = sys.argv[1] if len(sys.argv) > 1 else default_dir
+    store = MmapDocStore(os.path.join(db_dir, STORE_FILENAME))
+    documents = list(store)
+    store.close()
+
+    start = time.perf_counter()
+    lexical = build_lexical_index(documents)
+    build_ms = (time.perf_counter() - start) * 1000
+    lexical.save(os.path.join(db_dir, LEXICAL_FILENAME))
+
+    # Lookup latency on queries made of random vocabulary terms
+    rng = np.random.default_rng(42)
+    queries = [" ".join(rng.choice(lexical.terms, 4)) for _ in range(1000)] if len(lexical) else []
+    start = time.perf_counter()
+    for q in queries:
+        lexical.search(q, 20)
+    lookup_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+    print(f"{len(lexical)} terms, {len(lexical.doc_ids)} postings over {len(documents)} chunks; "
+          f"built in {build_ms:.1f} ms, {lookup_ms:.3f} ms per 4-term lookup.")
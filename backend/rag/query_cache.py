@@ -0,0 +1,166 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """
+    Cache key for a query: case- and whitespace-insensitive.
+    """
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with a per-entry TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size=1024, ttl_s=3600):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def _put_memory(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key):
+        value = self._get_memory(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class EmbeddingCache(LRUCache):
+    """
+    LRU + TTL cache of normalized query text -> float32 embedding vector.
+    With disk_path set, vectors are also written to a small SQLite file so
+    the cache survives restarts (checked on an in-memory miss).
+    namespace (e.g. the embedding model name) keeps vectors of different models apart.
+    """
+
+    def __init__(self, max_size=1024, ttl_s=3600, disk_path=None, namespace=""):
+        super().__init__(max_size, ttl_s)
+        self.disk_path = disk_path
+        self.namespace = namespace
+        self.disk_hits = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            conn = sqlite3.connect(disk_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    namespace TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (namespace, query)
+                )
+            ''')
+            conn.commit()
+            conn.close()
+
+    def _get_disk(self, key):
+        conn = sqlite3.connect(self.disk_path)
+        try:
+            row = conn.execute(
+                'SELECT vector, created FROM query_embeddings WHERE namespace = ? AND query = ?',
+                (self.namespace, key)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] + self.ttl_s < time.time():
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def _put_disk(self, key, vector):
+        conn = sqlite3.connect(self.disk_path)
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO query_embeddings (namespace, query, vector, created) VALUES (?, ?, ?, ?)',
+                (self.namespace, key, np.asarray(vector, dtype=np.float32).tobytes(), time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, query):
+        key = normalize_query(query)
+        vector = self._get_memory(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        if self.disk_path:
+            try:
+                vector = self._get_disk(key)
+            except sqlite3.Error as e:
+                print(f"Embedding Cache Disk Error: {e}")
+                vector = None
+            if vector is not None:
+                self.disk_hits += 1
+                self.hits += 1
+                self._put_memory(key, vector)
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, query, vector):
+        key = normalize_query(query)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._put_memory(key, vector)
+        if self.disk_path:
+            try:
+                self._put_disk(key, vector)
+            except sqlite3.Error as e:
+                print(f"Embedding Cache Disk Error: {e}")
+
+    def stats(self):
+        s = super().stats()
+        s["disk_hits"] = self.disk_hits
+        s["disk_path"] = self.disk_path
+        return s
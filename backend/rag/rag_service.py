@@ -1,44 +1,307 @@
 import pickle
-import faiss
 import os
-import streamlit as st
-from sentence_transformers import SentenceTransformer
+import threading
 
-# Load FAISS index + docs (Cached to prevent reloading)
-@st.cache_resource
-def load_rag_db():
-    base_path = "data/health_rag_db"
-    index_path = os.path.join(base_path, "index.faiss")
-    docs_path = os.path.join(base_path, "index.pkl")
+import numpy as np
+
+from .chunker import format_chunk
+from .doc_store import STORE_FILENAME, MmapDocStore
+from .lexical_index import LEXICAL_FILENAME, LexicalIndex, build_lexical_index, reciprocal_rank_fusion
+from .query_cache import EmbeddingCache, LRUCache, normalize_query
+
+# faiss / sentence_transformers are imported lazily inside the loaders so that
+# importing this module (e.g. by the FastAPI worker) stays cheap.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_DIR = os.path.join(BASE_DIR, "data", "health_rag_db")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Query embedding cache (RAG_EMBED_CACHE_PATH="" keeps it memory-only)
+EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL_S = float(os.getenv("RAG_EMBED_CACHE_TTL_S", "86400"))
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE_PATH", "")
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+
+# ANN search tunables (only used when build_rag.py built an IVF / HNSW index)
+DEFAULT_NPROBE = int(os.getenv("RAG_NPROBE")) if os.getenv("RAG_NPROBE") else None
+DEFAULT_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH")) if os.getenv("RAG_EF_SEARCH") else None
+
+# "dense" (FAISS only), "lexical" (BM25 only) or "hybrid" (both, fused with RRF).
+# Dense stays the default; lexical / hybrid are opt-in and need a lexical.npz
+# from a current build_rag.py run (built at warmup otherwise).
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+DEFAULT_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "dense")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+
+
+class RagRetriever:
+    """
+    Framework-neutral retriever: owns the FAISS index, the chunk list and the
+    embedding model. Everything is loaded once on first use (or via warmup())
+    and shared by all threads; Streamlit and FastAPI both use the same instance.
+    """
+
+    def __init__(self, db_dir=DB_DIR, model_name=EMBEDDING_MODEL_NAME,
+                 embedding_cache=None, result_cache=None):
+        self.db_dir = db_dir
+        self.model_name = model_name
+        self._index = None
+        self._documents = None
+        self._lexical = None
+        self._model = None
+        self._lock = threading.Lock()
+        # normalized query -> embedding, and (normalized query, top_k, tunables, mode) -> chunk ids
+        self.embedding_cache = embedding_cache or EmbeddingCache(
+            EMBED_CACHE_SIZE, EMBED_CACHE_TTL_S, EMBED_CACHE_PATH or None, namespace=model_name
+        )
+        self.result_cache = result_cache or LRUCache(RESULT_CACHE_SIZE, EMBED_CACHE_TTL_S)
+
+    @staticmethod
+    def _read_index(index_path):
+        """
+        Opens the FAISS index memory-mapped where the index type allows it,
+        so several workers share one copy through the OS page cache.
+        """
+        import faiss
+        for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            flag = getattr(faiss, flag_name, None)
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(index_path, flag)
+            except RuntimeError:
+                pass
+        return faiss.read_index(index_path)
+
+    def load_db(self):
+        """
+        Returns (index, documents); (None, []) if the index has not been built.
+        documents is the mmap'd chunks.store when present, else the legacy index.pkl list.
+        """
+        if self._documents is not None:
+            return self._index, self._documents
+
+        with self._lock:
+            if self._documents is None:
+                index_path = os.path.join(self.db_dir, "index.faiss")
+                store_path = os.path.join(self.db_dir, STORE_FILENAME)
+                docs_path = os.path.join(self.db_dir, "index.pkl")
+
+                if not os.path.exists(index_path):
+                    return None, []
+
+                if os.path.exists(store_path):
+                    documents = MmapDocStore(store_path)
+                elif os.path.exists(docs_path):
+                    with open(docs_path, "rb") as f:
+                        documents = pickle.load(f)
+                else:
+                    return None, []
+
+                index = self._read_index(index_path)
+
+                # Publish documents last: it is the "loaded" flag for the fast path
+                self._index = index
+                self._documents = documents
+                self.result_cache.clear()
+
+        return self._index, self._documents
+
+    def load_lexical(self):
+        """
+        BM25 index written by build_rag.py next to index.faiss; built in memory
+        from the chunks if the file is missing (older builds). None without a DB.
+        """
+        if self._lexical is not None:
+            return self._lexical
+
+        index, documents = self.load_db()
+        if index is None or not documents:
+            return None
+
+        with self._lock:
+            if self._lexical is None:
+                lexical_path = os.path.join(self.db_dir, LEXICAL_FILENAME)
+                if os.path.exists(lexical_path):
+                    self._lexical = LexicalIndex.load(lexical_path)
+                else:
+                    print(f"{lexical_path} not found, building the lexical index in memory...")
+                    self._lexical = build_lexical_index(documents)
+
+        return self._lexical
+
+    def load_model(self):
+        if self._model is not None:
+            return self._model
+
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+
+        return self._model
+
+    def warmup(self):
+        """
+        Loads index + model (and the BM25 index if the default mode uses it)
+        and runs one dummy encode so the first real query does not pay for it.
+        Returns True if the index is available.
+        """
+        index, documents = self.load_db()
+        if DEFAULT_SEARCH_MODE != "dense":
+            self.load_lexical()
+        self.load_model().encode(["warmup"])
+        return index is not None and bool(documents)
 
-    if not os.path.exists(index_path) or not os.path.exists(docs_path):
-        return None, []
+    def embed_query(self, query):
+        """
+        Embedding for one query, served from the cache when possible.
+        """
+        vector = self.embedding_cache.get(query)
+        if vector is None:
+            vector = self.load_model().encode([query])[0]
+            self.embedding_cache.put(query, vector)
+        return vector
 
-    index = faiss.read_index(index_path)
-    with open(docs_path, "rb") as f:
-        documents = pickle.load(f)
-    
-    return index, documents
+    def _index_search(self, index, query_matrix, top_k, nprobe=None, ef_search=None):
+        """
+        index.search with per-call nprobe / efSearch (ignored for a flat index).
+        """
+        params = None
+        if nprobe is not None or ef_search is not None:
+            from .index_builder import search_params
+            params = search_params(index, nprobe, ef_search)
 
-# Load Model (Cached)
-@st.cache_resource
+        if params is None:
+            return index.search(query_matrix, top_k)
+        return index.search(query_matrix, top_k, params=params)
+
+    def _record(self, documents, idx):
+        if isinstance(documents, MmapDocStore):
+            record = documents.record(idx)
+        else:
+            # Legacy index.pkl: plain strings with the citation inline
+            record = {"text": documents[idx], "source": None, "page": None}
+        record["id"] = idx
+        return record
+
+    def embed_queries(self, queries):
+        """
+        (n, dim) float32 matrix for many queries; cache misses are encoded
+        together in one batched forward pass.
+        """
+        vectors = [self.embedding_cache.get(q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            encoded = self.load_model().encode([queries[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                self.embedding_cache.put(queries[i], vector)
+                vectors[i] = vector
+
+        return np.asarray(vectors, dtype=np.float32)
+
+    def search_records_many(self, queries, top_k=3, nprobe=None, ef_search=None, mode=None):
+        """
+        Batched rag search: one encode call + one FAISS search for all
+        uncached queries. Returns, per query, a list of chunk records
+        {"id", "text", "source", "page"} in rank order.
+        mode is "dense", "lexical" or "hybrid" (default RAG_SEARCH_MODE); hybrid
+        fuses the FAISS and BM25 rankings with reciprocal rank fusion.
+        """
+        queries = list(queries)
+        index, documents = self.load_db()
+
+        if index is None or not documents or not queries:
+            return [[] for _ in queries]
+
+        mode = mode or DEFAULT_SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        nprobe = DEFAULT_NPROBE if nprobe is None else nprobe
+        ef_search = DEFAULT_EF_SEARCH if ef_search is None else ef_search
+
+        keys = [(normalize_query(q), top_k, nprobe, ef_search, mode) for q in queries]
+        all_ids = [self.result_cache.get(k) for k in keys]
+        pending = [i for i, ids in enumerate(all_ids) if ids is None]
+
+        if not pending:
+            return [[self._record(documents, idx) for idx in ids] for ids in all_ids]
+
+        def valid(ids):
+            return [int(idx) for idx in ids if 0 <= idx < len(documents) and documents[idx] is not None]
+
+        n_candidates = top_k if mode == "dense" else max(top_k, HYBRID_CANDIDATES)
+
+        dense = {}
+        if mode != "lexical":
+            query_matrix = self.embed_queries([queries[i] for i in pending])
+            D, I = self._index_search(index, query_matrix, n_candidates, nprobe, ef_search)
+            dense = {i: valid(row) for i, row in zip(pending, I)}
+
+        lexical = self.load_lexical() if mode != "dense" else None
+        for i in pending:
+            if mode == "dense":
+                ids = dense[i]
+            else:
+                lexical_ids = valid(doc_id for doc_id, _ in lexical.search(queries[i], n_candidates))
+                if mode == "lexical":
+                    ids = lexical_ids[:top_k]
+                else:
+                    ids = reciprocal_rank_fusion([dense[i], lexical_ids], top_k)
+            self.result_cache.put(keys[i], ids)
+            all_ids[i] = ids
+
+        return [[self._record(documents, idx) for idx in ids] for ids in all_ids]
+
+    def search_records(self, query, top_k=3, nprobe=None, ef_search=None, mode=None):
+        return self.search_records_many([query], top_k, nprobe, ef_search, mode)[0]
+
+    def search_many(self, queries, top_k=3, nprobe=None, ef_search=None, mode=None):
+        """
+        Like search_records_many, but returns prompt-ready strings
+        ("[Source: ... | Page N] text").
+        """
+        return [
+            [format_chunk(r) for r in records]
+            for records in self.search_records_many(queries, top_k, nprobe, ef_search, mode)
+        ]
+
+    def search(self, query, top_k=3, nprobe=None, ef_search=None, mode=None):
+        return self.search_many([query], top_k, nprobe, ef_search, mode)[0]
+
+    def cache_stats(self):
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats()
+        }
+
+
+# Process-wide instance
+_RETRIEVER = None
+_RETRIEVER_LOCK = threading.Lock()
+
+def get_retriever():
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER is None:
+                _RETRIEVER = RagRetriever()
+    return _RETRIEVER
+
+# Load FAISS index + docs (kept for existing callers)
+def load_rag_db():
+    return get_retriever().load_db()
+
+# Load Model (kept for existing callers)
 def load_embedding_model():
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    return get_retriever().load_model()
 
 # Search function
-def rag_search(query, top_k=3):
-    index, documents = load_rag_db()
-    
-    if index is None or not documents:
-        return []
-
-    model = load_embedding_model()
-    query_vector = model.encode([query])
-    D, I = index.search(query_vector, top_k)
-
-    results = []
-    for idx in I[0]:
-        if idx < len(documents):
-            results.append(documents[idx])
-
-    return results
+def rag_search(query, top_k=3, nprobe=None, ef_search=None, mode=None):
+    return get_retriever().search(query, top_k, nprobe, ef_search, mode)
+
+# Batched search for many queries at once
+def rag_search_many(queries, top_k=3, nprobe=None, ef_search=None, mode=None):
+    return get_retriever().search_many(queries, top_k, nprobe, ef_search, mode)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .query_cache import normalize_query
+
+# Semantic cache of final chat answers. A question hits when an earlier one
+# with the same context fingerprint is within RESPONSE_CACHE_THRESHOLD cosine
+# similarity. Question embeddings come from the RAG retriever (same model,
+# same embedding cache), so a miss costs no extra encode for the RAG search.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "3600"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+
+
+def _temperature_band(temp):
+    if temp < 10:
+        return "cold"
+    if temp < 25:
+        return "mild"
+    if temp < 32:
+        return "warm"
+    return "hot"
+
+
+def _aqi_band(aqi):
+    if aqi <= 50:
+        return "good"
+    if aqi <= 100:
+        return "moderate"
+    return "poor"
+
+
+def _efficiency_band(efficiency):
+    # Same cut-offs as the sleep rules in the chat prompt
+    if efficiency < 80:
+        return "low"
+    if efficiency > 90:
+        return "good"
+    return "ok"
+
+
+def weather_bucket(weather):
+    """
+    Coarse weather key: temperature band, condition and AQI band.
+    """
+    if not weather:
+        return ""
+    if not isinstance(weather, dict):
+        return normalize_query(weather)
+
+    parts = []
+    temp = weather.get("temp", weather.get("temperature"))
+    if isinstance(temp, (int, float)):
+        parts.append(_temperature_band(temp))
+    if weather.get("condition"):
+        parts.append(normalize_query(weather["condition"]))
+    if isinstance(weather.get("aqi"), (int, float)):
+        parts.append(f"aqi-{_aqi_band(weather['aqi'])}")
+    return ",".join(parts)
+
+
+def context_fingerprint(risks=None, wellness=None, weather=None):
+    """
+    Coarse patient context: medical risk labels, burnout level, sleep
+    efficiency band and weather bucket. Exact vitals are left out on purpose,
+    otherwise no two questions would ever share an answer.
+    """
+    parts = []
+    for name, value in sorted((risks or {}).items()):
+        parts.append(f"{name}={normalize_query(value)}")
+
+    wellness = wellness or {}
+    burnout = wellness.get("burnout")
+    if isinstance(burnout, dict) and burnout.get("level"):
+        parts.append(f"burnout={normalize_query(burnout['level'])}")
+    sleep = wellness.get("sleep")
+    if isinstance(sleep, dict) and isinstance(sleep.get("efficiency_score"), (int, float)):
+        parts.append(f"sleep={_efficiency_band(sleep['efficiency_score'])}")
+
+    parts.append(f"weather={weather_bucket(weather)}")
+    return "|".join(parts)
+
+
+def chat_fingerprint(user=None, profile=None, weather=None, vitals=None):
+    """
+    Fingerprint used by both the Streamlit chat and /chat: the coarse context
+    plus who is asking. Answers quote the asker's age and vitals, so they are
+    only reused for the same user; without a username the exact profile and
+    vitals stand in for the identity.
+    """
+    if isinstance(profile, dict):
+        coarse = context_fingerprint(profile.get("risks"), profile.get("wellness"), weather)
+    else:
+        coarse = context_fingerprint(weather=weather)
+
+    if user:
+        return f"{coarse}|user={user}"
+    personal = json.dumps([profile, vitals], sort_keys=True, default=str)
+    return f"{coarse}|anon={hashlib.sha1(personal.encode('utf-8')).hexdigest()}"
+
+
+class SemanticResponseCache:
+    """
+    Thread-safe LRU + TTL cache of (fingerprint, question) -> answer with
+    nearest-neighbour lookup on the question embedding within a fingerprint.
+    embed_fn defaults to the shared RagRetriever.embed_query.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, ttl_s=RESPONSE_CACHE_TTL_S,
+                 threshold=RESPONSE_CACHE_THRESHOLD, embed_fn=None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.embed_fn = embed_fn
+        # (fingerprint, normalized question) -> (expires_at, unit vector, answer)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def _embed(self, question):
+        if self.embed_fn is None:
+            from .rag_service import get_retriever
+            self.embed_fn = get_retriever().embed_query
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, fingerprint="", bypass=False):
+        """
+        Cached answer for a question close enough to an earlier one, else None.
+        bypass=True always misses (and is counted separately).
+        """
+        if bypass or not RESPONSE_CACHE_ENABLED:
+            self.bypassed += 1
+            return None
+
+        key = (fingerprint, normalize_query(question))
+        now = time.time()
+
+        # 1. Exact (normalized) repeat: no embedding needed
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= now:
+                self._data.move_to_end(key)
+                self.exact_hits += 1
+                return entry[2]
+
+        # 2. Nearest cached question with the same fingerprint
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            print(f"Response Cache Error: {e}")
+            self.misses += 1
+            return None
+
+        with self._lock:
+            expired = [k for k, e in self._data.items() if e[0] < now]
+            for k in expired:
+                del self._data[k]
+
+            keys = [k for k in self._data if k[0] == fingerprint]
+            if keys:
+                scores = np.stack([self._data[k][1] for k in keys]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._data.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._data[keys[best]][2]
+
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, fingerprint="", bypass=False):
+        if bypass or not RESPONSE_CACHE_ENABLED or not answer:
+            return
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            print(f"Response Cache Error: {e}")
+            return
+        key = (fingerprint, normalize_query(question))
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_s, vector, answer)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / total, 3) if total else 0.0
+        }
+
+
+# Process-wide instance
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def get_response_cache():
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        with _RESPONSE_CACHE_LOCK:
+            if _RESPONSE_CACHE is None:
+                _RESPONSE_CACHE = SemanticResponseCache()
+    return _RESPONSE_CACHE
@@ -1,112 +1,248 @@
 import streamlit as st
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from backend.services.ml_diabetes import predict_diabetes
 from backend.services.ml_heart import predict_heart
 from backend.services.ml_stroke import predict_stroke
 from backend.services.ml_burnout import predict_burnout
 from backend.services.ml_sleep import predict_sleep_quality
 from backend.services.wearable_service import get_wearable_data
-from backend.config.defaults import DIABETES_DEFAULTS, HEART_DEFAULTS, STROKE_DEFAULTS
+from backend.services.feature_engine import get_feature_engine
+from backend.config.defaults import DIABETES_DEFAULTS, HEART_DEFAULTS, STROKE_DEFAULTS, WELLNESS_DEFAULTS
 
-def run_holistic_checkup(profile, manual_inputs_override=None):
+# Parallel mode: five models, the wearable fetch and the rolling-feature
+# lookup share one bounded pool
+CHECKUP_MAX_WORKERS = 7
+CHECKUP_DEADLINE_S = 3.0
+# Share of the deadline the wearable fetch / feature lookup may take, so the
+# wellness models always keep time to run
+CHECKUP_INPUTS_SHARE = 0.5
+
+_CHECKUP_POOL = None
+_CHECKUP_POOL_LOCK = threading.Lock()
+
+def _get_checkup_pool():
+    global _CHECKUP_POOL
+    with _CHECKUP_POOL_LOCK:
+        if _CHECKUP_POOL is None:
+            _CHECKUP_POOL = ThreadPoolExecutor(max_workers=CHECKUP_MAX_WORKERS, thread_name_prefix="checkup")
+        return _CHECKUP_POOL
+
+def _medical_inputs(profile):
+    """
+    Builds the diabetes / heart / stroke input dicts from a profile.
+    """
+    # 1. Gather Data (Safe Defaults)
+    age = int(profile.get('age', 40))
+    weight = float(profile.get('weight', 70))
+    height = float(profile.get('height', 170))
+
+    # Calculate BMI immediately as it's critical
+    bmi = round(weight / ((height/100)**2), 2)
+
+    # Defaults for medical values if not in profile (users might not know)
+    avg_glucose = 120 # Default healthy-ish
+
+    # 2. Medical Inputs Preparation
+    # We try to use profile data if available, else defaults
+    d_in = DIABETES_DEFAULTS.copy()
+    d_in.update({
+        "Age": age,
+        "BMI": bmi,
+        "Glucose": avg_glucose
+    })
+
+    h_in = HEART_DEFAULTS.copy()
+    h_in.update({"age": age})
+
+    s_in = STROKE_DEFAULTS.copy()
+    s_in.update({
+        "age": age,
+        "bmi": bmi,
+        "avg_glucose_level": avg_glucose
+        # smoking_status handling needs context, defaulting to 0 (Unknown/Never) for auto-updates
+    })
+
+    return d_in, h_in, s_in
+
+def _wellness_inputs(w_data, manual_inputs_override=None, username=None, observed=None):
+    """
+    Fuses default / rolling / manual / wearable values into the burnout + sleep inputs.
+    observed: the user's rolling features if already fetched, else read from the engine.
+    """
+    # Base manual inputs (defaults)
+    wellness_inputs = WELLNESS_DEFAULTS.copy()
+
+    # Rolling features (7-day averages, baselines, deviations) from the user's stored vitals
+    if observed is None and username:
+        observed = get_feature_engine().observed(username)
+    if observed:
+        wellness_inputs.update(observed)
+
+    # If manual overrides provided (e.g. from Form), use them
+    if manual_inputs_override:
+        wellness_inputs.update(manual_inputs_override)
+
+    # Smart Overrides from Wearable (Priority)
+    if w_data:
+         if 'sleep_duration_hours' in w_data: wellness_inputs['sleep_duration_hours'] = w_data['sleep_duration_hours']
+         if 'hrv_rmssd_ms' in w_data: wellness_inputs['hrv_rmssd_ms'] = w_data['hrv_rmssd_ms']
+         if 'spo2' in w_data: wellness_inputs['spo2_avg_pct'] = w_data['spo2']
+
+         steps = w_data.get('steps', 0)
+         if steps < 3000: wellness_inputs['activity_load'] = 20
+         elif steps < 8000: wellness_inputs['activity_load'] = 55
+         else: wellness_inputs['activity_load'] = 85
+
+    # Recalc derived
+    wellness_inputs['hrv_deviation'] = wellness_inputs['hrv_rmssd_ms'] - wellness_inputs['baseline_hrv']
+
+    return wellness_inputs
+
+def run_holistic_checkup(profile, manual_inputs_override=None, parallel=False, deadline_s=CHECKUP_DEADLINE_S,
+                         username=None):
     """
     Runs all ML models based on the current profile and optional manual inputs.
+    parallel=True fans the models out on a thread pool (see run_holistic_checkup_parallel);
+    a model that times out or fails keeps the profile's previous result, if any.
+    username: use that user's rolling wellness features instead of the defaults.
     Returns:
         tuple: (risks_dict, wellness_dict)
     """
+    if parallel:
+        risks, wellness, meta = run_holistic_checkup_parallel(profile, manual_inputs_override, deadline_s, username)
+        failed = set(meta["timed_out"]) | set(meta["errors"])
+        for results, previous in ((risks, profile.get("risks") or {}), (wellness, profile.get("wellness") or {})):
+            for name in failed & set(results) & set(previous):
+                results[name] = previous[name]
+        return risks, wellness
+
     try:
-        # 1. Gather Data (Safe Defaults)
-        age = int(profile.get('age', 40))
-        weight = float(profile.get('weight', 70))
-        height = float(profile.get('height', 170))
-        
-        # Calculate BMI immediately as it's critical
-        bmi = round(weight / ((height/100)**2), 2)
-        
-        # Defaults for medical values if not in profile (users might not know)
-        avg_glucose = 120 # Default healthy-ish
-        
-        # 2. Medical Inputs Preparation
-        # We try to use profile data if available, else defaults
-        d_in = DIABETES_DEFAULTS.copy()
-        d_in.update({
-            "Age": age, 
-            "BMI": bmi, 
-            "Glucose": avg_glucose
-        })
-        
-        h_in = HEART_DEFAULTS.copy()
-        h_in.update({"age": age})
-        
-        s_in = STROKE_DEFAULTS.copy()
-        s_in.update({
-            "age": age, 
-            "bmi": bmi, 
-            "avg_glucose_level": avg_glucose
-            # smoking_status handling needs context, defaulting to 0 (Unknown/Never) for auto-updates
-        })
-        
+        d_in, h_in, s_in = _medical_inputs(profile)
+
         # 3. Medical Predictions
         db_res = predict_diabetes(d_in)
         ht_res = predict_heart(h_in)
         st_res = predict_stroke(s_in)
-        
+
         risks = {
-            "diabetes": db_res, 
-            "heart": ht_res, 
+            "diabetes": db_res,
+            "heart": ht_res,
             "stroke": st_res
         }
 
         # 4. Wellness Inputs (Fusion)
         # Check if device is connected via session state proxy or direct check
-        # Since this runs in backend, we might not have direct access to st.session_state 
+        # Since this runs in backend, we might not have direct access to st.session_state
         # but we can check if wearable data is injected or we fetch it.
         # For this implementation, we will fetch fresh if available.
-        
+
         w_data = get_wearable_data() # This simulates fetching
-        
-        # Base manual inputs (defaults)
-        wellness_inputs = {
-            "hrv_7d_avg": 45,
-            "sleep_7d_avg": 7.0,
-            "sleep_pressure": 50,
-            "stress_score": 50,
-            "activity_load": 50,
-            "baseline_hrv": 50,
-            "hrv_deviation": 0,
-            "sleep_duration_hours": 7.0,
-            "hrv_rmssd_ms": 45,
-            "spo2_avg_pct": 98
-        }
-        
-        # If manual overrides provided (e.g. from Form), use them
-        if manual_inputs_override:
-            wellness_inputs.update(manual_inputs_override)
-            
-        # Smart Overrides from Wearable (Priority)
-        if w_data:
-             if 'sleep_duration_hours' in w_data: wellness_inputs['sleep_duration_hours'] = w_data['sleep_duration_hours']
-             if 'hrv_rmssd_ms' in w_data: wellness_inputs['hrv_rmssd_ms'] = w_data['hrv_rmssd_ms']
-             if 'spo2' in w_data: wellness_inputs['spo2_avg_pct'] = w_data['spo2']
-             
-             steps = w_data.get('steps', 0)
-             if steps < 3000: wellness_inputs['activity_load'] = 20
-             elif steps < 8000: wellness_inputs['activity_load'] = 55
-             else: wellness_inputs['activity_load'] = 85
-             
-        # Recalc derived
-        wellness_inputs['hrv_deviation'] = wellness_inputs['hrv_rmssd_ms'] - wellness_inputs['baseline_hrv']
-        
+        wellness_inputs = _wellness_inputs(w_data, manual_inputs_override, username)
+
         # 5. Wellness Predictions
         burnout_res = predict_burnout(wellness_inputs)
         sleep_res = predict_sleep_quality(wellness_inputs)
-        
+
         wellness = {
-            "burnout": burnout_res, 
+            "burnout": burnout_res,
             "sleep": sleep_res
         }
-        
+
         return risks, wellness
-        
+
     except Exception as e:
         # Fallback to avoid crashing the agent
         return {}, {}
+
+def _timed_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_holistic_checkup_parallel(profile, manual_inputs_override=None, deadline_s=CHECKUP_DEADLINE_S, username=None):
+    """
+    Same checkup as run_holistic_checkup, but diabetes / heart / stroke, the
+    wearable fetch and the user's rolling features (which may be seeded from
+    SQLite) run concurrently, followed by burnout + sleep together.
+    A model that misses the deadline is reported as "Timed Out" in its slot,
+    one that raises as "Error", instead of failing the whole checkup.
+    Note: an overrunning model keeps its pool thread until it finishes.
+    Returns:
+        tuple: (risks_dict, wellness_dict, meta) where meta holds
+               "timings_ms", "timed_out", "errors" and "total_ms".
+    """
+    start = time.perf_counter()
+    deadline = start + deadline_s
+    meta = {"timings_ms": {}, "timed_out": [], "errors": {}}
+
+    def collect(name, future, timed_out, failed, until=deadline):
+        remaining = max(0.0, until - time.perf_counter())
+        try:
+            result, elapsed = future.result(timeout=remaining)
+            meta["timings_ms"][name] = round(elapsed * 1000, 1)
+            return result
+        except FutureTimeout:
+            future.cancel()
+            meta["timed_out"].append(name)
+            return timed_out
+        except Exception as e:
+            meta["errors"][name] = str(e)
+            return failed
+
+    try:
+        d_in, h_in, s_in = _medical_inputs(profile)
+    except Exception as e:
+        meta["errors"]["inputs"] = str(e)
+        return {}, {}, meta
+
+    pool = _get_checkup_pool()
+
+    # 1. Medical models and wearable fetch are independent
+    f_diabetes = pool.submit(_timed_call, predict_diabetes, d_in)
+    f_heart = pool.submit(_timed_call, predict_heart, h_in)
+    f_stroke = pool.submit(_timed_call, predict_stroke, s_in)
+    f_wearable = pool.submit(_timed_call, get_wearable_data)
+    f_features = pool.submit(_timed_call, get_feature_engine().observed, username) if username else None
+
+    # 2. Wellness models need the wearable data and rolling features; fall
+    # back to manual inputs / defaults without them (assembly itself is dict work)
+    inputs_deadline = start + deadline_s * CHECKUP_INPUTS_SHARE
+    w_data = collect("wearable", f_wearable, None, None, inputs_deadline)
+    observed = collect("features", f_features, {}, {}, inputs_deadline) if f_features is not None else {}
+    wellness_inputs = _wellness_inputs(w_data, manual_inputs_override, observed=observed)
+
+    f_burnout = pool.submit(_timed_call, predict_burnout, wellness_inputs)
+    f_sleep = pool.submit(_timed_call, predict_sleep_quality, wellness_inputs)
+
+    # 3. Gather everything against the same deadline
+    risks = {
+        "diabetes": collect("diabetes", f_diabetes, "Timed Out", "Error"),
+        "heart": collect("heart", f_heart, "Timed Out", "Error"),
+        "stroke": collect("stroke", f_stroke, "Timed Out", "Error")
+    }
+
+    wellness = {
+        "burnout": collect("burnout", f_burnout, {
+            "score": 0,
+            "level": "Timed Out",
+            "color": "gray",
+            "explanation": "Burnout model did not respond in time."
+        }, {
+            "score": 0,
+            "level": "Error",
+            "color": "gray",
+            "explanation": "Burnout model failed."
+        }),
+        "sleep": collect("sleep", f_sleep, {
+            "efficiency_score": 0,
+            "factors": ["Sleep model did not respond in time."]
+        }, {
+            "efficiency_score": 0,
+            "factors": ["Sleep model failed."]
+        })
+    }
+
+    meta["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return risks, wellness, meta
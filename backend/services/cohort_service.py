@@ -0,0 +1,139 @@
+# services/cohort_service.py
+
+import itertools
+import numpy as np
+import pandas as pd
+
+from config.defaults import WELLNESS_DEFAULTS
+from .ml_diabetes import predict_diabetes_batch
+from .ml_heart import predict_heart_batch
+from .ml_stroke import predict_stroke_batch
+from .ml_burnout import predict_burnout_batch
+from .ml_sleep import predict_sleep_quality_batch
+
+COHORT_CHUNK_SIZE = 2000
+
+# Same fallbacks run_holistic_checkup uses for a single profile
+PROFILE_DEFAULTS = {"age": 40, "weight": 70, "height": 170}
+AVG_GLUCOSE_DEFAULT = 120
+
+
+def _row(row, id_field):
+    # (id, profile) pairs, e.g. from database.iter_profiles(): id goes in id_field
+    if isinstance(row, tuple) and len(row) == 2 and isinstance(row[1], dict):
+        return {**row[1], id_field: row[0]}
+    return row
+
+
+def _iter_chunks(profiles, chunk_size, id_field="username"):
+    """
+    Yields DataFrame chunks of at most chunk_size rows, without materializing
+    the whole cohort unless it was handed over as a DataFrame already.
+    """
+    if isinstance(profiles, pd.DataFrame):
+        for start in range(0, len(profiles), chunk_size):
+            yield profiles.iloc[start:start + chunk_size].reset_index(drop=True)
+        return
+
+    # pyarrow.Table (to_batches) or RecordBatchReader (iterable of batches)
+    if hasattr(profiles, "to_batches"):
+        for batch in profiles.to_batches(max_chunksize=chunk_size):
+            yield batch.to_pandas()
+        return
+    if hasattr(profiles, "read_next_batch"):
+        for batch in profiles:
+            yield batch.to_pandas()
+        return
+
+    it = iter(profiles)
+    while True:
+        rows = [_row(row, id_field) for row in itertools.islice(it, chunk_size)]
+        if not rows:
+            return
+        yield pd.DataFrame(rows)
+
+
+def _numeric_column(df, name, default):
+    if name not in df.columns:
+        return pd.Series(default, index=df.index, dtype=float)
+    return pd.to_numeric(df[name], errors="coerce").fillna(default).astype(float)
+
+
+def build_cohort_inputs(chunk):
+    """
+    Vectorized equivalent of the input preparation in run_holistic_checkup.
+    Returns a dict of model name -> DataFrame of model inputs (one row per profile).
+    Wellness columns present on the profile (e.g. stress_score) are used,
+    otherwise WELLNESS_DEFAULTS apply; no live wearable fetch is done per user.
+    """
+    age = _numeric_column(chunk, "age", PROFILE_DEFAULTS["age"]).astype(int)
+    weight = _numeric_column(chunk, "weight", PROFILE_DEFAULTS["weight"])
+    height = _numeric_column(chunk, "height", PROFILE_DEFAULTS["height"])
+
+    bmi = (weight / (height / 100) ** 2).round(2)
+    glucose = np.full(len(chunk), AVG_GLUCOSE_DEFAULT)
+
+    diabetes = pd.DataFrame({"Age": age, "BMI": bmi, "Glucose": glucose})
+    heart = pd.DataFrame({"age": age})
+    stroke = pd.DataFrame({"age": age, "bmi": bmi, "avg_glucose_level": glucose})
+
+    wellness = pd.DataFrame({
+        f: _numeric_column(chunk, f, default) for f, default in WELLNESS_DEFAULTS.items()
+    })
+    # Recalc derived
+    wellness["hrv_deviation"] = wellness["hrv_rmssd_ms"] - wellness["baseline_hrv"]
+
+    return {
+        "diabetes": diabetes,
+        "heart": heart,
+        "stroke": stroke,
+        "wellness": wellness
+    }
+
+
+def _score_chunk(chunk):
+    inputs = build_cohort_inputs(chunk)
+
+    diabetes = predict_diabetes_batch(inputs["diabetes"])
+    heart = predict_heart_batch(inputs["heart"])
+    stroke = predict_stroke_batch(inputs["stroke"])
+    burnout = predict_burnout_batch(inputs["wellness"])
+    sleep = predict_sleep_quality_batch(inputs["wellness"])
+
+    return zip(diabetes, heart, stroke, burnout, sleep)
+
+
+def run_cohort_checkup(profiles, chunk_size=COHORT_CHUNK_SIZE, id_field="username"):
+    """
+    Runs the holistic checkup over a whole cohort, chunk by chunk.
+    profiles: iterable of profile dicts or (id, profile) pairs (database.iter_profiles()),
+    a pandas DataFrame or a pyarrow Table/RecordBatchReader.
+    Each model scores every chunk with one predict call; at most one chunk is
+    held in memory at a time. Yields one result per profile, in input order:
+        {"id": ..., "risks": {...}, "wellness": {...}}
+    A chunk that fails yields empty risks/wellness plus "error" for its rows.
+    """
+    offset = 0
+    for chunk in _iter_chunks(profiles, chunk_size, id_field):
+        # Rows without an id fall back to their position in the cohort
+        positions = range(offset, offset + len(chunk))
+        if id_field in chunk.columns:
+            ids = [uid if pd.notna(uid) else pos for uid, pos in zip(chunk[id_field].tolist(), positions)]
+        else:
+            ids = list(positions)
+        offset += len(chunk)
+
+        try:
+            scored = list(_score_chunk(chunk))
+        except Exception as e:
+            print(f"Cohort Chunk Error: {e}")
+            for uid in ids:
+                yield {"id": uid, "risks": {}, "wellness": {}, "error": str(e)}
+            continue
+
+        for uid, (db_res, ht_res, st_res, burnout_res, sleep_res) in zip(ids, scored):
+            yield {
+                "id": uid,
+                "risks": {"diabetes": db_res, "heart": ht_res, "stroke": st_res},
+                "wellness": {"burnout": burnout_res, "sleep": sleep_res}
+            }
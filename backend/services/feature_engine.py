@@ -0,0 +1,386 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from .ml_burnout import FEATURE_ORDER
+from .ml_sleep import FEATURE_NAMES, default_features
+from .vitals_store import insert_vitals, latest_vitals_ts, reading_samples, user_daily_rollups
+
+# Streaming rolling features for the burnout / sleep models. Every wearable
+# sample updates per-user state in O(1): day-binned windows keep running
+# sums (7-day HRV mean, 7-day mean of nightly sleep, today's HR / SpO2) and
+# time-aware EWMAs keep the HRV / resting-HR baselines. Feature vectors are
+# read straight from that state; a user seen for the first time is seeded
+# from the vitals store's daily rollups (O(days), not raw samples), and
+# re-seeded when the store has newer samples (written by another process,
+# e.g. the API vs the Streamlit app) or the state is FEATURE_REFRESH_S old.
+FEATURE_DAYS = 7
+BASELINE_HALF_LIFE_DAYS = 14.0
+# Days of daily rollups read when a user is first seen
+SEED_DAYS = 28
+SLEEP_NEED_HOURS = 8.0
+# sleep_pressure points per hour of average nightly sleep debt (50 = no debt)
+SLEEP_PRESSURE_PER_HOUR = 15.0
+# Users kept in memory (least recently used dropped, re-seeded on next use)
+FEATURE_ENGINE_MAX_USERS = int(os.getenv("FEATURE_ENGINE_MAX_USERS", "10000"))
+# Full re-seed interval, and how often the store is asked for newer samples
+FEATURE_REFRESH_S = float(os.getenv("FEATURE_REFRESH_S", "600"))
+FEATURE_CHECK_S = float(os.getenv("FEATURE_CHECK_S", "30"))
+
+
+def _day_number(ts):
+    return datetime.fromtimestamp(ts).date().toordinal()
+
+
+def activity_load_from_steps(steps):
+    # Same bands as the wearable override in _wellness_inputs
+    if steps < 3000:
+        return 20
+    if steps < 8000:
+        return 55
+    return 85
+
+
+class DailyWindow:
+    """
+    Mean over the last `days` calendar days with O(1) updates: a ring of
+    per-day (sum, count) bins plus running totals. reduce="last" keeps one
+    value per day (the one with the latest ts), e.g. a nightly sleep duration.
+    """
+
+    def __init__(self, days, reduce="mean"):
+        self.days = days
+        self.reduce = reduce
+        self._sums = [0.0] * days
+        self._counts = [0] * days
+        self._last_ts = [None] * days
+        self._day = None
+        self.total = 0.0
+        self.count = 0
+
+    def _advance(self, day):
+        if self._day is None:
+            self._day = day
+            return
+        # Clear the bins of the days skipped over (at most `days` of them)
+        for d in range(self._day + 1, min(day, self._day + self.days) + 1):
+            i = d % self.days
+            self.total -= self._sums[i]
+            self.count -= self._counts[i]
+            self._sums[i], self._counts[i], self._last_ts[i] = 0.0, 0, None
+        if day > self._day + self.days:
+            # Whole window expired: also drops accumulated float error
+            self._sums, self._counts = [0.0] * self.days, [0] * self.days
+            self._last_ts = [None] * self.days
+            self.total, self.count = 0.0, 0
+        self._day = day
+
+    def add(self, day, value, count=1, ts=None):
+        """
+        Adds a value (or a pre-aggregated sum of `count` values) to a day.
+        Samples older than the window are dropped; with reduce="last", so is
+        a value older (by ts) than the one the day already holds.
+        """
+        if self._day is not None and day <= self._day - self.days:
+            return
+        if self._day is None or day > self._day:
+            self._advance(day)
+        i = day % self.days
+        if self.reduce == "last":
+            if ts is not None and self._last_ts[i] is not None and ts < self._last_ts[i]:
+                return
+            self._last_ts[i] = ts
+            self.total -= self._sums[i]
+            self.count -= self._counts[i]
+            self._sums[i], self._counts[i] = 0.0, 0
+            value, count = value / count, 1
+        self._sums[i] += value
+        self._counts[i] += count
+        self.total += value
+        self.count += count
+
+    def mean(self, today=None):
+        if today is not None and self._day is not None and today > self._day:
+            self._advance(today)
+        return self.total / self.count if self.count else None
+
+
+class Ewma:
+    """
+    Time-aware exponentially weighted mean: weight of a sample halves every
+    half_life_s. Kept as decayed sum / decayed weight, so the first sample
+    carries no extra weight (no start-up bias).
+    """
+
+    def __init__(self, half_life_s):
+        self.tau = half_life_s / math.log(2)
+        self._sum = 0.0
+        self._weight = 0.0
+        self._ts = None
+
+    @property
+    def value(self):
+        return self._sum / self._weight if self._weight else None
+
+    def add(self, ts, value, weight=1.0):
+        if self._ts is not None and ts > self._ts:
+            decay = math.exp(-(ts - self._ts) / self.tau)
+            self._sum *= decay
+            self._weight *= decay
+            self._ts = ts
+        elif self._ts is not None:
+            # Late sample: discount it instead of the state
+            weight *= math.exp(-(self._ts - ts) / self.tau)
+        else:
+            self._ts = ts
+        self._sum += weight * value
+        self._weight += weight
+
+
+class UserFeatureState:
+    """
+    Rolling state of one user; update() is O(1) per sample.
+    """
+
+    def __init__(self):
+        self.hrv_7d = DailyWindow(FEATURE_DAYS)
+        self.sleep_7d = DailyWindow(FEATURE_DAYS, reduce="last")
+        self.hr_today = DailyWindow(1)
+        self.spo2_today = DailyWindow(1)
+        self.baseline_hrv = Ewma(BASELINE_HALF_LIFE_DAYS * 86400)
+        self.baseline_rhr = Ewma(BASELINE_HALF_LIFE_DAYS * 86400)
+        self.latest = {}
+        self._latest_ts = {}
+        self.last_ts = None
+
+    def _set_latest(self, ts, metric, value):
+        if ts >= self._latest_ts.get(metric, float("-inf")):
+            self.latest[metric] = value
+            self._latest_ts[metric] = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+    def update(self, ts, values):
+        day = _day_number(ts)
+        if values.get("hrv_rmssd_ms") is not None:
+            self.hrv_7d.add(day, values["hrv_rmssd_ms"])
+            self.baseline_hrv.add(ts, values["hrv_rmssd_ms"])
+        if values.get("resting_heart_rate") is not None:
+            self.baseline_rhr.add(ts, values["resting_heart_rate"])
+        if values.get("sleep_duration_hours") is not None:
+            self.sleep_7d.add(day, values["sleep_duration_hours"], ts=ts)
+        if values.get("heart_rate") is not None:
+            self.hr_today.add(day, values["heart_rate"])
+        if values.get("spo2") is not None:
+            self.spo2_today.add(day, values["spo2"])
+        for metric, value in values.items():
+            if value is not None:
+                self._set_latest(ts, metric, value)
+
+    def seed_day(self, day, metric, n, total, last, last_ts):
+        """
+        Folds one daily rollup row (from the vitals store) into the state.
+        """
+        ts = datetime.combine(date.fromordinal(day), datetime.min.time()).timestamp() + 43200
+        if metric == "hrv_rmssd_ms":
+            self.hrv_7d.add(day, total, n)
+            self.baseline_hrv.add(ts, total / n, n)
+        elif metric == "resting_heart_rate":
+            self.baseline_rhr.add(ts, total / n, n)
+        elif metric == "sleep_duration_hours":
+            self.sleep_7d.add(day, last, ts=last_ts)
+        elif metric == "heart_rate":
+            self.hr_today.add(day, total, n)
+        elif metric == "spo2":
+            self.spo2_today.add(day, total, n)
+        self._set_latest(last_ts, metric, last)
+
+    def observed(self, now=None):
+        """
+        Features backed by data (missing ones left out).
+        """
+        today = _day_number(now if now is not None else time.time())
+        latest = self.latest
+        out = {}
+
+        hrv_7d = self.hrv_7d.mean(today)
+        sleep_7d = self.sleep_7d.mean(today)
+        hr_today = self.hr_today.mean(today)
+        spo2_today = self.spo2_today.mean(today)
+        if hrv_7d is not None:
+            out["hrv_7d_avg"] = round(hrv_7d, 2)
+        if sleep_7d is not None:
+            out["sleep_7d_avg"] = round(sleep_7d, 2)
+            debt = SLEEP_NEED_HOURS - sleep_7d
+            out["sleep_pressure"] = round(min(100.0, max(0.0, 50 + SLEEP_PRESSURE_PER_HOUR * debt)), 1)
+        if self.baseline_hrv.value is not None:
+            out["baseline_hrv"] = round(self.baseline_hrv.value, 2)
+        if self.baseline_rhr.value is not None:
+            out["baseline_rhr"] = round(self.baseline_rhr.value, 2)
+        if hr_today is not None:
+            out["avg_hr_day_bpm"] = round(hr_today, 1)
+        if spo2_today is not None:
+            out["spo2_avg_pct"] = round(spo2_today, 1)
+
+        for feature, key in (("hrv_rmssd_ms", "hrv_rmssd_ms"), ("resting_hr_bpm", "resting_heart_rate"),
+                             ("stress_score", "stress_score"), ("sleep_duration_hours", "sleep_duration_hours")):
+            if key in latest:
+                out[feature] = latest[key]
+        if "steps" in latest:
+            out["activity_load"] = activity_load_from_steps(latest["steps"])
+
+        if "hrv_rmssd_ms" in out and "baseline_hrv" in out:
+            out["hrv_deviation"] = round(out["hrv_rmssd_ms"] - out["baseline_hrv"], 2)
+        if "resting_hr_bpm" in out and "baseline_rhr" in out:
+            out["rhr_deviation"] = round(out["resting_hr_bpm"] - out["baseline_rhr"], 2)
+        return out
+
+
+class _UserEntry:
+    """
+    One user's state plus its own lock: seeding / refreshing (SQLite) and
+    updates of one user never block the others.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.state = None
+        self.seeded_at = 0.0
+        self.checked_at = 0.0
+
+
+class FeatureEngine:
+    """
+    Thread-safe LRU map of username -> UserFeatureState (at most max_users).
+    """
+
+    def __init__(self, seed_from_store=True, max_users=FEATURE_ENGINE_MAX_USERS):
+        self.seed_from_store = seed_from_store
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, username):
+        """
+        The user's entry with a seeded, fresh-enough state. The global lock
+        only guards the map; store reads happen under the user's lock.
+        """
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is None:
+                entry = self._users[username] = _UserEntry()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(username)
+
+        with entry.lock:
+            now = time.monotonic()
+            if entry.state is None or (self.seed_from_store and now - entry.seeded_at >= FEATURE_REFRESH_S):
+                self._reseed(username, entry, now)
+            elif self.seed_from_store and now - entry.checked_at >= FEATURE_CHECK_S:
+                entry.checked_at = now
+                if self._store_is_newer(username, entry.state):
+                    self._reseed(username, entry, now)
+        return entry
+
+    def _seed_start(self):
+        return date.today() - timedelta(days=SEED_DAYS - 1)
+
+    def _reseed(self, username, entry, now):
+        # Caller holds entry.lock
+        state = UserFeatureState()
+        if self.seed_from_store:
+            try:
+                for metric, day, n, total, _, _, last, last_ts in user_daily_rollups(username, self._seed_start(), date.today()):
+                    state.seed_day(date.fromisoformat(day).toordinal(), metric, n, total, last, last_ts)
+            except Exception as e:
+                print(f"Feature Engine Seed Error: {e}")
+                if entry.state is not None:
+                    return  # keep the state we have
+        entry.state = state
+        entry.seeded_at = entry.checked_at = now
+
+    def _store_is_newer(self, username, state):
+        try:
+            latest = latest_vitals_ts(username, self._seed_start())
+        except Exception as e:
+            print(f"Feature Engine Seed Error: {e}")
+            return False
+        return latest is not None and (state.last_ts is None or latest > state.last_ts)
+
+    def ingest(self, username, write):
+        """
+        Runs write() -> [(ts, {metric: value})] actually stored, and applies
+        those samples, under the user's lock: a first-seen user is seeded
+        before the write, and a re-seed cannot interleave and count them twice.
+        """
+        entry = self._entry(username)
+        with entry.lock:
+            stored = write()
+            for ts, values in stored:
+                entry.state.update(float(ts), values)
+        return stored
+
+    def update(self, username, ts, values):
+        entry = self._entry(username)
+        with entry.lock:
+            entry.state.update(float(ts), values)
+
+    def observed(self, username, now=None):
+        entry = self._entry(username)
+        with entry.lock:
+            return entry.state.observed(now)
+
+    def features(self, username, overrides=None, now=None):
+        """
+        Full model input dict: default_features() < rolling features < overrides.
+        """
+        features = default_features()
+        features.update(self.observed(username, now))
+        if overrides:
+            features.update(overrides)
+        return features
+
+    def burnout_vector(self, username, overrides=None):
+        features = self.features(username, overrides)
+        return [features[f] for f in FEATURE_ORDER]
+
+    def sleep_vector(self, username, overrides=None):
+        features = self.features(username, overrides)
+        return [features[f] for f in FEATURE_NAMES]
+
+
+# Process-wide instance
+_FEATURE_ENGINE = None
+_FEATURE_ENGINE_LOCK = threading.Lock()
+
+def get_feature_engine():
+    global _FEATURE_ENGINE
+    if _FEATURE_ENGINE is None:
+        with _FEATURE_ENGINE_LOCK:
+            if _FEATURE_ENGINE is None:
+                _FEATURE_ENGINE = FeatureEngine()
+    return _FEATURE_ENGINE
+
+
+def observe_vitals(username, samples):
+    """
+    Stores a batch in the vitals store and feeds it to the feature engine.
+    samples: [(ts, {metric: value})] as for record_vitals; returns the
+    number of samples stored.
+    """
+    # Only what the store kept reaches the engine: retried / duplicate
+    # samples are counted once, as in the rollups
+    stored = get_feature_engine().ingest(username, lambda: insert_vitals(username, samples))
+    return sum(len(values) for _, values in stored)
+
+def observe_reading(username, reading, ts=None):
+    """
+    observe_vitals for one get_wearable_data() snapshot, rate-limited as in
+    vitals_store.reading_samples (safe to call on every Streamlit rerun).
+    """
+    return observe_vitals(username, reading_samples(reading, ts))
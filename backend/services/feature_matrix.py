@@ -0,0 +1,36 @@
+# services/feature_matrix.py
+
+import numpy as np
+import pandas as pd
+
+
+def to_frame(records):
+    """
+    Normalizes a batch payload into a DataFrame.
+    records: list of row dicts, a columnar dict {feature: [values]} or a DataFrame.
+    Columns of different lengths raise ValueError.
+    """
+    if isinstance(records, pd.DataFrame):
+        return records
+    if isinstance(records, dict):
+        return pd.DataFrame(records)
+    return pd.DataFrame(list(records))
+
+
+def build_feature_matrix(records, feature_order, defaults):
+    """
+    Builds the (n_rows, n_features) float matrix for a model in one vectorized pass.
+    Missing columns and missing/None cells are filled from `defaults`
+    (config/defaults.py), features not in `defaults` fall back to 0.
+    """
+    df = to_frame(records)
+    # Row count, not df.empty: rows of empty dicts have no columns but are still filled from defaults
+    if len(df) == 0:
+        return np.empty((0, len(feature_order)), dtype=float)
+
+    # Column order must match model training; unknown columns are dropped
+    df = df.reindex(columns=feature_order)
+    fill = {f: defaults.get(f, 0) for f in feature_order}
+    df = df.fillna(value=fill)
+
+    return df.to_numpy(dtype=float)
@@ -0,0 +1,169 @@
+import bisect
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Persistent geocode store: city coordinates never change, so every place
+# resolved once is kept in SQLite and answered locally (and offline) after
+# that. Rows are loaded into memory on first use; a sorted list of normalized
+# names serves prefix lookups for autocomplete.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GEOCODE_DB_PATH = os.getenv("GEOCODE_DB_PATH", os.path.join(BASE_DIR, "data", "geocode.db"))
+
+_SPACE_RE = re.compile(r"\s+")
+_COMMA_RE = re.compile(r"\s*,\s*")
+
+
+def normalize_place(name):
+    """
+    Case/whitespace-insensitive key: "  mumbai ,IN " -> "mumbai, in".
+    """
+    text = unicodedata.normalize("NFKC", str(name or "")).casefold()
+    text = _SPACE_RE.sub(" ", text).strip()
+    return _COMMA_RE.sub(", ", text).strip(", ")
+
+
+class GeocodeStore:
+    """
+    Thread-safe write-through cache of query -> {"lat", "lon", "name", "country"}.
+    Lookups never touch the disk once the table has been loaded.
+    """
+
+    def __init__(self, path=GEOCODE_DB_PATH):
+        self.path = path
+        self._places = None      # normalized query -> coords
+        self._prefix = []        # sorted (normalized name, query key)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocode (
+                query TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                country TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                created_at REAL
+            )
+        ''')
+        return conn
+
+    def _load(self):
+        # Caller holds self._lock
+        if self._places is not None:
+            return
+        self._places = {}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = self._connect()
+            rows = conn.execute("SELECT query, name, country, lat, lon FROM geocode").fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Geocode Store Error: {e}")
+            rows = []
+        for query, name, country, lat, lon in rows:
+            self._index(query, {"lat": lat, "lon": lon, "name": name, "country": country or ""})
+        self._loaded = True
+
+    @property
+    def loaded(self):
+        """
+        True once the table is in memory: get / suggest no longer touch SQLite.
+        """
+        return self._loaded
+
+    def _index(self, key, coords):
+        self._places[key] = coords
+        # Index both what was typed and the resolved name ("bombay" -> Mumbai)
+        for term in {key, normalize_place(coords["name"])}:
+            entry = (term, key)
+            i = bisect.bisect_left(self._prefix, entry)
+            if i == len(self._prefix) or self._prefix[i] != entry:
+                self._prefix.insert(i, entry)
+
+    def get(self, city_name):
+        key = normalize_place(city_name)
+        with self._lock:
+            self._load()
+            coords = self._places.get(key)
+            if coords is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(coords)
+
+    def put(self, city_name, coords):
+        key = normalize_place(city_name)
+        if not key or not coords:
+            return
+        coords = {"lat": coords["lat"], "lon": coords["lon"], "name": coords["name"], "country": coords.get("country", "")}
+        with self._lock:
+            self._load()
+            self._index(key, coords)
+        # Write-through outside the lock, so readers never wait on SQLite
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (query, name, country, lat, lon, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, coords["name"], coords["country"], coords["lat"], coords["lon"], time.time())
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            # Still cached in memory for this process
+            print(f"Geocode Store Error: {e}")
+
+    def suggest(self, prefix, limit=10):
+        """
+        Known places whose typed or resolved name starts with prefix, as
+        [{"lat", "lon", "name", "country"}], one per distinct place.
+        """
+        prefix = normalize_place(prefix)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        with self._lock:
+            self._load()
+            i = bisect.bisect_left(self._prefix, (prefix, ""))
+            while i < len(self._prefix) and len(results) < limit:
+                term, key = self._prefix[i]
+                if not term.startswith(prefix):
+                    break
+                coords = self._places[key]
+                place = (coords["name"], coords["country"])
+                if place not in seen:
+                    seen.add(place)
+                    results.append(dict(coords))
+                i += 1
+        return results
+
+    def stats(self):
+        with self._lock:
+            size = len(self._places) if self._places is not None else 0
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# Process-wide instance
+_GEOCODE_STORE = None
+_GEOCODE_STORE_LOCK = threading.Lock()
+
+def get_geocode_store():
+    global _GEOCODE_STORE
+    if _GEOCODE_STORE is None:
+        with _GEOCODE_STORE_LOCK:
+            if _GEOCODE_STORE is None:
+                _GEOCODE_STORE = GeocodeStore()
+    return _GEOCODE_STORE
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled client for every Mistral call (FastAPI /chat, Streamlit chat tab,
+# workout planner). Connections are kept alive between calls, every request has
+# connect/read timeouts, at most LLM_MAX_CONCURRENCY calls run at once per
+# process, and 429/5xx/network errors are retried with jittered backoff.
+# Point MISTRAL_API_URL at a local mock server for tests.
+MISTRAL_API_URL = os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-tiny")
+
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_READ_TIMEOUT_S = float(os.getenv("LLM_READ_TIMEOUT_S", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when the completion API fails for good (non-retryable status or
+    retries exhausted). status_code is None for network errors.
+    """
+
+    def __init__(self, message, status_code=None, body=""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff; a numeric Retry-After header wins (capped).
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX_S)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * (2 ** attempt)))
+
+
+def build_payload(messages, model=None, **extra):
+    payload = {"model": model or MISTRAL_MODEL, "messages": messages}
+    payload.update(extra)
+    return payload
+
+
+def _headers(api_key):
+    headers = {"Content-Type": "application/json"}
+    api_key = api_key or os.getenv("MISTRAL_API_KEY")
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def _content(data):
+    return data["choices"][0]["message"]["content"]
+
+
+def parse_sse_line(line):
+    """
+    Text delta of one `data: {...}` line of a streamed completion, or None
+    (blank lines, comments, [DONE], chunks without content).
+    """
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content")
+
+
+# --- SYNC (requests) ---
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_SYNC_SLOTS = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+def get_session():
+    """
+    Process-wide keep-alive session (requests' own retries are off, we retry here).
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return _SESSION
+
+
+def _send(payload, api_key=None, url=None, stream=False):
+    """
+    POST with the retry policy; returns the 200 response (body not yet read if stream).
+    Caller must hold a _SYNC_SLOTS slot.
+    """
+    url = url or MISTRAL_API_URL
+    last_error = None
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            resp = get_session().post(
+                url, headers=_headers(api_key), json=payload, stream=stream,
+                timeout=(LLM_CONNECT_TIMEOUT_S, LLM_READ_TIMEOUT_S)
+            )
+            if resp.status_code == 200:
+                return resp
+            last_error = LLMError(f"API Error {resp.status_code}: {resp.text}", resp.status_code, resp.text)
+            resp.close()
+            if resp.status_code not in RETRY_STATUS:
+                raise last_error
+            retry_after = resp.headers.get("Retry-After")
+        except requests.RequestException as e:
+            last_error = LLMError(f"Network Error: {e}")
+
+        if attempt < LLM_MAX_RETRIES:
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    raise last_error
+
+
+def post_completion(payload, api_key=None, url=None):
+    """
+    POSTs a chat-completions payload and returns the decoded JSON response.
+    """
+    with _SYNC_SLOTS:
+        return _send(payload, api_key, url).json()
+
+
+def chat_completion(messages, model=None, api_key=None, url=None, **extra):
+    """
+    Returns the assistant message text. Extra kwargs (e.g. response_format)
+    go into the request payload.
+    """
+    return _content(post_completion(build_payload(messages, model, **extra), api_key, url))
+
+
+def stream_completion(messages, model=None, api_key=None, url=None, **extra):
+    """
+    Generator of text deltas as the API streams them (SSE). Only opening the
+    stream is retried; an error after the first delta is raised as LLMError.
+    """
+    payload = build_payload(messages, model, stream=True, **extra)
+    with _SYNC_SLOTS:
+        resp = _send(payload, api_key, url, stream=True)
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                delta = parse_sse_line(line)
+                if delta:
+                    yield delta
+        except requests.RequestException as e:
+            raise LLMError(f"Stream Error: {e}")
+        finally:
+            resp.close()
+
+
+# --- ASYNC (httpx) ---
+class AsyncLLMClient:
+    """
+    httpx.AsyncClient with the same pooling / timeout / retry policy.
+    Create and use it inside one event loop (e.g. FastAPI startup), aclose() on shutdown.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, pool_size=LLM_POOL_SIZE):
+        import httpx
+
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def _send(self, payload, api_key=None, url=None, stream=False):
+        """
+        Async twin of _send(); caller must hold a slot and aclose() a streamed response.
+        """
+        url = url or MISTRAL_API_URL
+        last_error = None
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                request = self._client.build_request("POST", url, headers=_headers(api_key), json=payload)
+                resp = await self._client.send(request, stream=stream)
+                if resp.status_code == 200:
+                    return resp
+                await resp.aread()
+                await resp.aclose()
+                last_error = LLMError(f"API Error {resp.status_code}: {resp.text}", resp.status_code, resp.text)
+                if resp.status_code not in RETRY_STATUS:
+                    raise last_error
+                retry_after = resp.headers.get("Retry-After")
+            except self._httpx.HTTPError as e:
+                last_error = LLMError(f"Network Error: {e}")
+
+            if attempt < LLM_MAX_RETRIES:
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+        raise last_error
+
+    async def post_completion(self, payload, api_key=None, url=None):
+        async with self._slots:
+            resp = await self._send(payload, api_key, url)
+            return resp.json()
+
+    async def chat_completion(self, messages, model=None, api_key=None, url=None, **extra):
+        return _content(await self.post_completion(build_payload(messages, model, **extra), api_key, url))
+
+    async def stream_completion(self, messages, model=None, api_key=None, url=None, **extra):
+        """
+        Async generator of text deltas, same semantics as stream_completion().
+        """
+        payload = build_payload(messages, model, stream=True, **extra)
+        async with self._slots:
+            resp = await self._send(payload, api_key, url, stream=True)
+            try:
+                async for line in resp.aiter_lines():
+                    delta = parse_sse_line(line)
+                    if delta:
+                        yield delta
+            except self._httpx.HTTPError as e:
+                raise LLMError(f"Stream Error: {e}")
+            finally:
+                await resp.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_ASYNC_CLIENT = None
+
+
+def get_async_client():
+    """
+    Lazily created shared AsyncLLMClient; call from inside the running event loop.
+    """
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncLLMClient()
+    return _ASYNC_CLIENT
+
+
+async def close_async_client():
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.aclose()
+        _ASYNC_CLIENT = None
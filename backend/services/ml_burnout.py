@@ -1,10 +1,9 @@
 
-import joblib
 import numpy as np
-import os
 import random
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from .feature_matrix import build_feature_matrix
+from .model_registry import get_model
 
 # Feature order based on user prompt/inspection
 # hrv_7d_avg, sleep_7d_avg, sleep_pressure, stress_score, activity_load, baseline_hrv, hrv_deviation
@@ -18,15 +17,35 @@ FEATURE_ORDER = [
     "hrv_deviation"
 ]
 
+def _burnout_result(score):
+    # Determine Level
+    if score < 30:
+        level = "Low"
+        color = "green"
+        msg = "You are in a good state! Keep maintaining your balance."
+    elif score < 70:
+        level = "Medium" 
+        color = "orange"
+        msg = "Signs of fatigue detected. Consider prioritizing recovery and sleep."
+    else:
+        level = "High"
+        color = "red"
+        msg = "High risk of burnout. It is highly recommended to take a break and consult a wellness professional."
+        
+    return {
+        "score": round(score, 1),
+        "level": level,
+        "color": color,
+        "explanation": msg
+    }
+
 def predict_burnout(data):
     """
     Predicts burnout score and returns risk level + explanation.
     data: dict containing keys matching FEATURE_ORDER
     """
-    model_path = os.path.join(BASE_DIR, "models", "invisible_burnout_random_forest.pkl")
-    
     try:
-        model = joblib.load(model_path)
+        model = get_model("invisible_burnout_random_forest.pkl")
         
         # Ensure input is in correct order
         X = np.array([[data.get(f, 0) for f in FEATURE_ORDER]])
@@ -34,26 +53,7 @@ def predict_burnout(data):
         # Predict
         score = model.predict(X)[0]
         
-        # Determine Level
-        if score < 30:
-            level = "Low"
-            color = "green"
-            msg = "You are in a good state! Keep maintaining your balance."
-        elif score < 70:
-            level = "Medium" 
-            color = "orange"
-            msg = "Signs of fatigue detected. Consider prioritizing recovery and sleep."
-        else:
-            level = "High"
-            color = "red"
-            msg = "High risk of burnout. It is highly recommended to take a break and consult a wellness professional."
-            
-        return {
-            "score": round(score, 1),
-            "level": level,
-            "color": color,
-            "explanation": msg
-        }
+        return _burnout_result(score)
         
     except Exception as e:
         print(f"Burnout Model Error: {e}")
@@ -66,3 +66,17 @@ def predict_burnout(data):
             "color": "orange",
             "explanation": "Model service temporarily unavailable (Simulated Result)."
         }
+
+def predict_burnout_batch(records):
+    """
+    Scores many rows with a single model.predict.
+    records: list of row dicts, columnar dict or DataFrame (missing features -> 0).
+    Returns one result dict per row, in input order. Errors are raised, not simulated.
+    """
+    X = build_feature_matrix(records, FEATURE_ORDER, {})
+    if len(X) == 0:
+        return []
+
+    model = get_model("invisible_burnout_random_forest.pkl")
+    scores = model.predict(X)
+    return [_burnout_result(float(s)) for s in scores]
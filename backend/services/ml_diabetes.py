@@ -1,19 +1,36 @@
 # services/ml_diabetes.py
 
-import joblib, numpy as np
-import os
+import numpy as np
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from config.defaults import DIABETES_DEFAULTS
+from .feature_matrix import build_feature_matrix
+from .model_registry import get_model
+
+# Feature list matching model training (Pregnancies, Glucose, BloodPressure, SkinThickness, Insulin, BMI, DiabetesPedigreeFunction, Age)
+FEATURE_ORDER = ["Pregnancies", "Glucose", "BloodPressure", "SkinThickness", "Insulin", "BMI", "DiabetesPedigreeFunction", "Age"]
 
 def predict_diabetes(data):
-    scaler = joblib.load(os.path.join(BASE_DIR, "models", "diabetes_scaler.pkl"))
-    model = joblib.load(os.path.join(BASE_DIR, "models", "diabetes_model.pkl"))
+    scaler = get_model("diabetes_scaler.pkl")
+    model = get_model("diabetes_model.pkl")
 
-    # Feature list matching model training (Pregnancies, Glucose, BloodPressure, SkinThickness, Insulin, BMI, DiabetesPedigreeFunction, Age)
-    FEATURE_ORDER = ["Pregnancies", "Glucose", "BloodPressure", "SkinThickness", "Insulin", "BMI", "DiabetesPedigreeFunction", "Age"]
-    
     # Ensure all keys exist (defaults provided in app.py merger, but safety here)
     X = np.array([[data.get(f, 0) for f in FEATURE_ORDER]])
     X = scaler.transform(X)
 
     return "High Risk" if model.predict(X)[0] == 1 else "Low Risk"
+
+def predict_diabetes_batch(records):
+    """
+    Scores many patients with a single scaler.transform + model.predict.
+    records: list of row dicts or columnar dict {feature: [values]}.
+    Returns risk labels in input order.
+    """
+    X = build_feature_matrix(records, FEATURE_ORDER, DIABETES_DEFAULTS)
+    if len(X) == 0:
+        return []
+
+    scaler = get_model("diabetes_scaler.pkl")
+    model = get_model("diabetes_model.pkl")
+
+    preds = model.predict(scaler.transform(X))
+    return np.where(preds == 1, "High Risk", "Low Risk").tolist()
@@ -1,10 +1,10 @@
 # services/ml_heart.py
 
-import joblib
 import numpy as np
-import os
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from config.defaults import HEART_DEFAULTS
+from .feature_matrix import build_feature_matrix
+from .model_registry import get_model
 
 FEATURE_ORDER = [
     "age",
@@ -24,11 +24,8 @@ FEATURE_ORDER = [
 ]
 
 def predict_heart(data):
-    model_path = os.path.join(BASE_DIR, "models", "heart_model.pkl")
-    scaler_path = os.path.join(BASE_DIR, "models", "heart_scaler.pkl")
-
-    model = joblib.load(model_path)
-    scaler = joblib.load(scaler_path)
+    model = get_model("heart_model.pkl")
+    scaler = get_model("heart_scaler.pkl")
 
     # 🔥 ORDER-CONTROLLED INPUT
     X = np.array([[data[f] for f in FEATURE_ORDER]])
@@ -36,3 +33,19 @@ def predict_heart(data):
 
     prediction = model.predict(X)[0]
     return "High Risk" if prediction == 1 else "Low Risk"
+
+def predict_heart_batch(records):
+    """
+    Scores many patients with a single scaler.transform + model.predict.
+    records: list of row dicts or columnar dict {feature: [values]}.
+    Returns risk labels in input order.
+    """
+    X = build_feature_matrix(records, FEATURE_ORDER, HEART_DEFAULTS)
+    if len(X) == 0:
+        return []
+
+    model = get_model("heart_model.pkl")
+    scaler = get_model("heart_scaler.pkl")
+
+    preds = model.predict(scaler.transform(X))
+    return np.where(preds == 1, "High Risk", "Low Risk").tolist()
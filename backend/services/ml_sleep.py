@@ -1,12 +1,11 @@
 
-import joblib
 import numpy as np
-import os
 import pandas as pd
 from datetime import datetime
 import random
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from .feature_matrix import build_feature_matrix
+from .model_registry import get_model
 
 # Features expected by the model
 FEATURE_NAMES = [
@@ -17,16 +16,11 @@ FEATURE_NAMES = [
     'sleep_7d_avg', 'day_of_week', 'is_weekend'
 ]
 
-def predict_sleep_quality(data):
+def default_features():
     """
-    Predicts sleep efficiency and provides root-cause explanation.
-    data: dict with available metrics (will auto-fill missing with defaults)
+    Defaults represent a "average healthy" person (day fields use today's date).
     """
-    model_path = os.path.join(BASE_DIR, "models", "sleep_root_cause_lightgbm.pkl")
-    
-    # 1. Prepare Features with Defaults
-    # Defaults represent a "average healthy" person
-    features = {
+    return {
         'avg_hr_day_bpm': 75,
         'resting_hr_bpm': 60,
         'hrv_rmssd_ms': 45,
@@ -46,52 +40,66 @@ def predict_sleep_quality(data):
         'day_of_week': datetime.now().weekday(),
         'is_weekend': 1 if datetime.now().weekday() >= 5 else 0
     }
+
+def _sleep_result(features, efficiency):
+    """
+    Explainability Layer (Rule-based) on top of the predicted efficiency.
+    """
+    efficiency = min(100, max(0, efficiency)) # Clip 0-100
+    causes = []
+    
+    # Stress Check
+    if features['stress_score'] > 65:
+        causes.append("High daily stress levels may be delaying sleep onset.")
+        
+    # Recovery Check (HRV)
+    if features['hrv_deviation'] < -10 or features['hrv_rmssd_ms'] < 30:
+        causes.append("Your body needs more recovery time (low HRV detected).")
+        
+    # Sleep Duration Check
+    if features['sleep_duration_hours'] < 6:
+        causes.append("Short sleep duration is the primary factor reducing efficiency.")
+    elif features['sleep_duration_hours'] > 9:
+         causes.append("Oversleeping might be causing grogginess (sleep inertia).")
+         
+    # Activity Check
+    if features['activity_load'] < 30:
+        causes.append("Low physical activity may reduce sleep drive.")
+        
+    # Fallback explanation if good
+    if not causes:
+        if efficiency > 85:
+            causes.append("Your sleep health looks optimal! Keep it up.")
+        else:
+            causes.append("Your efficiency is slightly low, try to consistent bedtimes.")
+            
+    return {
+        "efficiency_score": round(efficiency, 1),
+        "factors": causes
+    }
+
+def predict_sleep_quality(data):
+    """
+    Predicts sleep efficiency and provides root-cause explanation.
+    data: dict with available metrics (will auto-fill missing with defaults)
+    """
+    # 1. Prepare Features with Defaults
+    features = default_features()
     
     # Update with actual data
     features.update(data)
     
     try:
-        model = joblib.load(model_path)
+        model = get_model("sleep_root_cause_lightgbm.pkl")
         
         # Create input array strictly ordered
         X = np.array([[features[f] for f in FEATURE_NAMES]])
         
         # Predict Efficiency (assume output is %)
         efficiency = model.predict(X)[0]
-        efficiency = min(100, max(0, efficiency)) # Clip 0-100
         
         # 2. Explainability Layer (Rule-based)
-        causes = []
-        
-        # Stress Check
-        if features['stress_score'] > 65:
-            causes.append("High daily stress levels may be delaying sleep onset.")
-            
-        # Recovery Check (HRV)
-        if features['hrv_deviation'] < -10 or features['hrv_rmssd_ms'] < 30:
-            causes.append("Your body needs more recovery time (low HRV detected).")
-            
-        # Sleep Duration Check
-        if features['sleep_duration_hours'] < 6:
-            causes.append("Short sleep duration is the primary factor reducing efficiency.")
-        elif features['sleep_duration_hours'] > 9:
-             causes.append("Oversleeping might be causing grogginess (sleep inertia).")
-             
-        # Activity Check
-        if features['activity_load'] < 30:
-            causes.append("Low physical activity may reduce sleep drive.")
-            
-        # Fallback explanation if good
-        if not causes:
-            if efficiency > 85:
-                causes.append("Your sleep health looks optimal! Keep it up.")
-            else:
-                causes.append("Your efficiency is slightly low, try to consistent bedtimes.")
-                
-        return {
-            "efficiency_score": round(efficiency, 1),
-            "factors": causes
-        }
+        return _sleep_result(features, efficiency)
         
     except Exception as e:
         print(f"Sleep Model Error: {e}")
@@ -99,3 +107,21 @@ def predict_sleep_quality(data):
             "efficiency_score": round(random.uniform(70, 90), 1),
             "factors": ["Model unavailable. Estimated based on general population data."]
         }
+
+def predict_sleep_quality_batch(records):
+    """
+    Scores many rows with a single model.predict.
+    records: list of row dicts, columnar dict or DataFrame (missing -> default_features()).
+    Returns one result dict per row, in input order. Errors are raised, not simulated.
+    """
+    X = build_feature_matrix(records, FEATURE_NAMES, default_features())
+    if len(X) == 0:
+        return []
+
+    model = get_model("sleep_root_cause_lightgbm.pkl")
+    efficiencies = model.predict(X)
+
+    return [
+        _sleep_result(dict(zip(FEATURE_NAMES, row)), float(eff))
+        for row, eff in zip(X, efficiencies)
+    ]
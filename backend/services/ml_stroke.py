@@ -1,19 +1,36 @@
 # services/ml_stroke.py
 
-import joblib, numpy as np
-import os
+import numpy as np
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from config.defaults import STROKE_DEFAULTS
+from .feature_matrix import build_feature_matrix
+from .model_registry import get_model
+
+# Feature list matching model training
+FEATURE_ORDER = ["gender", "age", "hypertension", "heart_disease", "ever_married", "work_type", "Residence_type", "avg_glucose_level", "bmi", "smoking_status"]
 
 def predict_stroke(data):
-    scaler = joblib.load(os.path.join(BASE_DIR, "models", "stroke_scaler.pkl"))
-    model = joblib.load(os.path.join(BASE_DIR, "models", "stroke_model.pkl"))
+    scaler = get_model("stroke_scaler.pkl")
+    model = get_model("stroke_model.pkl")
 
-    # Feature list matching model training
-    FEATURE_ORDER = ["gender", "age", "hypertension", "heart_disease", "ever_married", "work_type", "Residence_type", "avg_glucose_level", "bmi", "smoking_status"]
-    
     # Ensure all keys exist
     X = np.array([[data.get(f, 0) for f in FEATURE_ORDER]])
     X = scaler.transform(X)
 
     return "High Risk" if model.predict(X)[0] == 1 else "Low Risk"
+
+def predict_stroke_batch(records):
+    """
+    Scores many patients with a single scaler.transform + model.predict.
+    records: list of row dicts or columnar dict {feature: [values]}.
+    Returns risk labels in input order.
+    """
+    X = build_feature_matrix(records, FEATURE_ORDER, STROKE_DEFAULTS)
+    if len(X) == 0:
+        return []
+
+    scaler = get_model("stroke_scaler.pkl")
+    model = get_model("stroke_model.pkl")
+
+    preds = model.predict(scaler.transform(X))
+    return np.where(preds == 1, "High Risk", "Low Risk").tolist()
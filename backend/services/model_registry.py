@@ -0,0 +1,82 @@
+# services/model_registry.py
+
+import joblib
+import os
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+# Every artifact the predict_* services depend on (used for eager loading at startup)
+MODEL_FILES = [
+    "diabetes_model.pkl",
+    "diabetes_scaler.pkl",
+    "heart_model.pkl",
+    "heart_scaler.pkl",
+    "stroke_model.pkl",
+    "stroke_scaler.pkl",
+    "invisible_burnout_random_forest.pkl",
+    "sleep_root_cause_lightgbm.pkl"
+]
+
+# Process-wide cache: filename -> {"obj": unpickled artifact, "mtime": file mtime at load}
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+_FILE_LOCKS = {}
+
+
+def _file_lock(filename):
+    # One lock per artifact so loading the sleep model never blocks a heart prediction
+    with _REGISTRY_LOCK:
+        lock = _FILE_LOCKS.get(filename)
+        if lock is None:
+            lock = _FILE_LOCKS[filename] = threading.Lock()
+        return lock
+
+
+def get_model(filename):
+    """
+    Returns the unpickled artifact for backend/models/<filename>.
+    The file is loaded once per process and shared by all callers; if its
+    mtime changes on disk (model retrained / redeployed) it is reloaded
+    on the next call, without restarting the server.
+    """
+    path = os.path.join(MODELS_DIR, filename)
+    mtime = os.stat(path).st_mtime
+
+    entry = _REGISTRY.get(filename)
+    if entry is not None and entry["mtime"] == mtime:
+        return entry["obj"]
+
+    with _file_lock(filename):
+        # Another thread may have finished the (re)load while we waited
+        entry = _REGISTRY.get(filename)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["obj"]
+
+        obj = joblib.load(path)
+        _REGISTRY[filename] = {"obj": obj, "mtime": mtime}
+        return obj
+
+
+def preload_models():
+    """
+    Eagerly loads every known artifact (e.g. on FastAPI startup) so the
+    first request does not pay the unpickling cost.
+    Returns a dict of filename -> error message for artifacts that failed.
+    """
+    errors = {}
+    for filename in MODEL_FILES:
+        try:
+            get_model(filename)
+        except Exception as e:
+            print(f"Model Preload Error ({filename}): {e}")
+            errors[filename] = str(e)
+    return errors
+
+
+def loaded_models():
+    """
+    Snapshot of what is currently cached, for health/debug endpoints.
+    """
+    return {name: entry["mtime"] for name, entry in _REGISTRY.items()}
@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+# Per-user wearable time series. Raw samples are clustered by
+# (username, day, ts) and every batch also updates the hourly and daily
+# rollups in the same transaction, so charts (and the feature engine's
+# warm-up) read a handful of pre-aggregated rows instead of raw samples.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VITALS_DB_PATH = os.getenv("VITALS_DB_PATH", os.path.join(BASE_DIR, "data", "vitals.db"))
+VITALS_BUSY_TIMEOUT_MS = int(os.getenv("VITALS_BUSY_TIMEOUT_MS", "5000"))
+
+# Stored metric -> key in get_wearable_data() output
+METRICS = {
+    "heart_rate": "heart_rate",
+    "resting_heart_rate": "resting_heart_rate",
+    "hrv_rmssd_ms": "hrv_rmssd_ms",
+    "spo2": "spo2",
+    "steps": "steps",
+    "sleep_duration_hours": "sleep_duration_hours",
+    "sleep_efficiency": "sleep_efficiency",
+    "stress_score": "stress_score"
+}
+AGGREGATES = ("avg", "min", "max", "sum", "last", "n")
+# A get_wearable_data() snapshot is polled on every Streamlit rerun: store at
+# most one per VITALS_READING_INTERVAL_S (ts floored, repeats are duplicates)
+# and its nightly sleep summary once per day (ts = local midnight)
+VITALS_READING_INTERVAL_S = int(os.getenv("VITALS_READING_INTERVAL_S", "60"))
+DAILY_METRICS = ("sleep_duration_hours", "sleep_efficiency")
+
+_ROLLUP_COLUMNS = '''
+    metric TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    total REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    last REAL NOT NULL,
+    last_ts REAL NOT NULL
+'''
+_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS vitals_raw (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        ts REAL NOT NULL,
+        metric TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (username, day, ts, metric)
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS vitals_hourly (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        {_ROLLUP_COLUMNS},
+        PRIMARY KEY (username, day, hour, metric)
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS vitals_daily (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        {_ROLLUP_COLUMNS},
+        PRIMARY KEY (username, day, metric)
+    ) WITHOUT ROWID
+    '''
+]
+
+_SQL_INSERT_RAW = 'INSERT OR IGNORE INTO vitals_raw (username, day, ts, metric, value) VALUES (?, ?, ?, ?, ?)'
+# Merge a batch's partial aggregate into the stored one
+_MERGE = '''
+    n = n + excluded.n,
+    total = total + excluded.total,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+    last_ts = MAX(last_ts, excluded.last_ts)
+'''
+_SQL_UPSERT_HOURLY = f'''
+    INSERT INTO vitals_hourly (username, day, hour, metric, n, total, min, max, last, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (username, day, hour, metric) DO UPDATE SET {_MERGE}
+'''
+_SQL_UPSERT_DAILY = f'''
+    INSERT INTO vitals_daily (username, day, metric, n, total, min, max, last, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (username, day, metric) DO UPDATE SET {_MERGE}
+'''
+_SQL_RANGE = '''
+    SELECT ts, value FROM vitals_raw
+    WHERE username = ? AND day BETWEEN ? AND ? AND metric = ? AND ts >= ? AND ts < ?
+    ORDER BY ts
+'''
+_SQL_HOURLY = 'SELECT hour, n, total, min, max, last FROM vitals_hourly WHERE username = ? AND day = ? AND metric = ?'
+_SQL_USER_DAILY = '''
+    SELECT metric, day, n, total, min, max, last, last_ts FROM vitals_daily
+    WHERE username = ? AND day BETWEEN ? AND ?
+    ORDER BY day
+'''
+_SQL_LATEST_TS = 'SELECT MAX(last_ts) FROM vitals_daily WHERE username = ? AND day >= ?'
+_SQL_DAILY = '''
+    SELECT day, n, total, min, max, last, last_ts FROM vitals_daily
+    WHERE username = ? AND metric = ? AND day BETWEEN ? AND ?
+    ORDER BY day
+'''
+
+_local = threading.local()
+
+
+def _connect():
+    """
+    This thread's connection (WAL, same settings as database.py).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != VITALS_DB_PATH:
+        os.makedirs(os.path.dirname(VITALS_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(VITALS_DB_PATH, timeout=VITALS_BUSY_TIMEOUT_MS / 1000)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        _local.conn, _local.path = conn, VITALS_DB_PATH
+    return conn
+
+
+def _day(d):
+    return d if isinstance(d, str) else d.isoformat()
+
+
+def _value(n, total, mn, mx, last, agg):
+    if agg not in AGGREGATES:
+        raise ValueError(f"agg must be one of {AGGREGATES}")
+    if agg == "avg":
+        return total / n
+    return {"min": mn, "max": mx, "sum": total, "last": last, "n": n}[agg]
+
+
+def record_vitals(username, samples):
+    """
+    Batched insert. samples: iterable of (ts, {metric: value}) with ts in
+    epoch seconds; unknown metrics and None values are skipped, a repeated
+    (ts, metric) is ignored. Returns the number of samples stored.
+    """
+    return sum(len(values) for _, values in insert_vitals(username, samples))
+
+
+def insert_vitals(username, samples):
+    """
+    record_vitals, returning what was actually stored: [(ts, {metric: value})]
+    without the skipped values and duplicates.
+    """
+    # 1. Raw rows + per-bucket partial aggregates for this batch
+    rows = []
+    for ts, values in samples:
+        ts = float(ts)
+        moment = datetime.fromtimestamp(ts)
+        day = moment.date().isoformat()
+        for metric, value in values.items():
+            if metric in METRICS and value is not None:
+                rows.append((day, moment.hour, ts, metric, float(value)))
+
+    if not rows:
+        return []
+
+    conn = _connect()
+    hourly, daily = {}, {}
+    stored = {}
+    with conn:
+        for day, hour, ts, metric, value in rows:
+            if conn.execute(_SQL_INSERT_RAW, (username, day, ts, metric, value)).rowcount == 0:
+                continue  # duplicate sample, already counted in the rollups
+            stored.setdefault(ts, {})[metric] = value
+            for buckets, key in ((hourly, (day, hour, metric)), (daily, (day, metric))):
+                agg = buckets.get(key)
+                if agg is None:
+                    buckets[key] = [1, value, value, value, value, ts]
+                else:
+                    agg[0] += 1
+                    agg[1] += value
+                    agg[2] = min(agg[2], value)
+                    agg[3] = max(agg[3], value)
+                    if ts >= agg[5]:
+                        agg[4], agg[5] = value, ts
+
+        # 2. One upsert per touched hour / day bucket
+        conn.executemany(_SQL_UPSERT_HOURLY, [(username, *key, *agg) for key, agg in hourly.items()])
+        conn.executemany(_SQL_UPSERT_DAILY, [(username, *key, *agg) for key, agg in daily.items()])
+    return list(stored.items())
+
+
+def reading_values(reading):
+    """
+    {metric: value} of one get_wearable_data() snapshot.
+    """
+    return {metric: reading.get(key) for metric, key in METRICS.items()}
+
+
+def reading_samples(reading, ts=None):
+    """
+    Samples [(ts, {metric: value})] of one snapshot, rate-limited through
+    their timestamps: intraday metrics at ts floored to
+    VITALS_READING_INTERVAL_S, DAILY_METRICS at local midnight. A snapshot
+    repeated within the interval (or day) is then dropped as a duplicate.
+    """
+    ts = ts if ts is not None else time.time()
+    values = reading_values(reading)
+    midnight = datetime.combine(datetime.fromtimestamp(ts).date(), datetime.min.time()).timestamp()
+    interval = max(VITALS_READING_INTERVAL_S, 1)
+    intraday = {m: v for m, v in values.items() if m not in DAILY_METRICS}
+    daily = {m: v for m, v in values.items() if m in DAILY_METRICS}
+    return [(ts - ts % interval, intraday), (midnight, daily)]
+
+
+def record_reading(username, reading, ts=None):
+    """
+    Stores one get_wearable_data() snapshot (see reading_samples).
+    """
+    return record_vitals(username, reading_samples(reading, ts))
+
+
+def query_range(username, metric, start_ts, end_ts):
+    """
+    Raw samples [(ts, value)] with start_ts <= ts < end_ts.
+    """
+    first = datetime.fromtimestamp(start_ts).date().isoformat()
+    last = datetime.fromtimestamp(end_ts).date().isoformat()
+    return _connect().execute(_SQL_RANGE, (username, first, last, metric, start_ts, end_ts)).fetchall()
+
+
+def hourly_series(username, metric, day=None, agg="avg"):
+    """
+    24 values (hour 0-23) of one day's hourly rollup; None where no data.
+    """
+    day = _day(day or date.today())
+    series = [None] * 24
+    for hour, n, total, mn, mx, last in _connect().execute(_SQL_HOURLY, (username, day, metric)):
+        series[hour] = _value(n, total, mn, mx, last, agg)
+    return series
+
+
+def hourly_increments(username, metric, day=None):
+    """
+    Per-hour increase of a cumulative counter (e.g. steps) from the hourly
+    min/last rollups; None where no data, never negative (device resets).
+    """
+    day = _day(day or date.today())
+    series = [None] * 24
+    prev = None
+    for hour, n, total, mn, mx, last in sorted(_connect().execute(_SQL_HOURLY, (username, day, metric))):
+        series[hour] = max(0.0, last - (prev if prev is not None else mn))
+        prev = last
+    return series
+
+
+def daily_rollups(username, metric, start_day, end_day):
+    """
+    Raw daily rollup rows [(day, n, sum, min, max, last, last_ts)] between two days (inclusive).
+    """
+    return _connect().execute(_SQL_DAILY, (username, metric, _day(start_day), _day(end_day))).fetchall()
+
+
+def user_daily_rollups(username, start_day, end_day):
+    """
+    daily_rollups for every metric in one query: [(metric, day, n, sum, min, max, last, last_ts)], by day.
+    """
+    return _connect().execute(_SQL_USER_DAILY, (username, _day(start_day), _day(end_day))).fetchall()
+
+
+def latest_vitals_ts(username, since_day):
+    """
+    Newest sample ts stored for the user from since_day on (None if none).
+    """
+    return _connect().execute(_SQL_LATEST_TS, (username, _day(since_day))).fetchone()[0]
+
+
+def daily_series(username, metric, start_day, end_day, agg="avg"):
+    """
+    [(day, value)] of the daily rollup between two days (inclusive), days without data left out.
+    """
+    rows = daily_rollups(username, metric, start_day, end_day)
+    return [(day, _value(n, total, mn, mx, last, agg)) for day, n, total, mn, mx, last, _ in rows]
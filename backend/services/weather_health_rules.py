@@ -1,62 +1,57 @@
-def weather_health_rules(weather):
-    rules = []
-
-    temp = weather["temperature"]
-    humidity = weather["humidity"]
-    pressure = weather["pressure"]
-    aqi = weather["aqi"]
+import numpy as np
 
+# (weather field, comparison, threshold, factor, condition, effect), in the
+# order advisories are reported. Shared by the single and the bulk variant.
+HEALTH_RULES = [
     # ---- Temperature rules ----
-    if temp >= 35:
-        rules.append({
-            "factor": "temperature",
-            "condition": "high heat",
-            "effect": "Dehydration, fatigue, blood pressure drop"
-        })
-
-    if temp <= 10:
-        rules.append({
-            "factor": "temperature",
-            "condition": "cold",
-            "effect": "Blood pressure increase, heart strain"
-        })
+    ("temperature", ">=", 35, "temperature", "high heat", "Dehydration, fatigue, blood pressure drop"),
+    ("temperature", "<=", 10, "temperature", "cold", "Blood pressure increase, heart strain"),
 
     # ---- Humidity rules ----
-    if humidity >= 80:
-        rules.append({
-            "factor": "humidity",
-            "condition": "high humidity",
-            "effect": "Breathing difficulty, fatigue"
-        })
-
-    if humidity <= 30:
-        rules.append({
-            "factor": "humidity",
-            "condition": "low humidity",
-            "effect": "Dry throat, cough"
-        })
+    ("humidity", ">=", 80, "humidity", "high humidity", "Breathing difficulty, fatigue"),
+    ("humidity", "<=", 30, "humidity", "low humidity", "Dry throat, cough"),
 
     # ---- Air pressure rules ----
-    if pressure < 1000:
-        rules.append({
-            "factor": "air pressure",
-            "condition": "sudden drop",
-            "effect": "Headache, joint pain"
-        })
-
-    if pressure > 1025:
-        rules.append({
-            "factor": "air pressure",
-            "condition": "sudden rise",
-            "effect": "Blood pressure discomfort"
-        })
+    ("pressure", "<", 1000, "air pressure", "sudden drop", "Headache, joint pain"),
+    ("pressure", ">", 1025, "air pressure", "sudden rise", "Blood pressure discomfort"),
 
     # ---- Air Quality rules ----
-    if aqi >= 4:
-        rules.append({
-            "factor": "air quality",
-            "condition": "poor AQI",
-            "effect": "Asthma risk, chest tightness"
-        })
+    ("aqi", ">=", 4, "air quality", "poor AQI", "Asthma risk, chest tightness"),
+]
+
+_COMPARE = {
+    ">=": np.greater_equal,
+    "<=": np.less_equal,
+    ">": np.greater,
+    "<": np.less,
+}
+
+
+def weather_health_rules(weather):
+    rules = []
+    for field, op, threshold, factor, condition, effect in HEALTH_RULES:
+        if _COMPARE[op](weather[field], threshold):
+            rules.append({
+                "factor": factor,
+                "condition": condition,
+                "effect": effect
+            })
+    return rules
+
 
+def weather_health_rules_bulk(columns):
+    """
+    Advisories for many locations at once. columns maps each weather field
+    to an array (one value per location); returns one rule list per location.
+    """
+    n = len(columns["temperature"])
+    rules = [[] for _ in range(n)]
+    for field, op, threshold, factor, condition, effect in HEALTH_RULES:
+        hits = np.flatnonzero(_COMPARE[op](np.asarray(columns[field]), threshold))
+        for i in hits:
+            rules[i].append({
+                "factor": factor,
+                "condition": condition,
+                "effect": effect
+            })
     return rules
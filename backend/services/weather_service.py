@@ -1,174 +1,377 @@
+import asyncio
+import os
+import threading
+import time
+import numpy as np
 import requests
 from datetime import datetime
 
+from .geocode_cache import get_geocode_store
+from .weather_health_rules import weather_health_rules_bulk
+
 # OpenMeteo is free and requires no API key for non-commercial use.
+# URLs can be pointed at a local mock for tests / load tests.
+GEOCODING_URL = os.getenv("OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_URL = os.getenv("OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+WEATHER_TIMEOUT_S = float(os.getenv("WEATHER_TIMEOUT_S", "10"))
+
+# Forecast cache: keyed on coordinates rounded to WEATHER_CACHE_DECIMALS
+# (2 = ~1 km). Entries are fresh until the next full hour (the hourly forecast
+# cadence, and the hourly slice depends on the current hour), at most
+# WEATHER_CACHE_TTL_S; after that they are only served if the upstream fails,
+# for up to WEATHER_STALE_MAX_S. Concurrent misses for a key share one request.
+WEATHER_CACHE_DECIMALS = int(os.getenv("WEATHER_CACHE_DECIMALS", "2"))
+WEATHER_CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL_S", "3600"))
+WEATHER_STALE_MAX_S = float(os.getenv("WEATHER_STALE_MAX_S", "21600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "1024"))
+
+_FORECAST_CACHE = {}            # key -> (fresh_until, stale_until, forecast)
+_FORECAST_INFLIGHT = {}         # key -> threading.Event of the sync request in flight
+_FORECAST_INFLIGHT_ASYNC = {}   # key -> asyncio.Event of the async request in flight
+_FORECAST_LOCK = threading.Lock()
+_FORECAST_STATS = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0, "errors": 0}
+
+# Locations per multi-location request in get_weather_bulk (keeps URLs short)
+WEATHER_BULK_BATCH = int(os.getenv("WEATHER_BULK_BATCH", "100"))
+
+_ASYNC_HTTP = None
+
+def get_async_http():
+    """
+    Shared httpx.AsyncClient (keep-alive pool) for the async variants below.
+    Create / use inside the running event loop; close_async_http() on shutdown.
+    """
+    global _ASYNC_HTTP
+    if _ASYNC_HTTP is None:
+        import httpx
+        _ASYNC_HTTP = httpx.AsyncClient(timeout=WEATHER_TIMEOUT_S)
+    return _ASYNC_HTTP
+
+async def close_async_http():
+    global _ASYNC_HTTP
+    if _ASYNC_HTTP is not None:
+        await _ASYNC_HTTP.aclose()
+        _ASYNC_HTTP = None
+
+def _geocoding_params(city_name):
+    return {"name": city_name, "count": 1, "language": "en", "format": "json"}
+
+def _parse_coordinates(res):
+    if "results" in res and len(res["results"]) > 0:
+        data = res["results"][0]
+        return {
+            "lat": data["latitude"], 
+            "lon": data["longitude"], 
+            "name": data["name"], 
+            "country": data.get("country", "")
+        }
+    return None
 
 def get_coordinates(city_name):
     """
     Fetch latitude and longitude for a given city name.
+    Places resolved before come from the local geocode store (no network).
     """
+    store = get_geocode_store()
+    coords = store.get(city_name)
+    if coords is not None:
+        return coords
     try:
-        url = f"https://geocoding-api.open-meteo.com/v1/search?name={city_name}&count=1&language=en&format=json"
-        res = requests.get(url).json()
-        
-        if "results" in res and len(res["results"]) > 0:
-            data = res["results"][0]
-            return {
-                "lat": data["latitude"], 
-                "lon": data["longitude"], 
-                "name": data["name"], 
-                "country": data.get("country", "")
-            }
+        res = requests.get(GEOCODING_URL, params=_geocoding_params(city_name), timeout=WEATHER_TIMEOUT_S).json()
+        coords = _parse_coordinates(res)
+        store.put(city_name, coords)
+        return coords
+    except Exception as e:
+        print(f"Geocoding Error: {e}")
         return None
+
+async def async_get_coordinates(city_name):
+    """
+    Async get_coordinates (httpx). The geocode store's SQLite work (first
+    load, write-through on a miss) runs in a worker thread.
+    """
+    store = get_geocode_store()
+    coords = store.get(city_name) if store.loaded else await asyncio.to_thread(store.get, city_name)
+    if coords is not None:
+        return coords
+    try:
+        resp = await get_async_http().get(GEOCODING_URL, params=_geocoding_params(city_name))
+        coords = _parse_coordinates(resp.json())
+        await asyncio.to_thread(store.put, city_name, coords)
+        return coords
     except Exception as e:
         print(f"Geocoding Error: {e}")
         return None
 
-def get_weather_forecast(lat, lon):
+def suggest_locations(prefix, limit=10):
     """
-    Fetch comprehensive weather data: current, daily forecast, and hourly forecast.
+    Autocomplete over places already resolved (local only).
     """
+    return get_geocode_store().suggest(prefix, limit)
+
+def _forecast_params(lat, lon):
+    # Request parameters for OpenMeteo
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "current": "temperature_2m,relative_humidity_2m,apparent_temperature,is_day,weather_code,surface_pressure,wind_speed_10m",
+        "hourly": "temperature_2m,weather_code,wind_speed_10m",
+        "daily": "weather_code,temperature_2m_max,temperature_2m_min,sunrise,sunset,uv_index_max",
+        "timezone": "auto",
+        "forecast_days": 6  # 5 days + today
+    }
+
+# Helper for WMO codes
+def get_desc(code):
+    # Simple WMO code mapping
+    if code == 0: return "Clear Sky", "☀️"
+    if code in [1,2,3]: return "Partly Cloudy", "⛅"
+    if code in [45,48]: return "Foggy", "🌫️"
+    if code in [51,53,55]: return "Drizzle", "🌦️"
+    if code in [61,63,65]: return "Rain", "🌧️"
+    if code in [71,73,75]: return "Snow", "❄️"
+    if code in [80,81,82]: return "Showers", "🌧️"
+    if code in [95,96,99]: return "Thunderstorm", "⛈️"
+    return "Unknown", "❓"
+
+# WMO codes are 0-99: condition label per code, for array lookups
+_WMO_CONDITIONS = np.array([get_desc(code)[0] for code in range(100)] + ["Unknown"], dtype=object)
+
+def parse_forecast(res):
+    """
+    Turns a raw OpenMeteo forecast response into current, daily forecast, and hourly forecast.
+    """
+    # Process Current
+    curr = res["current"]
+    daily = res["daily"]
+    hourly = res["hourly"]
+
+    def safe_round(val):
+        try:
+            if val is None: return 0
+            return round(val)
+        except: return 0
+
+    desc, icon = get_desc(curr.get("weather_code", 0))
+    
+    # Format Sunrise/Sunset (ISO string to time)
     try:
-        # Request parameters for OpenMeteo
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "current": "temperature_2m,relative_humidity_2m,apparent_temperature,is_day,weather_code,surface_pressure,wind_speed_10m",
-            "hourly": "temperature_2m,weather_code,wind_speed_10m",
-            "daily": "weather_code,temperature_2m_max,temperature_2m_min,sunrise,sunset,uv_index_max",
-            "timezone": "auto",
-            "forecast_days": 6  # 5 days + today
-        }
-        
-        url = "https://api.open-meteo.com/v1/forecast"
-        res = requests.get(url, params=params).json()
-        
-        # Process Current
-        curr = res["current"]
-        daily = res["daily"]
-        hourly = res["hourly"]
-        
-        # Helper for WMO codes
-        def get_desc(code):
-            # Simple WMO code mapping
-            if code == 0: return "Clear Sky", "☀️"
-            if code in [1,2,3]: return "Partly Cloudy", "⛅"
-            if code in [45,48]: return "Foggy", "🌫️"
-            if code in [51,53,55]: return "Drizzle", "🌦️"
-            if code in [61,63,65]: return "Rain", "🌧️"
-            if code in [71,73,75]: return "Snow", "❄️"
-            if code in [80,81,82]: return "Showers", "🌧️"
-            if code in [95,96,99]: return "Thunderstorm", "⛈️"
-            return "Unknown", "❓"
-
-        def safe_round(val):
-            try:
-                if val is None: return 0
-                return round(val)
-            except: return 0
+        sunrise = datetime.fromisoformat(daily["sunrise"][0]).strftime("%I:%M %p")
+        sunset = datetime.fromisoformat(daily["sunset"][0]).strftime("%I:%M %p")
+    except:
+        sunrise = "06:00 AM"
+        sunset = "06:00 PM"
 
-        desc, icon = get_desc(curr.get("weather_code", 0))
-        
-        # Format Sunrise/Sunset (ISO string to time)
+    # Construct Data Object
+    weather_data = {
+        "current": {
+            "temp": safe_round(curr.get("temperature_2m")),
+            "feels_like": safe_round(curr.get("apparent_temperature")),
+            "humidity": curr.get("relative_humidity_2m", 0),
+            "wind_speed": curr.get("wind_speed_10m", 0),
+            "pressure": curr.get("surface_pressure", 1000),
+            "uv": daily.get("uv_index_max", [0])[0], 
+            "sunrise": sunrise,
+            "sunset": sunset,
+            "condition": desc,
+            "icon": icon,
+            "is_day": curr.get("is_day", 1)
+        },
+        "daily": [],
+        "hourly": []
+    }
+    
+    # Process Daily (Next 5 days)
+    d_codes = daily.get("weather_code", [])
+    d_times = daily.get("time", [])
+    d_max = daily.get("temperature_2m_max", [])
+    d_min = daily.get("temperature_2m_min", [])
+    
+    # Check lengths to be safe
+    max_daily_idx = min(len(d_times), len(d_codes), len(d_max), len(d_min), 6)
+    
+    for i in range(1, max_daily_idx): # Start from 1 (tomorrow) up to available
+        d_desc, d_icon = get_desc(d_codes[i])
         try:
-            sunrise = datetime.fromisoformat(daily["sunrise"][0]).strftime("%I:%M %p")
-            sunset = datetime.fromisoformat(daily["sunset"][0]).strftime("%I:%M %p")
+            date_obj = datetime.strptime(d_times[i], "%Y-%m-%d")
+            d_name = date_obj.strftime("%A")
+            d_full = date_obj.strftime("%d %b")
         except:
-            sunrise = "06:00 AM"
-            sunset = "06:00 PM"
-
-        # Construct Data Object
-        weather_data = {
-            "current": {
-                "temp": safe_round(curr.get("temperature_2m")),
-                "feels_like": safe_round(curr.get("apparent_temperature")),
-                "humidity": curr.get("relative_humidity_2m", 0),
-                "wind_speed": curr.get("wind_speed_10m", 0),
-                "pressure": curr.get("surface_pressure", 1000),
-                "uv": daily.get("uv_index_max", [0])[0], 
-                "sunrise": sunrise,
-                "sunset": sunset,
-                "condition": desc,
-                "icon": icon,
-                "is_day": curr.get("is_day", 1)
-            },
-            "daily": [],
-            "hourly": []
-        }
-        
-        # Process Daily (Next 5 days)
-        d_codes = daily.get("weather_code", [])
-        d_times = daily.get("time", [])
-        d_max = daily.get("temperature_2m_max", [])
-        d_min = daily.get("temperature_2m_min", [])
+            d_name = "Day"
+            d_full = "--"
+
+        weather_data["daily"].append({
+            "date": d_times[i],
+            "day_name": d_name,
+            "full_date": d_full,
+            "max_temp": safe_round(d_max[i]),
+            "min_temp": safe_round(d_min[i]),
+            "condition": d_desc,
+            "icon": d_icon
+        })
         
-        # Check lengths to be safe
-        max_daily_idx = min(len(d_times), len(d_codes), len(d_max), len(d_min), 6)
+    # Process Hourly
+    current_hour_index = datetime.now().hour
+    if current_hour_index < 0: current_hour_index = 0
+    
+    # safely get array lengths
+    h_times = hourly.get("time", [])
+    h_codes = hourly.get("weather_code", [])
+    h_temps = hourly.get("temperature_2m", [])
+    h_winds = hourly.get("wind_speed_10m", [])
+    
+    limit_hourly = min(len(h_times), len(h_codes), len(h_temps), len(h_winds))
+
+    for i in range(0, 5): 
+        idx = current_hour_index + (i * 3)
+        if idx >= limit_hourly: break
         
-        for i in range(1, max_daily_idx): # Start from 1 (tomorrow) up to available
-            d_desc, d_icon = get_desc(d_codes[i])
-            try:
-                date_obj = datetime.strptime(d_times[i], "%Y-%m-%d")
-                d_name = date_obj.strftime("%A")
-                d_full = date_obj.strftime("%d %b")
-            except:
-                d_name = "Day"
-                d_full = "--"
-
-            weather_data["daily"].append({
-                "date": d_times[i],
-                "day_name": d_name,
-                "full_date": d_full,
-                "max_temp": safe_round(d_max[i]),
-                "min_temp": safe_round(d_min[i]),
-                "condition": d_desc,
-                "icon": d_icon
-            })
-            
-        # Process Hourly
-        current_hour_index = datetime.now().hour
-        if current_hour_index < 0: current_hour_index = 0
+        try:
+            h_time_str = h_times[idx]
+            h_obj = datetime.fromisoformat(h_time_str)
+            h_time_fmt = h_obj.strftime("%H:%M")
+        except:
+            h_time_fmt = "--:--"
+
+        h_desc, h_icon = get_desc(h_codes[idx])
         
-        # safely get array lengths
-        h_times = hourly.get("time", [])
-        h_codes = hourly.get("weather_code", [])
-        h_temps = hourly.get("temperature_2m", [])
-        h_winds = hourly.get("wind_speed_10m", [])
+        weather_data["hourly"].append({
+            "time": h_time_fmt,
+            "temp": safe_round(h_temps[idx]),
+            "icon": h_icon,
+            "wind": h_winds[idx]
+        })
         
-        limit_hourly = min(len(h_times), len(h_codes), len(h_temps), len(h_winds))
+    return weather_data
 
-        for i in range(0, 5): 
-            idx = current_hour_index + (i * 3)
-            if idx >= limit_hourly: break
-            
-            try:
-                h_time_str = h_times[idx]
-                h_obj = datetime.fromisoformat(h_time_str)
-                h_time_fmt = h_obj.strftime("%H:%M")
-            except:
-                h_time_fmt = "--:--"
-
-            h_desc, h_icon = get_desc(h_codes[idx])
-            
-            weather_data["hourly"].append({
-                "time": h_time_fmt,
-                "temp": safe_round(h_temps[idx]),
-                "icon": h_icon,
-                "wind": h_winds[idx]
-            })
-            
-        return weather_data
+def _fetch_forecast(lat, lon):
+    try:
+        res = requests.get(FORECAST_URL, params=_forecast_params(lat, lon), timeout=WEATHER_TIMEOUT_S).json()
+        return parse_forecast(res)
     except Exception as e:
         print(f"Weather Fetch Error: {e}")
         import traceback
         traceback.print_exc()
         return None
 
-# Keep the old function signature for backward compatibility just in case, but redirect
-def get_weather_and_aqi(lat, lon):
-    # This was used in the old code. We can adapt it or just fetch the new data.
+async def _async_fetch_forecast(lat, lon):
+    try:
+        resp = await get_async_http().get(FORECAST_URL, params=_forecast_params(lat, lon))
+        return parse_forecast(resp.json())
+    except Exception as e:
+        print(f"Weather Fetch Error: {e}")
+        return None
+
+def _forecast_key(lat, lon):
+    return (round(float(lat), WEATHER_CACHE_DECIMALS), round(float(lon), WEATHER_CACHE_DECIMALS))
+
+def _cached_forecast(key, allow_stale=False):
+    # Caller holds _FORECAST_LOCK
+    entry = _FORECAST_CACHE.get(key)
+    if entry is None:
+        return None
+    now = time.time()
+    if entry[0] > now:
+        return entry[2]
+    if allow_stale and entry[1] > now:
+        _FORECAST_STATS["stale"] += 1
+        return entry[2]
+    return None
+
+def _store_forecast(key, data):
+    """
+    Caches a fresh forecast, or on failure (data None) falls back to the stale copy.
+    """
+    with _FORECAST_LOCK:
+        if data is None:
+            _FORECAST_STATS["errors"] += 1
+            return _cached_forecast(key, allow_stale=True)
+
+        now = time.time()
+        next_hour = (int(now // 3600) + 1) * 3600
+        _FORECAST_CACHE.pop(key, None)
+        _FORECAST_CACHE[key] = (min(next_hour, now + WEATHER_CACHE_TTL_S), now + WEATHER_STALE_MAX_S, data)
+        while len(_FORECAST_CACHE) > WEATHER_CACHE_SIZE:
+            # dicts keep insertion order: drop the oldest entry
+            del _FORECAST_CACHE[next(iter(_FORECAST_CACHE))]
+        return data
+
+def get_weather_forecast(lat, lon):
+    """
+    Fetch comprehensive weather data: current, daily forecast, and hourly forecast.
+    Served from the forecast cache; concurrent misses share one upstream request.
+    """
+    key = _forecast_key(lat, lon)
+    with _FORECAST_LOCK:
+        data = _cached_forecast(key)
+        if data is not None:
+            _FORECAST_STATS["hits"] += 1
+            return data
+        event = _FORECAST_INFLIGHT.get(key)
+        leader = event is None
+        if leader:
+            event = _FORECAST_INFLIGHT[key] = threading.Event()
+            _FORECAST_STATS["misses"] += 1
+        else:
+            _FORECAST_STATS["coalesced"] += 1
+
+    if not leader:
+        event.wait(WEATHER_TIMEOUT_S + 1)
+        with _FORECAST_LOCK:
+            return _cached_forecast(key, allow_stale=True)
+
+    try:
+        return _store_forecast(key, _fetch_forecast(*key))
+    finally:
+        with _FORECAST_LOCK:
+            _FORECAST_INFLIGHT.pop(key, None)
+        event.set()
+
+async def async_get_weather_forecast(lat, lon):
+    """
+    Async get_weather_forecast (httpx); same cache, parsing and coalescing.
+    """
+    key = _forecast_key(lat, lon)
+    with _FORECAST_LOCK:
+        data = _cached_forecast(key)
+        if data is not None:
+            _FORECAST_STATS["hits"] += 1
+            return data
+        event = _FORECAST_INFLIGHT_ASYNC.get(key)
+        leader = event is None
+        if leader:
+            event = _FORECAST_INFLIGHT_ASYNC[key] = asyncio.Event()
+            _FORECAST_STATS["misses"] += 1
+        else:
+            _FORECAST_STATS["coalesced"] += 1
+
+    if not leader:
+        try:
+            await asyncio.wait_for(event.wait(), WEATHER_TIMEOUT_S + 1)
+        except asyncio.TimeoutError:
+            pass
+        with _FORECAST_LOCK:
+            return _cached_forecast(key, allow_stale=True)
+
+    try:
+        return _store_forecast(key, await _async_fetch_forecast(*key))
+    finally:
+        with _FORECAST_LOCK:
+            _FORECAST_INFLIGHT_ASYNC.pop(key, None)
+        event.set()
+
+def weather_cache_stats():
+    with _FORECAST_LOCK:
+        stats = dict(_FORECAST_STATS)
+        stats["size"] = len(_FORECAST_CACHE)
+    lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    # Share of lookups that did not need their own upstream request
+    stats["upstream_saved_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else 0.0
+    return stats
+
+def _weather_and_aqi(w):
     # The old code expected simple dict.
-    w = get_weather_forecast(lat, lon)
     if w:
         return {
             "temperature": w["current"]["temp"],
@@ -178,3 +381,102 @@ def get_weather_and_aqi(lat, lon):
             "condition": w["current"]["condition"]
         }
     return {}
+
+# Keep the old function signature for backward compatibility just in case, but redirect
+def get_weather_and_aqi(lat, lon):
+    # This was used in the old code. We can adapt it or just fetch the new data.
+    return _weather_and_aqi(get_weather_forecast(lat, lon))
+
+async def async_get_weather_and_aqi(lat, lon):
+    return _weather_and_aqi(await async_get_weather_forecast(lat, lon))
+
+# --- BULK (many locations, e.g. nightly cohort runs) ---
+BULK_FIELDS = ("temperature_2m", "relative_humidity_2m", "surface_pressure", "weather_code")
+
+def _bulk_params(lats, lons):
+    # Only the current block: hourly/daily is what get_weather_and_aqi throws away
+    return {
+        "latitude": ",".join(f"{v:g}" for v in lats),
+        "longitude": ",".join(f"{v:g}" for v in lons),
+        "current": ",".join(BULK_FIELDS),
+        "timezone": "auto"
+    }
+
+def _bulk_current(res, n):
+    """
+    (n, len(BULK_FIELDS)) float array of current values; NaN where missing.
+    One location comes back as an object, several as a list.
+    """
+    if isinstance(res, dict):
+        res = [res]
+    if len(res) != n:
+        raise ValueError(f"expected {n} locations, got {len(res)}")
+    return np.array(
+        [[(r.get("current") or {}).get(f) for f in BULK_FIELDS] for r in res],
+        dtype=float
+    )
+
+def get_weather_bulk(locations, batch_size=None):
+    """
+    Current weather + health advisories for many (lat, lon) pairs.
+    Coordinates are rounded like the forecast cache and deduplicated, then
+    fetched batch_size locations per request. Returns one
+    {"lat", "lon", "weather", "advisories"} per input, in input order;
+    weather is {} and advisories [] where the fetch failed. Inputs that round
+    to the same location share the same weather / advisories objects.
+    """
+    batch_size = batch_size or WEATHER_BULK_BATCH
+    coords = np.asarray(locations, dtype=float).reshape(-1, 2)
+    if len(coords) == 0:
+        return []
+
+    # 1. One request slot per distinct (rounded) location
+    keys, inverse = np.unique(np.round(coords, WEATHER_CACHE_DECIMALS), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    current = np.full((len(keys), len(BULK_FIELDS)), np.nan)
+    fetched = np.zeros(len(keys), dtype=bool)
+
+    # 2. Multi-location requests over one keep-alive session
+    with requests.Session() as session:
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            try:
+                res = session.get(FORECAST_URL, params=_bulk_params(batch[:, 0], batch[:, 1]), timeout=WEATHER_TIMEOUT_S)
+                res.raise_for_status()
+                current[start:start + len(batch)] = _bulk_current(res.json(), len(batch))
+                fetched[start:start + len(batch)] = True
+            except Exception as e:
+                print(f"Weather Bulk Fetch Error: {e}")
+
+    # 3. Column-wise parsing, same defaults as parse_forecast / _weather_and_aqi
+    temp, humidity, pressure, code = current.T
+    codes = np.where(np.isnan(code), 0, code).astype(int)
+    columns = {
+        "temperature": np.rint(np.nan_to_num(temp, nan=0.0)).astype(int),
+        "humidity": np.nan_to_num(humidity, nan=0.0),
+        "aqi": np.full(len(keys), 50),  # Same placeholder as _weather_and_aqi
+        "pressure": np.nan_to_num(pressure, nan=1000.0),
+        "condition": _WMO_CONDITIONS[np.where((codes >= 0) & (codes < 100), codes, 100)]
+    }
+    advisories = weather_health_rules_bulk(columns)
+    weather = [
+        {
+            "temperature": int(columns["temperature"][i]),
+            "humidity": float(columns["humidity"][i]),
+            "aqi": 50,
+            "pressure": float(columns["pressure"][i]),
+            "condition": columns["condition"][i]
+        } if fetched[i] else {}
+        for i in range(len(keys))
+    ]
+
+    # 4. Back to input order
+    return [
+        {
+            "lat": float(lat),
+            "lon": float(lon),
+            "weather": weather[k],
+            "advisories": advisories[k] if fetched[k] else []
+        }
+        for (lat, lon), k in zip(coords, inverse)
+    ]
@@ -22,25 +22,27 @@ def update_profile_wrapper(username, key, value):
     # 2. Update the specific key
     # Handle nested updates (optional, for now flat is fine or simple dicts)
     current_profile[key] = value
+    # Only the fields touched here are written back to the DB
+    changes = {key: value}
     
     # 3. Recalculate BMI if weight or height changed
     if key in ['weight', 'height']:
         weight = current_profile.get('weight', 70)
         height = current_profile.get('height', 170)
-        current_profile['bmi'] = round(weight / ((height/100)**2), 2)
+        current_profile['bmi'] = changes['bmi'] = round(weight / ((height/100)**2), 2)
     
     # 4. AUTO-ANALYSIS: Run holistic checkup to refresh risks and wellness
     try:
-        risks, wellness = run_holistic_checkup(current_profile)
-        current_profile['risks'] = risks
-        current_profile['wellness'] = wellness
+        risks, wellness = run_holistic_checkup(current_profile, parallel=True, username=username)
+        current_profile['risks'] = changes['risks'] = risks
+        current_profile['wellness'] = changes['wellness'] = wellness
     except Exception as e:
         # If analysis fails, continue with profile update but log the issue
         pass
     
-    # 5. Save to DB
+    # 5. Save to DB (partial update of the changed fields)
     try:
-        update_profile(username, current_profile)
+        update_profile(username, changes)
         # 6. Update Session State immediately so UI reflects it
         st.session_state.user_profile = current_profile
         
@@ -1,74 +1,454 @@
 import os
+import json
 import pickle
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import faiss
 import pdfplumber
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-# 1. Paths
-RAG_DIR = "rag"
-DB_DIR = "data/health_rag_db"
+from backend.rag.chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_page
+from backend.rag.doc_store import STORE_FILENAME, DocStoreWriter, MmapDocStore
+from backend.rag.lexical_index import LEXICAL_FILENAME, build_lexical_index
+from backend.rag.index_builder import INDEX_TYPES, DEFAULT_HNSW_M, DEFAULT_TRAIN_SAMPLE, build_index, remove_ids, recall_latency_report, print_report
+
+# 1. Paths (relative to backend/, independent of the working directory)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+RAG_DIR = os.path.join(BACKEND_DIR, "rag")
+DB_DIR = os.path.join(BACKEND_DIR, "data", "health_rag_db")
 INDEX_PATH = os.path.join(DB_DIR, "index.faiss")
-DOCS_PATH = os.path.join(DB_DIR, "index.pkl")
+DOCS_PATH = os.path.join(DB_DIR, "index.pkl")  # legacy pickle, read only for migration
+STORE_PATH = os.path.join(DB_DIR, STORE_FILENAME)
+MANIFEST_PATH = os.path.join(DB_DIR, "manifest.json")
+LEXICAL_PATH = os.path.join(DB_DIR, LEXICAL_FILENAME)
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Bump when the chunking logic changes so existing manifests force a full rebuild
+CHUNKER_VERSION = "sentence-v1"
+# pdfplumber's default (3) merges the words of these PDFs ("Bloodsugarabove400");
+# a tighter tolerance keeps the spaces the chunker and embeddings rely on
+PDF_X_TOLERANCE = 1.5
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_PAGES_PER_TASK = 16
+DEFAULT_ENCODE_BATCH = 256
+
+
+def list_pdfs(rag_dir):
+    print(f"Scanning {rag_dir} for PDFs...")
+    if not os.path.exists(rag_dir):
+        print(f"Error: Directory {rag_dir} not found!")
+        exit(1)
 
-# Ensure output directory exists
-os.makedirs(DB_DIR, exist_ok=True)
+    pdf_files = sorted(f for f in os.listdir(rag_dir) if f.lower().endswith('.pdf'))
 
-# 2. Extract Text from PDF
-print(f"Scanning {RAG_DIR} for PDFs...")
-if not os.path.exists(RAG_DIR):
-    print(f"Error: Directory {RAG_DIR} not found!")
-    exit(1)
+    if not pdf_files:
+        print(f"Error: No PDF files found in {rag_dir}!")
+        exit(1)
 
-pdf_files = [f for f in os.listdir(RAG_DIR) if f.lower().endswith('.pdf')]
+    return pdf_files
 
-if not pdf_files:
-    print(f"Error: No PDF files found in {RAG_DIR}!")
-    exit(1)
 
-text_chunks = []
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-for pdf_file in pdf_files:
-    pdf_path = os.path.join(RAG_DIR, pdf_file)
-    print(f"Reading from {pdf_path}...")
-    
+
+def chunker_id(args):
+    return f"{CHUNKER_VERSION}-{args.chunk_tokens}-{args.chunk_overlap}"
+
+
+def extract_page_range(pdf_path, pdf_file, start, end, chunk_tokens, chunk_overlap):
+    """
+    Process-pool task: chunk records {"text", "source", "page"} of pages
+    [start, end) of one PDF.
+    Returns (chunks, pages_read), or (None, 0) if the range could not be read.
+    """
+    text_chunks = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
+            for i in range(start, min(end, len(pdf.pages))):
+                page = pdf.pages[i]
+                text = page.extract_text(x_tolerance=PDF_X_TOLERANCE)
                 if text:
-                    # Add source filename and page number to context
-                    chunk = f"[Source: {pdf_file} | Page {i+1}] {text}"
-                    
-                    # Split by 500 chars to improve retrieval granularity
-                    # Typically long medical texts
-                    raw_chunks = [chunk[j:j+500] for j in range(0, len(chunk), 500)]
-                    text_chunks.extend(raw_chunks)
+                    # Sentence / token aware chunks, source + page kept as fields
+                    text_chunks.extend(chunk_page(pdf_file, i + 1, text, chunk_tokens, chunk_overlap))
+                # pdfplumber keeps parsed layout objects around otherwise
+                page.flush_cache()
     except Exception as e:
-        print(f"Error reading {pdf_file}: {e}")
+        print(f"Error reading {pdf_file} pages {start + 1}-{end}: {e}")
+        return None, 0
+
+    return text_chunks, end - start
+
+
+def plan_tasks(pdf_files, pages_per_task, chunk_tokens, chunk_overlap):
+    """
+    Splits every PDF into page-range tasks. Files that cannot be opened get a
+    single task that will fail (and be reported) in the worker.
+    """
+    tasks = []
+    for pdf_file in pdf_files:
+        pdf_path = os.path.join(RAG_DIR, pdf_file)
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                n_pages = len(pdf.pages)
+        except Exception as e:
+            print(f"Error reading {pdf_file}: {e}")
+            n_pages = 1
+        for start in range(0, max(n_pages, 1), pages_per_task):
+            tasks.append((pdf_path, pdf_file, start, min(start + pages_per_task, n_pages), chunk_tokens, chunk_overlap))
+    return tasks
+
+
+def iter_file_chunks(tasks, workers, stats):
+    """
+    Runs page-range tasks on a process pool and yields (pdf_file, chunks) per
+    file in order, chunks=None if any range of the file failed.
+    At most 2*workers ranges are in flight, so memory does not grow with the corpus.
+    """
+    def results():
+        if workers <= 1:
+            for task in tasks:
+                yield task, extract_page_range(*task)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for task in tasks:
+                in_flight.append((task, pool.submit(extract_page_range, *task)))
+                if len(in_flight) >= 2 * workers:
+                    task_done, future = in_flight.popleft()
+                    yield task_done, future.result()
+            while in_flight:
+                task_done, future = in_flight.popleft()
+                yield task_done, future.result()
+
+    current_file, current_chunks = None, []
+    for (pdf_path, pdf_file, *_), (chunks, pages) in results():
+        if pdf_file != current_file:
+            if current_file is not None:
+                yield current_file, current_chunks
+            print(f"Reading from {pdf_path}...")
+            current_file, current_chunks = pdf_file, []
+        stats["pages"] += pages
+        if chunks is None or current_chunks is None:
+            current_chunks = None
+        else:
+            current_chunks.extend(chunks)
+    if current_file is not None:
+        yield current_file, current_chunks
+
+
+class IndexSink:
+    """
+    Receives fixed-size batches of (ids, texts), embeds them and adds them to
+    the index. A new IVF/PQ index is trained on the first train_sample vectors
+    before later batches are streamed in; a flat/HNSW index is created from
+    the first batch.
+    """
+
+    def __init__(self, args, index, keep_embeddings=False):
+        self.args = args
+        self.index = index
+        self.model = None
+        self.keep_embeddings = keep_embeddings
+        self.kept = []
+        self._pending_vectors = []
+        self._pending_ids = []
+
+    def _needs_training(self):
+        return any(t in self.args.index_type for t in ("ivf", "pq"))
+
+    def add(self, ids, texts, stats):
+        if self.model is None:
+            print("Loading model...")
+            self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            print("Generating embeddings...")
+
+        start = time.perf_counter()
+        vectors = np.asarray(self.model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+        stats["embed_s"] += time.perf_counter() - start
+        stats["chunks"] += len(texts)
+        if self.keep_embeddings:
+            self.kept.append(vectors)
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+
+        self._pending_vectors.append(vectors)
+        self._pending_ids.append(ids)
+        buffered = sum(len(v) for v in self._pending_vectors)
+        if not self._needs_training() or buffered >= self.args.train_sample:
+            self._build()
+
+    def _build(self):
+        vectors = np.concatenate(self._pending_vectors)
+        ids = np.concatenate(self._pending_ids)
+        self._pending_vectors, self._pending_ids = [], []
+        self.index = build_index(
+            vectors,
+            index_type=self.args.index_type,
+            nlist=self.args.nlist,
+            hnsw_m=self.args.hnsw_m,
+            pq_m=self.args.pq_m,
+            train_sample=self.args.train_sample,
+            ids=ids
+        )
+
+    def finish(self):
+        if self.index is None and self._pending_vectors:
+            self._build()
+        embeddings = np.concatenate(self.kept) if self.kept else None
+        return self.index, embeddings
+
+
+def atomic_write(path, write_fn):
+    """
+    Writes via a temp file in the same directory + os.replace, so readers
+    only ever see the old or the new file.
+    """
+    tmp_path = path + ".tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(obj):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2)
+    return write
+
+
+def load_state(args):
+    """
+    Returns (manifest, index, documents) of the previous build if it can be
+    updated incrementally, else None (full rebuild). documents is the old
+    chunks.store opened through mmap (a list only for a legacy index.pkl).
+    """
+    if args.full or not os.path.exists(MANIFEST_PATH):
+        return None
+    if not os.path.exists(INDEX_PATH):
+        return None
+    if not os.path.exists(STORE_PATH) and not os.path.exists(DOCS_PATH):
+        return None
+
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    settings_changed = (
+        manifest.get("model") != EMBEDDING_MODEL_NAME
+        or manifest.get("chunker") != chunker_id(args)
+        or manifest.get("requested_index_type") != args.index_type
+    )
+    if settings_changed:
+        print("Model / chunker / index type changed since the last build; rebuilding everything.")
+        return None
+
+    index = faiss.read_index(INDEX_PATH)
+    if os.path.exists(STORE_PATH):
+        documents = MmapDocStore(STORE_PATH)
+    else:
+        with open(DOCS_PATH, "rb") as f:
+            documents = pickle.load(f)
+
+    return manifest, index, documents
+
+
+def new_manifest(args):
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "chunker": chunker_id(args),
+        "requested_index_type": args.index_type,
+        "next_id": 0,
+        "files": {}
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS index used by rag_service.")
+    parser.add_argument("--index-type", default=os.getenv("RAG_INDEX_TYPE", "flat"), choices=sorted(INDEX_TYPES),
+                        help="flat (exact), ivf, hnsw, ivfpq or hnswpq; falls back to flat for tiny corpora")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF inverted lists (default ~4*sqrt(N))")
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M, help="HNSW neighbours per node")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (must divide the embedding dim)")
+    parser.add_argument("--train-sample", type=int, default=DEFAULT_TRAIN_SAMPLE, help="max vectors used for training")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed every PDF (also retrains IVF/PQ)")
+    parser.add_argument("--report", action="store_true", help="print recall@k vs latency against the flat index (implies --full)")
+    parser.add_argument("--report-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="PDF extraction processes (1 = in-process)")
+    parser.add_argument("--pages-per-task", type=int, default=DEFAULT_PAGES_PER_TASK, help="pages per extraction task")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="max (estimated) tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS, help="tokens of the previous chunk repeated at the start of the next")
+    parser.add_argument("--encode-batch", type=int, default=DEFAULT_ENCODE_BATCH, help="chunks per embedding batch")
+    args = parser.parse_args()
+    if args.report:
+        args.full = True
+    return args
+
+
+def _close_documents(documents):
+    if isinstance(documents, MmapDocStore):
+        documents.close()
+
+
+def _copy_surviving(documents, writer, stale_ids):
+    """
+    Copies the previous build's chunks into the new store one record at a
+    time (mmap pages, never the whole store in memory); stale ids become
+    deleted slots so every surviving chunk keeps its id.
+    """
+    stale = set(stale_ids)
+    read = documents.record if isinstance(documents, MmapDocStore) else documents.__getitem__
+    for i in range(len(documents)):
+        writer.append(None if i in stale else read(i))
+
+
+def run_build(args, pdf_files, hashes, state):
+    """
+    Applies the difference between the PDFs on disk and `state` (None = empty).
+    Returns (manifest, index, writer, new_embeddings_or_None, dirty), or None
+    if the index type cannot delete vectors and a full rebuild is needed.
+    writer is an open DocStoreWriter with the new chunks.store (None when
+    nothing changed); the caller closes (commits) or aborts it.
+    """
+    if state is None:
+        manifest, index, documents = new_manifest(args), None, None
+    else:
+        manifest, index, documents = state
+
+    known = manifest["files"]
+    deleted = [f for f in known if f not in hashes]
+    changed = [f for f in pdf_files if known.get(f, {}).get("sha256") != hashes[f]]
+    print(f"{len(changed)} new/changed, {len(deleted)} deleted, {len(pdf_files) - len(changed)} unchanged PDFs.")
+
+    dirty = state is None or bool(changed or deleted)
+    if not dirty:
+        _close_documents(documents)
+        return manifest, index, None, None, False
+
+    # 2. Drop vectors of deleted / changed files
+    stale_ids = [cid for f in deleted + changed for cid in known.get(f, {}).get("chunk_ids", [])]
+    if index is not None and stale_ids:
+        if not remove_ids(index, stale_ids):
+            print("This index type cannot delete vectors; rebuilding everything.")
+            _close_documents(documents)
+            return None
+    for f in deleted:
+        del known[f]
+
+    # Chunk texts are streamed to disk; only ids / offsets stay in memory
+    writer = DocStoreWriter(STORE_PATH)
+    try:
+        result = _extend_build(args, hashes, manifest, index, documents, writer, changed, stale_ids)
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        _close_documents(documents)
+    return result
+
+
+def _extend_build(args, hashes, manifest, index, documents, writer, changed, stale_ids):
+    """
+    run_build once the new store is open: copies the surviving chunks, then
+    extracts, embeds and indexes the new / changed PDFs.
+    """
+    known = manifest["files"]
+    if documents is not None:
+        _copy_surviving(documents, writer, stale_ids)
+
+    # 3. Extract new / changed files in parallel, 4. embed in fixed-size batches, 5. index
+    for pdf_file in changed:
+        known.pop(pdf_file, None)
+
+    stats = {"pages": 0, "chunks": 0, "embed_s": 0.0}
+    sink = IndexSink(args, index, keep_embeddings=args.report)
+    batch_ids, batch_texts = [], []
+    started = time.perf_counter()
+
+    # Chunk ids are positions in the store and never reused
+    next_id = max(manifest["next_id"], len(writer))
+    while len(writer) < next_id:
+        writer.append(None)
+
+    tasks = plan_tasks(changed, args.pages_per_task, args.chunk_tokens, args.chunk_overlap)
+    for pdf_file, chunks in iter_file_chunks(tasks, args.workers, stats):
+        if chunks is None:
+            continue  # not recorded in the manifest, retried next run
+
+        ids = [writer.append(chunk) for chunk in chunks]
+        next_id = len(writer)
+        known[pdf_file] = {"sha256": hashes[pdf_file], "chunk_ids": ids}
+
+        batch_ids.extend(ids)
+        batch_texts.extend(chunk["text"] for chunk in chunks)
+        while len(batch_texts) >= args.encode_batch:
+            sink.add(batch_ids[:args.encode_batch], batch_texts[:args.encode_batch], stats)
+            del batch_ids[:args.encode_batch], batch_texts[:args.encode_batch]
+
+    if batch_texts:
+        sink.add(batch_ids, batch_texts, stats)
+    manifest["next_id"] = next_id
+    index, embeddings = sink.finish()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Extracted {stats['chunks']} new text chunks from {stats['pages']} pages in {elapsed:.1f}s "
+          f"({stats['pages'] / elapsed:.1f} pages/sec, {stats['chunks'] / elapsed:.1f} chunks/sec overall, "
+          f"{stats['chunks'] / max(stats['embed_s'], 1e-9):.1f} chunks/sec embedding).")
+
+    return manifest, index, writer, embeddings, True
+
+
+def main():
+    args = parse_args()
+
+    # Ensure output directory exists
+    os.makedirs(DB_DIR, exist_ok=True)
+
+    pdf_files = list_pdfs(RAG_DIR)
+    hashes = {f: file_sha256(os.path.join(RAG_DIR, f)) for f in pdf_files}
+
+    result = run_build(args, pdf_files, hashes, load_state(args))
+    if result is None:
+        result = run_build(args, pdf_files, hashes, None)
+    manifest, index, writer, embeddings, dirty = result
+
+    if index is None or index.ntotal == 0:
+        if writer is not None:
+            writer.abort()
+        print("No text extracted. Exiting.")
+        exit(1)
 
-print(f"Extracted {len(text_chunks)} text chunks.")
+    if not dirty:
+        print("✅ RAG Index is already up to date.")
+        return
 
-if not text_chunks:
-    print("No text extracted. Exiting.")
-    exit(1)
+    if args.report and embeddings is not None:
+        print(f"Recall@{args.report_k} vs latency (queries sampled from the corpus):")
+        print_report(recall_latency_report(embeddings, index, k=args.report_k))
 
-# 3. Embed
-print("Loading model...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-print("Generating embeddings...")
-embeddings = model.encode(text_chunks)
+    # 6. Save (docs first, then index, manifest last: a reader never sees an id without its text)
+    print(f"Saving to {DB_DIR}...")
+    writer.close()
+    # BM25 postings are cheap to recompute, so the lexical index is always rebuilt in full
+    # (chunk texts are read back through mmap, not held in a list)
+    store = MmapDocStore(STORE_PATH)
+    build_lexical_index(store).save(LEXICAL_PATH)
+    store.close()
+    atomic_write(INDEX_PATH, lambda path: faiss.write_index(index, path))
+    atomic_write(MANIFEST_PATH, _write_json(manifest))
 
-# 4. Index
-print("Building FAISS index...")
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(np.array(embeddings))
+    print(f"✅ RAG Index Updated Successfully! ({index.ntotal} vectors)")
 
-# 5. Save
-print(f"Saving to {DB_DIR}...")
-faiss.write_index(index, INDEX_PATH)
-with open(DOCS_PATH, "wb") as f:
-    pickle.dump(text_chunks, f)
 
-print("✅ RAG Index Rebuilt Successfully!")
+if __name__ == "__main__":
+    main()